@@ -1,77 +1,488 @@
+import time
+import numpy as np
 from PyQt5.QtWidgets import *
-from pyqtgraph import PlotWidget, plot, mkPen, setConfigOption
+from pyqtgraph import PlotWidget, GraphicsLayoutWidget, AxisItem, plot, mkPen, setConfigOption
 
 from PyQt5 import QtCore as qtc
 from pyqtgraph.functions import mkColor
 
 from .settings import *
+from .settings import framerate as default_framerate
+from .decimation import minmax_decimate
+from .spectrum import SpectrumAnalyzer
+from .stats import registry
 
 
-class GraphPanel(QWidget):
-    
+class RenderScheduler():
+    # One timer driving several panels: runs the hooks (e.g. draining acquisition) every tick,
+    # then renders the panels that are visible and not frozen. While frames take longer than
+    # their budget the interval backs off to twice the (smoothed) frame time.
+
+    max_interval = 1.0 # seconds
+
     def __init__(self, framerate = None):
+        if framerate is None:
+            framerate = default_framerate
+
+        self.frame_budget = 1 / framerate
+        self.frame_time = 0.0
+        self.interval = self.frame_budget
+
+        self.panels = []
+        self.hooks = []
+
+        self._timer = qtc.QTimer()
+        self._timer.setInterval(round(1000 * self.interval))
+        self._timer.timeout.connect(self.tick)
+        self._timer.start()
+
+    def add_panel(self, panel):
+        self.panels.append(panel)
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def tick(self):
+        for hook in self.hooks:
+            hook()
+
+        t0 = time.perf_counter()
+        for panel in self.panels:
+            if (panel.isVisible()):
+                panel.render()
+        elapsed = time.perf_counter() - t0
+
+        registry.observe("frame_time", elapsed)
+        registry.count("frames")
+        if (elapsed > self.frame_budget):
+            registry.count("frames_over_budget")
+
+        self.frame_time = 0.8 * self.frame_time + 0.2 * elapsed
+        if (self.frame_time > self.frame_budget):
+            interval = min(2 * self.frame_time, self.max_interval)
+        else:
+            interval = self.frame_budget
+
+        if (abs(interval - self.interval) > 0.005):
+            self.interval = interval
+            self._timer.setInterval(round(1000 * interval))
+
+    def stop(self):
+        self._timer.stop()
+
+
+# Pens created from equal style dicts are shared by all curves of all panels
+_pens = {}
+
+def shared_pen(style):
+    # style is a pen spec dict (see Variable.colours) or a QPen, which is used as is
+    if (not isinstance(style, dict)):
+        return style
+
+    key = repr(sorted(style.items()))
+    if key not in _pens:
+        _pens[key] = mkPen(style)
+    return _pens[key]
+
+
+def _global_span(item):
+    # Left and right edge of a graphics item's layout geometry in global pixels
+    rect = item.mapRectToScene(item.mapRectFromParent(item.geometry()))
+    widget = item.getViewWidget()
+    if widget is None:
+        return None
+    left = widget.mapToGlobal(widget.mapFromScene(rect.topLeft())).x()
+    right = widget.mapToGlobal(widget.mapFromScene(rect.topRight())).x()
+    return left, right
+
+
+class GraphPanel(QWidget):
+    # Graphs are stacked in a scroll area. The PlotWidget of a graph (and the curves of its signals) is
+    # only created once the graph is first scrolled into view and only the visible graphs are rendered,
+    # so panels with many graphs and signals stay cheap. Time graphs share one time axis below the
+    # scroll area: their x ranges are linked to the first time graph, which keeps being rendered while
+    # it follows the data (x auto range) even when it is scrolled out of view.
+
+    graph_min_height = 150 # px, graphs are stretched to fill the panel while they fit
+
+    def __init__(self, framerate = None, scheduler = None):
         super().__init__()
 
-        self._signalines = []
+        self._signalines = [] # PlotDataItem per signal, None until its graph is created
         self._signaldatas = []
-
-        if framerate is None:
-            framerate = framerate
+        self._signalgraphs = [] # graph index per signal
+        self._signalpens = []
+        self._signalversions = []
+        self._graphsignals = [] # signal indices per graph
+        self._graphnames = []
+        self._graphviews = {}
+        self._spectra = {} # graph index -> (SpectrumAnalyzer, log) for graphs in spectrum mode
+        self._frozen = False
+        self._legend_statistics = None # "window" or "total" while the legend shows statistics
+        self._legend_updated = 0.0
+        self._time_range = None
+        self._newest = None # time of the newest sample in the panel, per render
 
         # Setup this widget/layout
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
         self.layout.setSpacing(0)
+
+        self.scroll_area = QScrollArea()
+        self.scroll_area.setWidgetResizable(True)
+        self.layout.addWidget(self.scroll_area)
+
+        graph_container = QWidget()
+        self._graph_layout = QVBoxLayout()
+        self._graph_layout.setSpacing(0)
+        self._graph_layout.setContentsMargins(0, 0, 0, 0)
+        graph_container.setLayout(self._graph_layout)
+        self.scroll_area.setWidget(graph_container)
+
+        axis_view = GraphicsLayoutWidget()
+        axis_view.setFixedHeight(50)
+        self.time_axis = AxisItem("bottom")
+        self.time_axis.setLabel("Time [s]")
+        axis_view.addItem(self.time_axis)
+        self.layout.addWidget(axis_view)
+        self._axis_view = axis_view
+        self._axis_margins = None
+        self.scroll_area.verticalScrollBar().valueChanged.connect(self._view_changed)
+        self.time_axis.geometryChanged.connect(self._view_changed)
         
-        # Setup automatic update/refresh
-        self._timer = qtc.QTimer()
-        self._timer.setInterval(50)
-        self._timer.timeout.connect(self.update)
-        self._timer.start()
+        # Setup automatic update/refresh, panels of one window normally share a scheduler
+        if scheduler is None:
+            scheduler = RenderScheduler(framerate)
+        self.scheduler = scheduler
+        self.scheduler.add_panel(self)
 
         # # # # # # # # # #
         # Graphs
         # # # # # # # # # #
-        self.graphs = [] # TODO this should be created in the _create_graph() function if self.graphs is None
+        self.graphs = [] # PlotWidget per graph, None until it is first visible (see get_graph)
+        self._slots = [] # Placeholder widget per graph in the scroll area
 
 
     def create_graph(self, name, last_graph = False):
+        # last_graph is no longer needed, the time axis is shared below the graphs
+        slot = QWidget()
+        slot.setMinimumHeight(self.graph_min_height)
+        slot_layout = QVBoxLayout()
+        slot_layout.setContentsMargins(0, 0, 0, 0)
+        slot.setLayout(slot_layout)
+        self._graph_layout.addWidget(slot)
+
+        self._slots.append(slot)
+        self._graphnames.append(name)
+        self._graphsignals.append([])
+        self.graphs.append(None)
+        return len(self.graphs)-1
+
+    def get_graph(self, graph_index):
+        # The PlotWidget of a graph, created on first use
+        if (self.graphs[graph_index] is None):
+            self._create_plot(graph_index)
+        return self.graphs[graph_index]
+
+    def _create_plot(self, graph_index):
         graph = PlotWidget()
-        self.layout.addWidget(graph)
+        self._slots[graph_index].layout().addWidget(graph)
         graph.showGrid(x=True, y=True)
         graph.getAxis("left").setWidth(80)
-        graph.getAxis("left").setLabel(name)
-        graph.getAxis("bottom").setHeight(50)
-        graph.getAxis("bottom").setLabel("Time [s]")
+        graph.getAxis("left").setLabel(self._graphnames[graph_index])
         graph.addLegend()
+        graph.getViewBox().sigXRangeChanged.connect(self._view_changed)
+        self.graphs[graph_index] = graph
+        self._apply_mode(graph_index)
 
-        self.graphs.append(graph)
+        for i in self._graphsignals[graph_index]:
+            self._signalines[i] = graph.plot(name=self._signaldatas[i].get_name(), pen=self._signalpens[i])
+            self._signalversions[i] = None
 
-        if last_graph==True:
-            last_graph = self.graphs[-1] 
-            last_graph.getAxis("bottom").setLabel("Time [s]")
-            return len(self.graphs)-1
-        else:
-            return len(self.graphs)-1
+    def _visible_graphs(self):
+        # Graphs at least partly inside the viewport of the scroll area
+        if (not self.isVisible()):
+            return []
+
+        top = self.scroll_area.verticalScrollBar().value()
+        bottom = top + self.scroll_area.viewport().height()
+        return [index for index in range(len(self._slots)) if self._slots[index].y() < bottom and self._slots[index].y() + self._slots[index].height() > top]
 
     def freeze(self):
-        self._timer.stop()
+        # The scheduler keeps running so its hooks (e.g. draining acquisition) continue
+        self._frozen = True
 
     def unfreeze(self):
-        self._timer.start()
+        self._frozen = False
 
     def update(self):
+        self.render(force = True)
+
+    def render(self, force = False):
+        # A frozen panel only draws the graphs that are scrolled into view for the first time
+        visible = self._visible_graphs()
+        if (self._frozen):
+            visible = [graph_index for graph_index in visible if self.graphs[graph_index] is None]
+
+        for graph_index in visible:
+            if (self.graphs[graph_index] is None):
+                self._create_plot(graph_index)
+
+        self._newest = None
+
+        # Time graphs that follow their data drive the x range of the linked graphs
+        following = []
+        if (not self._frozen):
+            following = [graph_index for graph_index in self._time_graphs() if graph_index not in visible and self.graphs[graph_index].getViewBox().autoRangeEnabled()[0]]
+            visible = visible + following
+
+        # A pan/zoom or resize changes the decimation, so every curve of that graph is redrawn
+        changed_graphs = set()
+        for graph_index in visible:
+            viewbox = self.graphs[graph_index].getViewBox()
+            view = (tuple(viewbox.viewRange()[0]), int(viewbox.width()), viewbox.state["autoRange"][0])
+            if (self._graphviews.get(graph_index) != view):
+                self._graphviews[graph_index] = view
+                changed_graphs.add(graph_index)
+
+        for graph_index in visible:
+            if (graph_index in self._spectra):
+                self._render_spectrum(graph_index, force)
+                continue
+
+            graph = self.graphs[graph_index]
+            for i in self._graphsignals[graph_index]:
+                signaldata = self._signaldatas[i]
+                version = signaldata.get_version() if hasattr(signaldata, "get_version") else None
+                # Change based signals (see compression.Deadband) hold their last value up to the newest sample
+                hold = hasattr(signaldata, "get_metadata") and signaldata.get_metadata().get("interpolation") == "hold"
+                if (hold and version is not None):
+                    version = (version, self._newest_time())
+                if (not force and version is not None and version == self._signalversions[i] and graph_index not in changed_graphs):
+                    continue
+
+                x, y = self._plot_data(signaldata, graph)
+                if (hold):
+                    x, y = self._hold(x, y)
+                self._signalines[i].setData(x, y)
+                self._signalversions[i] = version
+
+        # Hidden graphs are not painted, which is where the auto range is normally updated
+        for graph_index in following:
+            self.graphs[graph_index].getViewBox().updateAutoRange()
+
+        self._update_time_axis()
+
+        if (self._legend_statistics is not None and time.time() - self._legend_updated >= 1.0):
+            self._update_legend()
+
+    def _time_graphs(self):
+        # Created graphs that show time signals
+        return [graph_index for graph_index in range(len(self.graphs)) if self.graphs[graph_index] is not None and graph_index not in self._spectra]
+
+    def _link_time_graphs(self):
+        # The x range of every time graph is linked to the first one, spectra are unlinked
+        time_graphs = self._time_graphs()
+        for graph_index in range(len(self.graphs)):
+            graph = self.graphs[graph_index]
+            if (graph is None):
+                continue
+
+            master = None if (graph_index in self._spectra or graph_index == time_graphs[0]) else self.graphs[time_graphs[0]]
+            linked = graph.getViewBox().linkedView(0)
+            if (linked is not (None if master is None else master.getViewBox())):
+                # A graph that becomes the first time graph follows the data again
+                graph.enableAutoRange(x = master is None)
+                graph.setXLink(master)
+
+    def _view_changed(self, *args):
+        self._update_time_axis()
+
+    def _update_time_axis(self):
+        # The shared axis follows the topmost visible time graph: it is aligned to the graph's view box
+        # and its range is extrapolated from the view box in case the alignment is off
+        time_graphs = [graph_index for graph_index in self._visible_graphs() if graph_index not in self._spectra and self.graphs[graph_index] is not None]
+        if (len(time_graphs) == 0):
+            return
+
+        viewbox = self.graphs[time_graphs[0]].getViewBox()
+        view_span = _global_span(viewbox)
+        axis_span = _global_span(self.time_axis)
+        if (view_span is None or axis_span is None or view_span[1] <= view_span[0]):
+            return
+
+        left = self._axis_view.mapToGlobal(qtc.QPoint(0, 0)).x()
+        margins = (max(view_span[0] - left, 0), max(left + self._axis_view.width() - view_span[1], 0))
+        if (margins != self._axis_margins):
+            self._axis_margins = margins
+            self._axis_view.ci.setContentsMargins(margins[0], 0, margins[1], 0)
+
+        x_min, x_max = viewbox.viewRange()[0]
+        scale = (x_max - x_min) / (view_span[1] - view_span[0])
+        time_range = (x_min + (axis_span[0] - view_span[0]) * scale, x_min + (axis_span[1] - view_span[0]) * scale)
+        if (time_range != self._time_range):
+            self._time_range = time_range
+            self.time_axis.setRange(*time_range)
+
+    def show_statistics(self, enabled = True, key = "window"):
+        # Append mean, std, min and max to the legend entries, "window" for the buffered values or
+        # "total" for all values since the last clear. Refreshed about once per second.
+        self._legend_statistics = key if enabled else None
+        self._update_legend()
+
+    def _update_legend(self):
+        self._legend_updated = time.time()
         for i in range(len(self._signaldatas)):
-            data = self._signaldatas[i].get_data()
-            self._signalines[i].setData(data[0, :], data[1, :])
+            if (self._signalines[i] is None):
+                continue
+            signaldata = self._signaldatas[i]
+            legend = self.graphs[self._signalgraphs[i]].plotItem.legend
+            label = legend.getLabel(self._signalines[i]) if legend is not None else None
+            if (label is None):
+                continue
+
+            text = signaldata.get_name()
+            if (self._legend_statistics is not None and hasattr(signaldata, "get_statistics")):
+                statistics = signaldata.get_statistics()[self._legend_statistics]
+                if (statistics["count"] > 0):
+                    text += "  mean %.4g  std %.4g  min %.4g  max %.4g" % (statistics["mean"], statistics["std"], statistics["min"], statistics["max"])
+            label.setText(text)
+
+    def set_spectrum_mode(self, graph_index, enabled = True, n = 1024, averages = 1, log = True):
+        # Show the amplitude spectrum of the last samples of every signal in the graph instead of the time signal
+        if (enabled):
+            self._spectra[graph_index] = (SpectrumAnalyzer(n = n, averages = averages), log)
+        else:
+            self._spectra.pop(graph_index, None)
+
+        # Force a redraw of the curves in their new mode
+        for i in self._graphsignals[graph_index]:
+            self._signalversions[i] = None
+        if (self.graphs[graph_index] is not None):
+            self._apply_mode(graph_index)
+
+    def _apply_mode(self, graph_index):
+        # Time graphs only show the grid of their x axis, spectra their own frequency axis
+        graph = self.graphs[graph_index]
+        self._link_time_graphs()
+        axis = graph.getAxis("bottom")
+        if (graph_index in self._spectra):
+            axis.setStyle(showValues = True)
+            axis.setLabel("Frequency [Hz]")
+            graph.setLogMode(x = False, y = self._spectra[graph_index][1])
+            graph.enableAutoRange()
+        else:
+            axis.setStyle(showValues = False)
+            axis.showLabel(False)
+            graph.setLogMode(x = False, y = False)
+            if (graph.getViewBox().linkedView(0) is None):
+                graph.enableAutoRange()
+            else:
+                graph.enableAutoRange(y = True) # the x range follows the linked graph
+
+    def _render_spectrum(self, graph_index, force = False):
+        indices = self._graphsignals[graph_index]
+        if (len(indices) == 0):
+            return
+
+        analyzer = self._spectra[graph_index][0]
+        result = analyzer.compute([self._signaldatas[i].get_last(analyzer.length) for i in indices], force = force)
+        if (result is None):
+            return
+
+        freqs, amplitudes = result
+        for k in range(len(indices)):
+            valid = np.isfinite(amplitudes[k])
+            self._signalines[indices[k]].setData(freqs[valid], amplitudes[k][valid])
+
+    def _plot_data(self, signaldata, graph):
+        viewbox = graph.getViewBox()
+        n_pixels = int(viewbox.width())
+        auto_range = viewbox.state["autoRange"][0]
+
+        # Recorded signals keep a min/max pyramid, only the visible buckets are read
+        pyramid = signaldata.get_pyramid() if hasattr(signaldata, "get_pyramid") else None
+        if (plot_decimation and n_pixels > 0 and pyramid is not None and pyramid.count > 0):
+            x_min, x_max = (pyramid.x_first, pyramid.x_last) if auto_range else viewbox.viewRange()[0]
+            return pyramid.decimate(signaldata.get_slice, x_min, x_max, n_pixels)
+
+        if hasattr(signaldata, "get_xy"):
+            x, y = signaldata.get_xy()
+        else:
+            data = signaldata.get_data()
+            x, y = data[0, :], data[1, :]
+        if (not plot_decimation or n_pixels <= 0 or len(x) == 0):
+            return x, y
+
+        # While x is auto ranged the view follows the data, so the data bounds are the window
+        x_min, x_max = (x[0], x[-1]) if auto_range else viewbox.viewRange()[0]
+        return minmax_decimate(x, y, x_min, x_max, n_pixels)
+
+    def _newest_time(self):
+        if (self._newest is None):
+            lasts = [signaldata.get_last(1) for signaldata in self._signaldatas]
+            self._newest = max([last[0, -1] for last in lasts if last.shape[1] > 0], default = -np.inf)
+        return self._newest
+
+    def _hold(self, x, y):
+        # Steps from sample to sample, the last value is held up to the newest sample of the panel
+        if (len(x) == 0):
+            return x, y
+
+        x_out = np.empty(2 * len(x))
+        x_out[0::2] = x
+        x_out[1:-1:2] = x[1:]
+        x_out[-1] = max(x[-1], self._newest_time())
+        return x_out, np.repeat(y, 2)
 
     def add_signal(self, graph_index, signaldata, style=mkPen({"color": "w", "width": 1})):
-        self._signalines.append(self.graphs[graph_index].plot(name=signaldata.get_name(), pen=style))
-        self._signaldatas.append(signaldata)
+        self.add_signals([graph_index], [signaldata], [style])
+
+    def add_signals(self, graph_indices, signaldatas, styles):
+        # Bulk registration, curves are only created for graphs that already have their PlotWidget
+        for graph_index, signaldata, style in zip(graph_indices, signaldatas, styles):
+            pen = shared_pen(style)
+            graph = self.graphs[graph_index]
+
+            self._graphsignals[graph_index].append(len(self._signaldatas))
+            self._signalines.append(None if graph is None else graph.plot(name=signaldata.get_name(), pen=pen))
+            self._signaldatas.append(signaldata)
+            self._signalgraphs.append(graph_index)
+            self._signalpens.append(pen)
+            self._signalversions.append(None)
     
+    def remove_signals(self, signaldatas):
+        # Takes the curves of the given signaldatas out of their graphs
+        removed = [i for i in range(len(self._signaldatas)) if any(self._signaldatas[i] is signaldata for signaldata in signaldatas)]
+        if (len(removed) == 0):
+            return
+
+        for i in removed:
+            if (self._signalines[i] is not None):
+                self.graphs[self._signalgraphs[i]].removeItem(self._signalines[i])
+
+        kept = [i for i in range(len(self._signaldatas)) if i not in removed]
+        new_index = {old: new for new, old in enumerate(kept)}
+        for signals in (self._signalines, self._signaldatas, self._signalgraphs, self._signalpens, self._signalversions):
+            signals[:] = [signals[i] for i in kept]
+        for signals in self._graphsignals:
+            signals[:] = [new_index[i] for i in signals if i in new_index]
+        self._graphviews.clear()
+
     def remove_all_signals(self):
         self._signalines.clear()
         self._signaldatas.clear()
+        self._signalgraphs.clear()
+        self._signalpens.clear()
+        self._signalversions.clear()
+        self._graphviews.clear()
+        for signals in self._graphsignals:
+            signals.clear()
 
         for graph in self.graphs:
-            graph.clear()
+            if (graph is not None):
+                graph.clear()
@@ -4,12 +4,16 @@ from PyQt5.QtWidgets import *
 from pyqtgraph.functions import mkPen
 
 from .settings import *
-from .GraphPanel import GraphPanel
+from .GraphPanel import GraphPanel, RenderScheduler
 
 from .signals import Sampler
+from .recording import DiskSampler, SaveThread, create_record_sampler
+from .fileformats import file_filter
 from .helpers import available_ports
+from .stats import registry
 
 import os
+import numpy as np
 
 class UserButton:
     def __init__(self, checked_str, unchecked_str, qboxLayout_obj, user_cb_pressed, *args):
@@ -55,11 +59,14 @@ class MainView(QWidget):
         # # # # # # # # # #
         # Graph Column
         # # # # # # # # # #
-        live_panel = GraphPanel(framerate = framerate)
+        # Both panels share one render timer, only the visible one is drawn
+        self.render_scheduler = RenderScheduler(framerate = framerate)
+
+        live_panel = GraphPanel(scheduler = self.render_scheduler)
         root_layout.addWidget(live_panel)
         live_panel.hide()
 
-        record_panel = GraphPanel(framerate = framerate)
+        record_panel = GraphPanel(scheduler = self.render_scheduler)
         root_layout.addWidget(record_panel)
         record_panel.hide()
 
@@ -109,8 +116,11 @@ class MainView(QWidget):
         recording_layout = QVBoxLayout()
         recording_group.setLayout(recording_layout)
 
-        control_seq_checkbox = QCheckBox("Enable control sig. seq.")
+        # Start Recording arms the trigger instead when checked (see set_trigger)
+        control_seq_checkbox = QCheckBox("Triggered recording")
         recording_layout.addWidget(control_seq_checkbox)
+        control_seq_checkbox.setDisabled(True)
+        self.trigger = None
         
         record_start_button = QPushButton("Start Recording")
         recording_layout.addWidget(record_start_button)
@@ -122,6 +132,32 @@ class MainView(QWidget):
         record_save_button.clicked.connect(self.save)
         self.previous_filename = None
 
+        # Saving runs on a SaveThread, its progress is polled by the render scheduler
+        save_progress = QProgressBar()
+        recording_layout.addWidget(save_progress)
+        save_progress.setRange(0, 100)
+        save_progress.hide()
+        self.save_progress = save_progress
+        self._save_thread = None
+        self._save_callback = None
+        self.render_scheduler.add_hook(self.poll_save)
+        self.record_start_hooks = []
+        self.record_stop_hooks = []
+
+        # Statistics, refreshed about once per second by the render scheduler
+        stats_group = QGroupBox('Statistics')
+        control_column.addWidget(stats_group)
+
+        stats_layout = QVBoxLayout()
+        stats_group.setLayout(stats_layout)
+
+        stats_label = QLabel()
+        stats_layout.addWidget(stats_label)
+        stats_label.setStyleSheet("font-family: monospace")
+        self.stats_label = stats_label
+        self._stats_updated = 0.0
+        self.render_scheduler.add_hook(self.update_stats)
+
         # # # # # # # # # #
         # Misc
         # # # # # # # # # #
@@ -153,7 +189,14 @@ class MainView(QWidget):
    
 
     def closeEvent(self, event):
+        # Let a running save finish writing its file
+        if (self._save_thread is not None):
+            self._save_thread.join()
+            self.poll_save()
+
         # Close resources
+        if isinstance(self.record_sampler, DiskSampler):
+            self.record_sampler.close()
 
         # Forward event to super class
         super().closeEvent(event)
@@ -172,12 +215,73 @@ class MainView(QWidget):
         
         # Create new Samplers (old is automatically removed by garbage collector)
         self.live_sampler = Sampler(self.live_max_size, continous = True, enabled = True)
-        self.record_sampler = Sampler(record_max_size)
+        self.record_sampler = create_record_sampler()
+        registry.add_sampler("live", self.live_sampler)
+        registry.add_sampler("record", self.record_sampler)
+
+
+    def update_stats(self):
+        now = time.time()
+        if (now - self._stats_updated < 1.0):
+            return
+        self._stats_updated = now
+
+        snapshot = registry.snapshot(consumer = "view")
+        histograms = snapshot["histograms"]
+        counters = snapshot["counters"]
+
+        def ms(name, key):
+            value = histograms.get(name, {}).get(key)
+            return "-" if value is None else "%.1f ms" % (1000 * value)
+
+        lines = [
+            "frame      %s (p95 %s)" % (ms("frame_time", "mean"), ms("frame_time", "p95")),
+            "late       %d / %d frames" % (counters.get("frames_over_budget", 0), counters.get("frames", 0)),
+            "commit     %s (p95 %s)" % (ms("commit_duration", "mean"), ms("commit_duration", "p95")),
+            "latency    %s (p95 %s)" % (ms("commit_latency", "mean"), ms("commit_latency", "p95")),
+        ]
 
+        live = snapshot["buffers"].get("live", {}).values()
+        rate = sum(entry["rate"] for entry in live if entry["rate"] is not None)
+        lines.append("ingest     %.0f samples/s" % rate)
 
-    def register_signal(self, sampler : Sampler, signal_handle, graph_index, name, style = mkPen({"color": "w", "width": 1})):
-        self.live_panel.add_signal(graph_index, sampler.add_signal(signal_handle, name), style)
-        self.record_panel.add_signal(graph_index, self.record_sampler.add_signal(signal_handle, name), style)
+        record = list(snapshot["buffers"].get("record", {}).values())
+        fills = [entry["fill"] for entry in record if entry["fill"] is not None]
+        if (len(fills) > 0):
+            lines.append("record     %.0f %% full" % (100 * max(fills)))
+        lines.append("dropped    %d" % sum(entry["dropped"] for entry in record))
+
+        acquisition = snapshot["sources"].get("acquisition")
+        if (acquisition is not None):
+            lines.append("missed     %d ticks" % acquisition["missed_deadlines"])
+        if ("trigger_events" in counters):
+            lines.append("events     %d" % counters["trigger_events"])
+        if ("export_duration" in histograms):
+            lines.append("export     %.2f s (max)" % histograms["export_duration"]["max"])
+
+        self.stats_label.setText("\n".join(lines))
+
+    def register_signal(self, sampler : Sampler, signal_handle, graph_index, name, style = mkPen({"color": "w", "width": 1}), metadata = None):
+        self.live_panel.add_signal(graph_index, sampler.add_signal(signal_handle, name, metadata), style)
+        self.record_panel.add_signal(graph_index, self.record_sampler.add_signal(signal_handle, name, metadata), style)
+
+    def register_signals(self, signal_handles, graph_indices, names, styles, metadatas = None):
+        # register_signal for many signals, each panel is updated once
+        metadatas = [None] * len(names) if metadatas is None else metadatas
+        live_datas = [self.live_sampler.add_signal(signal_handles[i], names[i], metadatas[i]) for i in range(len(names))]
+        record_datas = [self.record_sampler.add_signal(signal_handles[i], names[i], metadatas[i]) for i in range(len(names))]
+
+        self.live_panel.add_signals(graph_indices, live_datas, styles)
+        self.record_panel.add_signals(graph_indices, record_datas, styles)
+
+    def register_signal_group(self, group_handle, graph_indices, names, styles, metadatas = None, value_dtype = None):
+        # Channels of the group share their timebase in both samplers
+        value_dtype = np.double if value_dtype is None else value_dtype
+        live_channels = self.live_sampler.add_signal_group(group_handle, names, metadatas, value_dtype)
+        record_channels = self.record_sampler.add_signal_group(group_handle, names, metadatas, value_dtype)
+
+        self.live_panel.add_signals(graph_indices, live_channels, styles)
+        self.record_panel.add_signals(graph_indices, record_channels, styles)
 
 
 
@@ -209,16 +313,35 @@ class MainView(QWidget):
             self.live_panel.unfreeze()
             self.record_panel.unfreeze()
 
+    def set_trigger(self, trigger):
+        self.trigger = trigger
+        self.control_seq_checkbox.setDisabled(trigger is None)
+
     def record(self, checked):
+        # Triggered: only the events around the trigger are captured and saved, the record sampler stays off
+        if (checked and self.control_seq_checkbox.isChecked() and self.trigger is not None):
+            self.trigger.arm()
+            self.control_seq_checkbox.setDisabled(True)
+            self.record_start_button.setText("Stop Triggered Recording")
+            return
+        if (not checked and self.trigger is not None and self.trigger.armed):
+            self.trigger.disarm()
+            self.control_seq_checkbox.setDisabled(False)
+            self.record_start_button.setText("Start Recording")
+            return
+
         self.record_save_button.setDisabled(False)
 
         if (checked):
             self.record_sampler.clear() # If true (recording just started, clear any old data)
+            for hook in self.record_start_hooks:
+                hook()
             self.record_start_button.setText("Stop Recording")
-            if (self.control_seq_checkbox.isChecked()):
-                pass   #Do some automated thing here
         else:
             self.record_start_button.setText("Start Recording")
+            # Let producers commit what they sampled so far before the sampler stops
+            for hook in self.record_stop_hooks:
+                hook()
         
         # Set enabled/disabled
         self.record_sampler.set_enabled(checked)
@@ -227,30 +350,64 @@ class MainView(QWidget):
 
         self.additional_save_data = io_file_handle
 
-    def save_noprompt(self, folder, filename):
-        #save via function call
+    def save_noprompt(self, folder, filename, extension = ".csv", callback = None):
+        #save via function call, the file is written in the background (see start_save)
 
         # If this function is called and recording is still running
         # Simulate stop recording by pressing stop record button
         if (self.record_start_button.isChecked()):
             self.record_start_button.click()
-        #sleep some here in order for the previous click to take effect    
-        time.sleep(1)
 
         if not os.path.exists(folder):
             os.makedirs(folder)
 
         #Save file to folder
-        file_out = os.path.join(folder, (filename + ".csv"))
-        
-        self.record_sampler.export_to_csv(file_out)
+        file_out = os.path.join(folder, (filename + extension))
+        self.start_save(file_out, callback)
+
+    def start_save(self, filename, callback = None):
+        # Writes a snapshot of the record sampler on a SaveThread, recording can continue meanwhile.
+        # callback(filename, error) is called from the GUI thread when the file is written.
+        if (self._save_thread is not None):
+            self._save_thread.join() # One save at a time
+            self.poll_save()
+
+        self.save_additional_data(filename)
+
+        self._save_callback = callback
+        self._save_thread = SaveThread(self.record_sampler.snapshot(), filename)
+        self._save_thread.start()
+
+        self.record_save_button.setDisabled(True)
+        self.save_progress.setValue(0)
+        self.save_progress.show()
+
+    def poll_save(self):
+        thread = self._save_thread
+        if (thread is None):
+            return
+
+        self.save_progress.setValue(round(100 * thread.progress))
+        if (not thread.done):
+            return
+
+        self._save_thread = None
+        self.save_progress.hide()
+        self.record_save_button.setDisabled(False)
+        if (thread.error is not None):
+            print("saving %s failed: %s" % (thread.filename, thread.error))
+
+        if (self._save_callback is not None):
+            callback, self._save_callback = self._save_callback, None
+            callback(thread.filename, thread.error)
 
+    def save_additional_data(self, filename):
         #Check if there is additional data to be saved
         if(self.additional_save_data != None):
             # Move to the start of the StringIO object
             self.additional_save_data.seek(0)
             
-            out_file, _ = os.path.splitext(file_out)
+            out_file, _ = os.path.splitext(filename)
             # Open a real file and write the contents of the StringIO object to it
             with open(out_file+'_loaddata.txt', 'w') as file:
                 file.write(self.additional_save_data.getvalue())
@@ -269,25 +426,14 @@ class MainView(QWidget):
         # Prompt save dialog
         filename, _ = QFileDialog.getSaveFileName(self,
                                                   directory = suggested_filename,
-                                                  filter = "CSV (*.csv);;TXT (*.txt);;Any Files (*)",
+                                                  filter = file_filter(),
                                                   caption = "Save Sample"
         )
 
         # filename will be empty if dialog was cancelled
         if (filename):
             self.previous_filename = filename # Save filename for next (will also remember the right directory)
-            self.record_sampler.export_to_csv(filename)
-
-            #Check if there is additional data to be saved
-            if(self.additional_save_data != None):
-                # Move to the start of the StringIO object
-                self.additional_save_data.seek(0)
-                
-                import os
-                out_file, _ = os.path.splitext(filename)
-                # Open a real file and write the contents of the StringIO object to it
-                with open(out_file+'_loaddata.txt', 'w') as file:
-                    file.write(self.additional_save_data.getvalue())
+            self.start_save(filename) # Format is picked from the extension
 
 
 
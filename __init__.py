@@ -1,4 +1,13 @@
 from .monitor import *
-from .MainView import MainView
 from .signals import SignalHandle
-from .settings import *
\ No newline at end of file
+from .settings import *
+
+
+def __getattr__(name):
+    # GUI modules are only imported when they are used
+    if (name == "MainView"):
+        return import_view()
+    if (name == "mkPen"):
+        from pyqtgraph import mkPen
+        return mkPen
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,269 @@
+import asyncio
+import inspect
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from .settings import *
+
+
+class AcquisitionThread(threading.Thread):
+    # Calls read_func(times, values) at a fixed rate on its own thread. Samples are collected
+    # in blocks of block_size ticks and handed over through a deque (append/popleft are atomic),
+    # the consumer (normally the render scheduler's timer) picks them up with drain().
+    def __init__(self, read_func, channel_count_func, rate = sampling_frequency_data, block_size = None):
+        super().__init__(daemon = True)
+
+        self._read_func = read_func
+        self._channel_count_func = channel_count_func
+        self.period = 1 / rate
+
+        if block_size is None:
+            block_size = max(1, int(rate / framerate))
+        self.block_size = block_size
+
+        self._blocks = deque()
+        self._running = False
+        self._flush_requested = False
+        self._flushed = threading.Event()
+        self.error = None
+
+        # Timing statistics, written by the acquisition thread only
+        self.ticks = 0
+        self.missed_deadlines = 0
+        self._jitter_sum = 0.0
+        self._jitter_sqsum = 0.0
+        self._jitter_max = 0.0
+
+    def run(self):
+        self._running = True
+
+        M = self._channel_count_func()
+        block_time = np.empty((M, self.block_size))
+        block_value = np.empty((M, self.block_size))
+        c = 0
+
+        next_tick = time.perf_counter()
+        while self._running:
+            now = time.perf_counter()
+            if (now < next_tick):
+                time.sleep(next_tick - now)
+                now = time.perf_counter()
+
+            lateness = now - next_tick
+            self._update_jitter(lateness)
+
+            # Skip the ticks we are too late for instead of bursting to catch up
+            if (lateness > self.period):
+                skipped = int(lateness / self.period)
+                self.missed_deadlines += skipped
+                next_tick += skipped * self.period
+            next_tick += self.period
+
+            # Channel set changed, hand over what was collected with the old layout
+            if (self._channel_count_func() != M):
+                self._push(block_time, block_value, c)
+                M = self._channel_count_func()
+                block_time = np.empty((M, self.block_size))
+                block_value = np.empty((M, self.block_size))
+                c = 0
+
+            try:
+                self._read_func(block_time[:, c], block_value[:, c])
+            except Exception as e:
+                self.error = e
+                self._running = False
+                break
+
+            c += 1
+            if (c >= self.block_size or self._flush_requested):
+                self._push(block_time, block_value, c)
+                block_time = np.empty((M, self.block_size))
+                block_value = np.empty((M, self.block_size))
+                c = 0
+
+                if (self._flush_requested):
+                    self._flush_requested = False
+                    self._flushed.set()
+
+        self._push(block_time, block_value, c)
+        self._flushed.set()
+
+    def _push(self, block_time, block_value, n):
+        if (n > 0):
+            self._blocks.append((block_time[:, :n], block_value[:, :n]))
+
+    def _update_jitter(self, lateness):
+        self.ticks += 1
+        self._jitter_sum += lateness
+        self._jitter_sqsum += lateness * lateness
+        self._jitter_max = max(self._jitter_max, lateness)
+
+    def drain(self):
+        blocks = []
+        while self._blocks:
+            blocks.append(self._blocks.popleft())
+        return blocks
+
+    def flush(self, timeout = 0.5):
+        # Has the thread hand over its partially filled block after the next tick and waits for it,
+        # so a following drain() returns everything sampled up to now
+        if (not self.is_alive()):
+            return
+        self._flushed.clear()
+        self._flush_requested = True
+        self._flushed.wait(timeout)
+
+    def stop(self, timeout = 1.0):
+        self._running = False
+        if self.is_alive():
+            self.join(timeout)
+
+    def stats(self):
+        n = max(self.ticks, 1)
+        mean = self._jitter_sum / n
+        return {
+            "rate": 1 / self.period,
+            "ticks": self.ticks,
+            "missed_deadlines": self.missed_deadlines,
+            "jitter_mean": mean,
+            "jitter_std": float(np.sqrt(max(self._jitter_sqsum / n - mean * mean, 0.0))),
+            "jitter_max": self._jitter_max,
+            "pending_blocks": len(self._blocks),
+        }
+
+
+class PeriodicThread(threading.Thread):
+    # Calls func every interval seconds until stopped, e.g. to drain acquisition without a GUI timer
+    def __init__(self, func, interval):
+        super().__init__(daemon = True)
+        self._func = func
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self._func()
+
+    def stop(self, timeout = 1.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+class AsyncPoller(threading.Thread):
+    # Polls the getters of several variables concurrently on an asyncio loop running on this thread:
+    # coroutine getters are awaited on the loop, blocking getters run on a thread pool. Every variable is
+    # polled at its own rate (variable.rate or rate) and may take up to its timeout (variable.timeout,
+    # timeout or one period). A poll that times out or raises leaves the last value in place and marks the
+    # variable stale until a poll succeeds again. A blocking getter still running is not called again.
+    def __init__(self, variables, rate = sampling_frequency_data, timeout = None, workers = None):
+        super().__init__(daemon = True)
+
+        self.variables = list(variables)
+        self.rate = rate
+        self.timeout = timeout
+
+        if workers is None:
+            workers = max(1, len(self.variables))
+        self._executor = ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "getter")
+        self._loop = asyncio.new_event_loop()
+        self._tasks = []
+        self._getter_tasks = set() # running coroutine getters
+        self._running = True
+
+        # Per variable statistics, written by the loop only
+        self._counts = [{"polls": 0, "timeouts": 0, "errors": 0, "skipped": 0, "latency_sum": 0.0, "latency_max": 0.0} for _ in self.variables]
+
+    def run(self):
+        try:
+            self._loop.run_until_complete(self._main())
+            self._loop.run_until_complete(self._cancel_getters())
+        finally:
+            self._executor.shutdown(wait = False)
+            self._loop.close()
+
+    async def _main(self):
+        self._tasks = [asyncio.ensure_future(self._poll(self.variables[i], self._counts[i])) for i in range(len(self.variables))]
+        await asyncio.gather(*self._tasks, return_exceptions = True)
+
+    async def _cancel_getters(self):
+        # Coroutine getters that were still running when stopped
+        tasks = list(self._getter_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True)
+
+    def _call(self, var):
+        if (inspect.iscoroutinefunction(var.getter_func)):
+            task = asyncio.ensure_future(var.getter_func())
+            self._getter_tasks.add(task)
+            task.add_done_callback(self._getter_tasks.discard)
+            return task
+        return self._loop.run_in_executor(self._executor, var.getter_func)
+
+    async def _poll(self, var, counts):
+        period = 1 / (var.rate or self.rate)
+        timeout = var.timeout or self.timeout or period
+
+        pending = None
+        next_poll = self._loop.time()
+        while self._running:
+            if (pending is None or pending.done()):
+                t0 = self._loop.time()
+                pending = self._call(var)
+                try:
+                    # Shielded: a timed out call keeps running (a thread cannot be interrupted anyway)
+                    result = await asyncio.wait_for(asyncio.shield(pending), timeout)
+                except asyncio.TimeoutError:
+                    counts["timeouts"] += 1
+                    var.stale = True
+                except Exception as e:
+                    counts["errors"] += 1
+                    var.stale = True
+                    var.error = e
+                else:
+                    if (result is not None):
+                        var.value, var.timestamp = result
+                    var.stale = False
+
+                latency = self._loop.time() - t0
+                counts["polls"] += 1
+                counts["latency_sum"] += latency
+                counts["latency_max"] = max(counts["latency_max"], latency)
+            else:
+                counts["skipped"] += 1
+
+            # Polls that are already overdue are skipped rather than run back to back
+            next_poll += period
+            now = self._loop.time()
+            if (next_poll < now):
+                next_poll = now
+            await asyncio.sleep(next_poll - now)
+
+    def _cancel(self):
+        for task in self._tasks:
+            task.cancel()
+
+    def stop(self, timeout = 1.0):
+        self._running = False
+        if self.is_alive():
+            self._loop.call_soon_threadsafe(self._cancel)
+            self.join(timeout)
+
+    def stats(self):
+        variables = {}
+        for var, counts in zip(self.variables, self._counts):
+            n = max(counts["polls"], 1)
+            variables[var.name] = {
+                "polls": counts["polls"],
+                "timeouts": counts["timeouts"],
+                "errors": counts["errors"],
+                "skipped": counts["skipped"],
+                "latency_mean": counts["latency_sum"] / n,
+                "latency_max": counts["latency_max"],
+                "stale": var.stale,
+            }
+        return {"rate": self.rate, "variables": variables}
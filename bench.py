@@ -0,0 +1,294 @@
+# Benchmarks for the ingest -> buffer -> render -> export pipeline
+#
+#   python -m <package>.bench --output results.json [--quick] [--compare previous.json]
+#
+# Results are written as JSON (one entry per benchmark with value and unit) together with the git
+# commit, so runs of different commits can be compared with --compare.
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+
+from .signals import SignalHandle, SignalGroupHandle, Sampler, RingBuffer
+from .settings import *
+
+
+def best_time(func, repeat = 5, number = 1):
+    # Best of repeat runs, per call
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - t0) / number)
+    return min(times)
+
+
+def peak_memory(func):
+    # Peak traced allocation while func runs (NumPy allocations are traced)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+# # # # # # # # # #
+# Benchmarks
+# # # # # # # # # #
+def bench_commit_fanout(results, quick):
+    # SignalHandle fan-out of a frame-sized block into a live and a record sampler
+    block = int(sampling_frequency_data / framerate)
+    for M in ([10, 60] if quick else [1, 10, 60, 200]):
+        group = SignalGroupHandle()
+        live = Sampler(sampling_frequency_data * live_max_time, continous = True, enabled = True)
+        record = Sampler(10**6, enabled = True)
+        for i in range(M):
+            handle = group.add_channel()
+            live.add_signal(handle, "s%d" % i)
+            record.add_signal(handle, "s%d" % i)
+
+        time_vector = np.arange(block) / sampling_frequency_data
+        values = np.random.rand(M, block)
+        def commit():
+            record.clear()
+            for _ in range(20):
+                group.commit_block(time_vector, values)
+        t = best_time(commit) / 20
+        results["commit_fanout_%dch" % M] = {"value": M * block / t, "unit": "samples/s"}
+
+
+def bench_ringbuffer(results, quick):
+    block = np.random.rand(2, 25)
+    for capacity in [sampling_frequency_data * live_max_time, record_max_size]:
+        ring = RingBuffer(capacity)
+        results["ring_extend_%d" % capacity] = {"value": best_time(lambda: ring.extend(block), number = 1000), "unit": "s"}
+
+        ring.clear()
+        ring.extend(np.random.rand(2, capacity // 2))
+        results["ring_get_data_unwrapped_%d" % capacity] = {"value": best_time(ring.get_data, number = 100), "unit": "s"}
+
+        ring.extend(np.random.rand(2, capacity))
+        ring.extend(block)
+        results["ring_get_data_wrapped_%d" % capacity] = {"value": best_time(ring.get_data, number = 100), "unit": "s"}
+        results["ring_get_last_1024_%d" % capacity] = {"value": best_time(lambda: ring.get_last(1024), number = 1000), "unit": "s"}
+        results["ring_clear_%d" % capacity] = {"value": best_time(ring.clear, number = 1000), "unit": "s"}
+
+
+def bench_render(results, quick):
+    # GraphPanel frame time on the offscreen Qt platform
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets as qtw
+    from .GraphPanel import GraphPanel
+
+    app = qtw.QApplication.instance() or qtw.QApplication(sys.argv)
+    n = sampling_frequency_data * live_max_time
+    for M in ([10] if quick else [10, 60]):
+        panel = GraphPanel()
+        panel.scheduler.stop()
+        panel.resize(1200, 800)
+        panel.show()
+
+        sampler = Sampler(n, continous = True, enabled = True)
+        handles = []
+        for i in range(4):
+            panel.create_graph("graph %d" % i)
+        for i in range(M):
+            handles.append(SignalHandle())
+            panel.add_signal(i % 4, sampler.add_signal(handles[-1], "s%d" % i))
+
+        t = np.arange(n) / sampling_frequency_data
+        for handle in handles:
+            handle.commit_data(np.vstack((t, np.random.rand(n))))
+        app.processEvents()
+
+        results["render_frame_%dch" % M] = {"value": best_time(lambda: panel.render(force = True)), "unit": "s"}
+        panel.close()
+
+
+def bench_panels(results, quick):
+    # Startup (panels, variables, first paint) and frame time of the whole window, 10 channels per panel
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from .monitor import Monitor, Variable
+
+    n = sampling_frequency_data * live_max_time
+    styles = list(Variable.colours.values())
+    for M in ([10, 100] if quick else [10, 100, 500]):
+        t0 = time.perf_counter()
+        monitor = Monitor(1 / sampling_frequency_data)
+        panels = [monitor.create_graph_panel("panel %d" % i) for i in range(max(M // 10, 1))]
+        monitor.add_variables(["v%d" % i for i in range(M)], [styles[i % len(styles)] for i in range(M)], [panels[i // 10] for i in range(M)])
+        monitor.show()
+        monitor.app.processEvents()
+        results["panels_startup_%dch" % M] = {"value": time.perf_counter() - t0, "unit": "s"}
+
+        scheduler = monitor.view.render_scheduler
+        scheduler.stop()
+        t = time.time() - live_max_time + np.arange(n) / sampling_frequency_data
+        monitor.commit_block(t, np.sin(t + np.arange(M)[:, None]) + 0.01 * np.random.rand(M, n))
+
+        # Median of frames that each follow a commit of 25 samples per channel, render and paint
+        times = []
+        for _ in range(20):
+            t = time.time() + np.arange(25) / sampling_frequency_data
+            monitor.commit_block(t, np.sin(t + np.arange(M)[:, None]) + 0.01 * np.random.rand(M, 25))
+            t0 = time.perf_counter()
+            scheduler.tick()
+            monitor.app.processEvents()
+            times.append(time.perf_counter() - t0)
+        results["panels_frame_%dch" % M] = {"value": float(np.median(times)), "unit": "s"}
+        monitor.view.close()
+
+
+def bench_export(results, quick):
+    # Export time and peak memory of a full recording in every registered format
+    from .fileformats import formats
+
+    M = 10 if quick else 40
+    n = record_max_size // (10 if quick else 1)
+    sampler = Sampler(n, enabled = True)
+    group = SignalGroupHandle()
+    for i in range(M):
+        sampler.add_signal(group.add_channel(), "s%d" % i)
+    group.commit_block(np.arange(n) / sampling_frequency_data, np.random.rand(M, n))
+
+    folder = tempfile.mkdtemp()
+    results["export_data_size_%dch" % M] = {"value": 2 * M * n * 8, "unit": "bytes"}
+    for extension in formats:
+        filename = os.path.join(folder, "bench" + extension)
+        # Timed and traced in separate runs, tracing slows down the Python parts of the writers
+        duration = best_time(lambda: sampler.export(filename), repeat = 1)
+        peak = peak_memory(lambda: sampler.export(filename))
+        results["export%s_%dch" % (extension.replace(".", "_"), M)] = {"value": duration, "unit": "s"}
+        results["export%s_peak_memory_%dch" % (extension.replace(".", "_"), M)] = {"value": peak, "unit": "bytes"}
+
+
+def bench_update_plot(results, quick):
+    # Monitor.update_plot cost per tick, headless so only the sampling pipeline is measured
+    from .monitor import Monitor
+
+    for M in ([60] if quick else [10, 60]):
+        monitor = Monitor(1 / sampling_frequency_data, headless = True)
+        panel = monitor.create_graph_panel("bench")
+        for i in range(M):
+            var = monitor.add_variable("v%d" % i, None, panel)
+            var.assign_getter_func(lambda: (1.0, time.time()))
+        monitor.start_recording()
+
+        results["update_plot_tick_%dvars" % M] = {"value": best_time(monitor.update_plot, number = 200), "unit": "s"}
+
+
+def bench_replay(results, quick):
+    # End to end ingest through the replay engine, as fast as possible
+    from .replay import RecordingReplay
+
+    M = 10
+    n = record_max_size // (10 if quick else 1)
+    sampler = Sampler(n, enabled = True)
+    group = SignalGroupHandle()
+    for i in range(M):
+        sampler.add_signal(group.add_channel(), "s%d" % i)
+    group.commit_block(np.arange(n) / sampling_frequency_data, np.random.rand(M, n))
+
+    filename = os.path.join(tempfile.mkdtemp(), "bench.mrec")
+    sampler.export(filename)
+
+    replay = RecordingReplay(filename, speed = None)
+    live = Sampler(sampling_frequency_data * live_max_time, continous = True, enabled = True)
+    for handle in replay.signal_group.channel_handles:
+        live.add_signal(handle, "s")
+    results["replay_ingest_%dch" % M] = {"value": replay.run()["samples_per_s"], "unit": "samples/s"}
+
+
+benchmarks = {
+    "commit": bench_commit_fanout,
+    "ringbuffer": bench_ringbuffer,
+    "render": bench_render,
+    "panels": bench_panels,
+    "export": bench_export,
+    "update_plot": bench_update_plot,
+    "replay": bench_replay,
+}
+
+
+# # # # # # # # # #
+# Running and comparing
+# # # # # # # # # #
+def git_commit():
+    try:
+        folder = os.path.dirname(os.path.abspath(__file__))
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd = folder, stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names = None, quick = False):
+    results = {}
+    for name in (benchmarks if names is None else names):
+        print("running %s" % name, file = sys.stderr)
+        benchmarks[name](results, quick)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now().isoformat(),
+            "quick": quick,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare(old, new):
+    # Ratio new/old per benchmark; for rates (units ending in "/s") higher is better, otherwise lower
+    lines = ["%-40s %14s %14s %8s" % ("benchmark", "old", "new", "ratio")]
+    for key, entry in new["results"].items():
+        if key not in old["results"]:
+            continue
+        a = old["results"][key]["value"]
+        b = entry["value"]
+        ratio = b / a if a else float("nan")
+        better = (ratio > 1) if entry["unit"].endswith("/s") else (ratio < 1)
+        lines.append("%-40s %14.4g %14.4g %7.2fx %s" % (key, a, b, ratio, "" if ratio == 1 else "+" if better else "-"))
+    return "\n".join(lines)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the ingest, buffer, render and export pipeline")
+    parser.add_argument("--output", help = "write results as JSON to this file")
+    parser.add_argument("--compare", help = "previous results JSON to compare against")
+    parser.add_argument("--quick", action = "store_true", help = "smaller sizes for a fast check")
+    parser.add_argument("benchmarks", nargs = "*", help = "subset to run, one of %s (default all)" % ", ".join(benchmarks))
+    args = parser.parse_args(argv)
+
+    for name in args.benchmarks:
+        if (name not in benchmarks):
+            parser.error("unknown benchmark %r" % name)
+
+    report = run(args.benchmarks or None, quick = args.quick)
+
+    if (args.output):
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent = 1)
+    else:
+        json.dump(report, sys.stdout, indent = 1)
+        print()
+
+    if (args.compare):
+        with open(args.compare) as file:
+            print(compare(json.load(file), report))
+
+
+if __name__ == "__main__":
+    main()
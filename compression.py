@@ -0,0 +1,209 @@
+import numpy as np
+
+
+class Compression():
+    # Decides which samples of a channel are logged: apply(t, y) gets every new block of the channel and
+    # returns the (t, y) samples to keep, possibly including a sample held back from an earlier block.
+    # flush returns the newest sample held back, so a recording ends at the last sample received.
+    # Samples of a gap (NaN) are kept where the gap starts and ends.
+    # interpolation is how the kept samples are drawn ("hold" the last value or "linear").
+
+    interpolation = "linear"
+    skip_after = 32
+
+    def __init__(self, max_interval = None):
+        # max_interval (seconds) forces a sample at least that often, so unchanged signals stay visible
+        self.max_interval = max_interval
+        self.reset()
+
+    def reset(self):
+        # The next sample is always kept
+        self._last = None # (t, y) of the last kept sample
+        self._held = None # (t, y) of the newest sample not kept
+
+    def apply(self, t, y):
+        # Samples are decided one by one by _add in chunks of skip_after, when a whole chunk was held the
+        # rest of the run is skipped with numpy (see _skip). Short blocks and busy signals stay on the plain loop.
+        t = np.asarray(t, dtype = np.double)
+        y = np.asarray(y, dtype = np.double)
+        samples = zip(t.tolist(), y.tolist())
+        kept = []
+        if (len(t) <= self.skip_after):
+            for sample in samples:
+                self._add(sample, kept)
+            return self._arrays(kept)
+
+        samples = list(samples)
+        i = 0
+        while True:
+            n_kept = len(kept)
+            for sample in samples[i:i+self.skip_after]:
+                self._add(sample, kept)
+            i += self.skip_after
+            if (i >= len(samples)):
+                return self._arrays(kept)
+            if (len(kept) == n_kept):
+                i = self._skip(t, y, i)
+
+    def flush(self):
+        kept = []
+        if (self._held is not None):
+            self._keep(self._held, kept)
+        return self._arrays(kept)
+
+    def _add(self, sample, kept):
+        raise NotImplementedError
+
+    def _skip(self, t, y, i):
+        # Index of the first sample from i that _add would not simply hold (len(t) if none), the samples
+        # before it are held
+        return i
+
+    def _hold(self, t, y, i, j):
+        # Samples i..j are held, only the newest one is kept track of, returns j
+        if (j > i):
+            self._held = (float(t[j - 1]), float(y[j - 1]))
+        return j
+
+    def _windows(self, i, n):
+        # (a, b) windows from sample i to n that double in size, so finding the next sample to decide
+        # on costs about the samples skipped to get there
+        size = 64
+        while i < n:
+            yield i, min(i + size, n)
+            i += size
+            size *= 2
+
+    def _keep(self, sample, kept):
+        kept.append(sample)
+        self._last = sample
+        self._held = None
+
+    def _changes_gap(self, sample):
+        # A gap starts or ends between the last kept sample and this one
+        return (sample[1] != sample[1]) != (self._last[1] != self._last[1])
+
+    def _overdue(self, sample):
+        return self.max_interval is not None and sample[0] - self._last[0] >= self.max_interval
+
+    def _arrays(self, kept):
+        if (len(kept) == 0):
+            return np.empty(0), np.empty(0)
+        t, y = zip(*kept)
+        return np.array(t), np.array(y)
+
+
+class Deadband(Compression):
+    # Keeps a sample when it differs from the last kept one by more than threshold (change based
+    # logging), the signal is then reconstructed by holding the last kept value
+
+    interpolation = "hold"
+
+    def __init__(self, threshold, max_interval = None):
+        self.threshold = threshold
+        super().__init__(max_interval)
+
+    def _add(self, sample, kept):
+        if (self._last is None or self._changes_gap(sample) or self._overdue(sample) or abs(sample[1] - self._last[1]) > self.threshold):
+            self._keep(sample, kept)
+        else:
+            self._held = sample
+
+    def _skip(self, t, y, i):
+        # The same conditions as _add on whole windows, against the last kept sample
+        last_t, last_y = self._last
+        for a, b in self._windows(i, len(t)):
+            mask = (np.isnan(y[a:b]) != (last_y != last_y)) | (np.abs(y[a:b] - last_y) > self.threshold)
+            if (self.max_interval is not None):
+                mask |= t[a:b] - last_t >= self.max_interval
+            if (mask.any()):
+                return self._hold(t, y, i, a + int(np.argmax(mask)))
+        return self._hold(t, y, i, len(t))
+
+
+class SwingingDoor(Compression):
+    # Swinging door trending: keeps few samples such that linear interpolation between them stays close
+    # to every sample received (within deviation for most, at most twice that). From the last kept sample
+    # two "doors" (pivots at +-deviation) open as samples arrive; when they would close the previous sample
+    # is kept and the doors restart from it. Decisions lag one sample, the newest sample is held back.
+
+    def __init__(self, deviation, max_interval = None):
+        self.deviation = deviation
+        super().__init__(max_interval)
+
+    def reset(self):
+        super().reset()
+        self._upper = -np.inf # steepest slope from the upper pivot so far
+        self._lower = np.inf # flattest slope from the lower pivot so far
+
+    def _keep(self, sample, kept):
+        super()._keep(sample, kept)
+        self._upper = -np.inf
+        self._lower = np.inf
+
+    def _admit(self, sample):
+        # Narrows the doors to cover sample, False if they would close
+        dt = sample[0] - self._last[0]
+        dy = sample[1] - self._last[1]
+        if (dt <= 0):
+            return abs(dy) <= self.deviation
+
+        upper = max(self._upper, (dy - self.deviation) / dt)
+        lower = min(self._lower, (dy + self.deviation) / dt)
+        if (upper > lower):
+            return False
+        self._upper = upper
+        self._lower = lower
+        return True
+
+    def _add(self, sample, kept):
+        if (self._last is None):
+            self._keep(sample, kept)
+            return
+
+        if (self._changes_gap(sample)):
+            # Close the segment before a gap starts, keep the first sample of the gap and the first after it
+            if (self._held is not None and self._held[1] == self._held[1]):
+                self._keep(self._held, kept)
+            self._keep(sample, kept)
+            return
+        if (sample[1] != sample[1]):
+            self._held = sample
+            return
+
+        if (self._overdue(sample) or not self._admit(sample)):
+            if (self._held is None):
+                self._keep(sample, kept)
+                return
+            self._keep(self._held, kept)
+            if (not self._admit(sample)):
+                self._keep(sample, kept)
+                return
+        self._held = sample
+
+    def _skip(self, t, y, i):
+        # Samples admitted one after the other narrow the doors to the running max/min of their slopes,
+        # the first sample that would close them (or start/end a gap, or be overdue) is left to _add
+        last_t, last_y = self._last
+        for a, b in self._windows(i, len(t)):
+            if (last_y != last_y):
+                # In a gap until the first valid sample
+                mask = ~np.isnan(y[a:b])
+            else:
+                dt = t[a:b] - last_t
+                dy = y[a:b] - last_y
+                forward = dt > 0
+                with np.errstate(divide = "ignore", invalid = "ignore"):
+                    upper = np.maximum(np.maximum.accumulate(np.where(forward, (dy - self.deviation) / dt, -np.inf)), self._upper)
+                    lower = np.minimum(np.minimum.accumulate(np.where(forward, (dy + self.deviation) / dt, np.inf)), self._lower)
+                mask = np.isnan(dy) | (upper > lower) | (~forward & (np.abs(dy) > self.deviation))
+                if (self.max_interval is not None):
+                    mask |= dt >= self.max_interval
+
+            j = int(np.argmax(mask)) if mask.any() else b - a
+            if (last_y == last_y and j > 0):
+                self._upper = float(upper[j - 1])
+                self._lower = float(lower[j - 1])
+            if (j < b - a):
+                return self._hold(t, y, i, a + j)
+        return self._hold(t, y, i, len(t))
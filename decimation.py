@@ -0,0 +1,168 @@
+import numpy as np
+
+
+def visible_slice(x, x_min, x_max):
+    # Index range of the samples inside [x_min, x_max] plus one neighbour on each side,
+    # so lines still run to the edges of the view. x must be increasing.
+    i0 = max(np.searchsorted(x, x_min, side = "left") - 1, 0)
+    i1 = min(np.searchsorted(x, x_max, side = "right") + 1, len(x))
+    return i0, i1
+
+
+def minmax_decimate(x, y, x_min, x_max, n_pixels):
+    # Reduce a curve to (at most) a min and a max point per pixel column of [x_min, x_max].
+    # Spikes survive since every column keeps its extremes. x must be increasing.
+    i0, i1 = visible_slice(x, x_min, x_max)
+    x = x[i0:i1]
+    y = y[i0:i1]
+
+    if (len(x) <= 2 * n_pixels or n_pixels < 1 or not x_max > x_min):
+        return x, y
+
+    # First sample of every non-empty pixel column
+    edges = np.linspace(x_min, x_max, n_pixels + 1)[1:-1]
+    starts = np.unique(np.concatenate(([0], np.searchsorted(x, edges, side = "left"))))
+    starts = starts[starts < len(x)]
+
+    y_min = np.fmin.reduceat(y, starts)
+    y_max = np.fmax.reduceat(y, starts)
+
+    x_out = np.repeat(x[starts], 2)
+    y_out = np.empty(2 * len(starts), dtype = y.dtype)
+    y_out[0::2] = y_min
+    y_out[1::2] = y_max
+
+    return x_out, y_out
+
+
+class GrowingArray():
+    # Append-only array with amortised O(1) extend
+
+    def __init__(self, dtype = np.double, capacity = 1024):
+        self._data = np.empty(capacity, dtype = dtype)
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def extend(self, values):
+        n = self._n + len(values)
+        if (n > len(self._data)):
+            data = np.empty(max(n, 2 * len(self._data)), dtype = self._data.dtype)
+            data[:self._n] = self._data[:self._n]
+            self._data = data
+
+        self._data[self._n:n] = values
+        self._n = n
+
+    def get(self):
+        return self._data[:self._n]
+
+
+class MinMaxPyramid():
+    # Level k holds the first time, min and max of every bucket of 2**k raw samples, so a zoomed
+    # out view of a long recording only reads about n_pixels buckets. Commits only count the
+    # appended samples, decimate folds them into the levels in one batch before drawing.
+    # Only valid for data that is appended, never overwritten.
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.levels = [] # levels[k-1] = (time, min, max) of level k
+        self._pending = [] # Unpaired last entry of the level below, per level
+        self._folded = 0 # raw samples already in the levels
+        self.count = 0
+        self.x_first = None
+        self.x_last = None
+
+    def extend(self, t):
+        # len(t) samples with times t were appended to the raw data
+        if (len(t) == 0):
+            return
+
+        if (self.count == 0):
+            self.x_first = t[0]
+        self.count += len(t)
+        self.x_last = t[-1]
+
+    def _fold(self, get_raw):
+        if (self._folded == self.count):
+            return
+
+        raw = get_raw(self._folded, self.count)
+        self._folded += raw.shape[1]
+
+        t_in, lo_in, hi_in = raw[0, :], raw[1, :], raw[1, :]
+        k = 0
+        while len(t_in) > 0:
+            if (k == len(self.levels)):
+                self.levels.append((GrowingArray(), GrowingArray(), GrowingArray()))
+                self._pending.append(None)
+
+            pending = self._pending[k]
+            if (pending is not None):
+                t_in = np.concatenate(([pending[0]], t_in))
+                lo_in = np.concatenate(([pending[1]], lo_in))
+                hi_in = np.concatenate(([pending[2]], hi_in))
+
+            n = len(t_in) // 2
+            self._pending[k] = (t_in[-1], lo_in[-1], hi_in[-1]) if len(t_in) % 2 else None
+            if (n == 0):
+                break
+
+            t_in = t_in[0:2*n:2]
+            lo_in = np.fmin(lo_in[0:2*n:2], lo_in[1:2*n:2])
+            hi_in = np.fmax(hi_in[0:2*n:2], hi_in[1:2*n:2])
+
+            level_t, level_lo, level_hi = self.levels[k]
+            level_t.extend(t_in)
+            level_lo.extend(lo_in)
+            level_hi.extend(hi_in)
+            k += 1
+
+    def select_level(self, x_min, x_max, n_pixels):
+        # Coarsest level that still gives at least one bucket per pixel column
+        if (len(self.levels) == 0 or len(self.levels[0][0]) == 0):
+            return 0
+
+        i0, i1 = visible_slice(self.levels[0][0].get(), x_min, x_max)
+        visible = 2 * (i1 - i0)
+
+        level = 0
+        while (level < len(self.levels) and len(self.levels[level][0]) > 0 and visible / 2**(level + 1) >= n_pixels):
+            level += 1
+        return level
+
+    def decimate(self, get_raw, x_min, x_max, n_pixels):
+        # get_raw(i0, i1) returns the (2, n) raw samples i0..i1, only the visible part not covered by the level is read
+        self._fold(get_raw)
+        level = self.select_level(x_min, x_max, n_pixels)
+        if (level == 0):
+            # The buckets of level 1 locate the visible raw samples
+            i0, i1 = 0, self.count
+            if (len(self.levels) > 0 and len(self.levels[0][0]) > 0):
+                b0, b1 = visible_slice(self.levels[0][0].get(), x_min, x_max)
+                i0 = 2 * b0
+                if (b1 < len(self.levels[0][0])):
+                    i1 = 2 * b1
+            raw = get_raw(i0, i1)
+            return minmax_decimate(raw[0, :], raw[1, :], x_min, x_max, n_pixels)
+
+        level_t, level_lo, level_hi = [array.get() for array in self.levels[level - 1]]
+        i0, i1 = visible_slice(level_t, x_min, x_max)
+
+        x_out = np.repeat(level_t[i0:i1], 2)
+        y_out = np.empty(len(x_out))
+        y_out[0::2] = level_lo[i0:i1]
+        y_out[1::2] = level_hi[i0:i1]
+
+        # The newest samples are not in a complete bucket yet
+        covered = len(level_t) * 2**level
+        if (covered < self.count and i1 == len(level_t)):
+            tail = get_raw(covered, self.count)
+            x_tail, y_tail = minmax_decimate(tail[0, :], tail[1, :], x_min, x_max, n_pixels)
+            x_out = np.concatenate((x_out, x_tail))
+            y_out = np.concatenate((y_out, y_tail))
+
+        return x_out, y_out
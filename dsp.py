@@ -0,0 +1,256 @@
+import importlib.util
+import numpy as np
+
+from .signals import SignalHandle
+
+# scipy is optional, IIRFilter falls back to a plain loop without it
+scipy_available = importlib.util.find_spec("scipy") is not None
+
+
+class SignalStage(SignalHandle):
+    # Derived signal computed block by block from the (2, N) blocks committed to its input handle(s).
+    # State is carried between blocks and reset through the clear_data path. Every block is committed
+    # in a new array, listeners may keep the blocks they receive (like DerivativeSignalHandle).
+
+    def __init__(self, *inputs):
+        super().__init__()
+
+        for i in range(len(inputs)):
+            inputs[i].add_listener(lambda data, i = i: self._input(i, data), self.clear_data)
+
+    def _output(self, n):
+        return np.empty((2, n))
+
+    def _input(self, i, data):
+        if (data.shape[1] > 0):
+            self.process(data)
+
+    def process(self, data):
+        raise NotImplementedError
+
+    def reset(self):
+        pass
+
+    def clear_data(self):
+        self.reset()
+        super().clear_data()
+
+
+class MovingAverage(SignalStage):
+    # Mean of the last window samples (fewer at the start), the previous window-1 inputs are carried
+
+    def __init__(self, signal_handle, window):
+        super().__init__(signal_handle)
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self._history = np.empty(0)
+
+    def process(self, data):
+        n = data.shape[1]
+        values = np.concatenate((self._history, data[1, :]))
+        cumsum = np.concatenate(([0.0], np.cumsum(values)))
+
+        end = np.arange(len(self._history) + 1, len(values) + 1)
+        start = np.maximum(end - self.window, 0)
+
+        out = self._output(n)
+        out[0, :] = data[0, :]
+        out[1, :] = (cumsum[end] - cumsum[start]) / (end - start)
+        self._history = values[-(self.window - 1):] if self.window > 1 else np.empty(0)
+
+        self.commit_data(out)
+
+
+class FIRFilter(SignalStage):
+    # y[k] = sum(taps[j] * x[k-j]), the last len(taps)-1 inputs are carried (zeros initially)
+
+    def __init__(self, signal_handle, taps):
+        super().__init__(signal_handle)
+        self.taps = np.asarray(taps, dtype = np.double)
+        self.reset()
+
+    def reset(self):
+        self._history = np.zeros(len(self.taps) - 1)
+
+    def process(self, data):
+        n = data.shape[1]
+        values = np.concatenate((self._history, data[1, :]))
+
+        out = self._output(n)
+        out[0, :] = data[0, :]
+        out[1, :] = np.convolve(values, self.taps, mode = "valid")
+        self._history = values[len(values) - (len(self.taps) - 1):]
+
+        self.commit_data(out)
+
+
+class IIRFilter(SignalStage):
+    # Direct form II transposed filter (b, a) with carried state, like scipy.signal.lfilter
+
+    def __init__(self, signal_handle, b, a):
+        super().__init__(signal_handle)
+        a = np.asarray(a, dtype = np.double)
+        self.b = np.asarray(b, dtype = np.double) / a[0]
+        self.a = a / a[0]
+
+        # Pad to a common order
+        order = max(len(self.a), len(self.b))
+        self.b = np.concatenate((self.b, np.zeros(order - len(self.b))))
+        self.a = np.concatenate((self.a, np.zeros(order - len(self.a))))
+        self.reset()
+
+    def reset(self):
+        self._state = np.zeros(len(self.a) - 1)
+
+    def process(self, data):
+        n = data.shape[1]
+        out = self._output(n)
+        out[0, :] = data[0, :]
+
+        if (scipy_available):
+            from scipy.signal import lfilter
+            out[1, :], self._state = lfilter(self.b, self.a, data[1, :], zi = self._state)
+        else:
+            out[1, :] = self._filter_loop(data[1, :])
+
+        self.commit_data(out)
+
+    def _filter_loop(self, x):
+        b, a, z = self.b, self.a, self._state
+        y = np.empty(len(x))
+        for k in range(len(x)):
+            y[k] = b[0] * x[k] + (z[0] if len(z) > 0 else 0.0)
+            for j in range(len(z) - 1):
+                z[j] = b[j+1] * x[k] + z[j+1] - a[j+1] * y[k]
+            if (len(z) > 0):
+                z[-1] = b[-1] * x[k] - a[-1] * y[k]
+        return y
+
+    @classmethod
+    def lowpass(cls, signal_handle, cutoff, fs):
+        # First order low pass (exponential smoothing) with -3 dB at cutoff Hz
+        alpha = 1 - np.exp(-2 * np.pi * cutoff / fs)
+        return cls(signal_handle, [alpha], [1, alpha - 1])
+
+
+class Integral(SignalStage):
+    # Running trapezoidal integral over time, starting at zero with the first sample
+
+    def __init__(self, signal_handle):
+        super().__init__(signal_handle)
+        self.reset()
+
+    def reset(self):
+        self._previous = None
+        self._total = 0.0
+
+    def process(self, data):
+        n = data.shape[1]
+        if (self._previous is None):
+            self._previous = (data[0, 0], data[1, 0])
+
+        time = np.concatenate(([self._previous[0]], data[0, :]))
+        values = np.concatenate(([self._previous[1]], data[1, :]))
+
+        out = self._output(n)
+        out[0, :] = data[0, :]
+        out[1, :] = self._total + np.cumsum(np.diff(time) * (values[1:] + values[:-1]) / 2)
+
+        self._total = out[1, -1]
+        self._previous = (data[0, -1], data[1, -1])
+
+        self.commit_data(out)
+
+
+class Decimate(SignalStage):
+    # Every factor samples become one: their mean (average = True) or the last one.
+    # Samples that do not fill a group yet are carried to the next block.
+
+    def __init__(self, signal_handle, factor, average = True):
+        super().__init__(signal_handle)
+        self.factor = factor
+        self.average = average
+        self.reset()
+
+    def reset(self):
+        self._carry = np.empty((2, 0))
+
+    def process(self, data):
+        data = np.concatenate((self._carry, data), axis = 1) if self._carry.shape[1] > 0 else data
+        n = data.shape[1] // self.factor
+        self._carry = data[:, n * self.factor:].copy()
+        if (n == 0):
+            return
+
+        groups = data[:, :n * self.factor].reshape(2, n, self.factor)
+        out = self._output(n)
+        if (self.average):
+            out[:, :] = groups.mean(axis = 2)
+        else:
+            out[:, :] = groups[:, :, -1]
+
+        self.commit_data(out)
+
+
+class Resample(SignalStage):
+    # Linear interpolation onto a uniform time grid (multiples of period), the last input sample is carried
+
+    def __init__(self, signal_handle, period):
+        super().__init__(signal_handle)
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self._previous = None
+        self._next_time = None
+
+    def process(self, data):
+        if (self._previous is not None):
+            time = np.concatenate(([self._previous[0]], data[0, :]))
+            values = np.concatenate(([self._previous[1]], data[1, :]))
+        else:
+            time = data[0, :]
+            values = data[1, :]
+            self._next_time = np.ceil(time[0] / self.period) * self.period
+        self._previous = (data[0, -1], data[1, -1])
+
+        n = int(np.floor((time[-1] - self._next_time) / self.period)) + 1
+        if (n <= 0):
+            return
+
+        out = self._output(n)
+        out[0, :] = self._next_time + self.period * np.arange(n)
+        out[1, :] = np.interp(out[0, :], time, values)
+        self._next_time = out[0, -1] + self.period
+
+        self.commit_data(out)
+
+
+class Expression(SignalStage):
+    # func(*values) evaluated on whole blocks of several inputs, e.g. Expression(np.hypot, x, y).
+    # Inputs are matched sample by sample (they should be committed together, like the channels of a
+    # group or the variables of one Monitor tick), the time of the first input is used.
+
+    def __init__(self, func, *inputs):
+        self.func = func
+        self._pending = [np.empty((2, 0)) for _ in inputs]
+        super().__init__(*inputs)
+
+    def reset(self):
+        self._pending = [np.empty((2, 0)) for _ in self._pending]
+
+    def _input(self, i, data):
+        self._pending[i] = np.concatenate((self._pending[i], data), axis = 1) if self._pending[i].shape[1] > 0 else data.copy()
+
+        n = min([pending.shape[1] for pending in self._pending])
+        if (n == 0):
+            return
+
+        out = self._output(n)
+        out[0, :] = self._pending[0][0, :n]
+        out[1, :] = self.func(*[pending[1, :n] for pending in self._pending])
+        self._pending = [pending[:, n:] for pending in self._pending]
+
+        self.commit_data(out)
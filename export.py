@@ -0,0 +1,109 @@
+import numpy as np
+
+# Rows formatted and written per step, bounds the temporary text/array memory of an export
+export_chunk_size = 65536
+float_fmt = "%.18e"
+
+
+def csv_field(text, delimiter = ","):
+    # Quotes a name like the csv module does when it contains the delimiter, a quote or a line break
+    if any(c in text for c in (delimiter, '"', "\n", "\r")):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def has_shared_timebase(datas):
+    # True if every signal was sampled at exactly the same timestamps
+    if (len(datas) == 0):
+        return False
+
+    time = datas[0][0, :]
+    for data in datas[1:]:
+        if (data.shape[1] != time.shape[0] or not np.array_equal(data[0, :], time)):
+            return False
+    return True
+
+
+def write_aligned_csv(file, names, datas, delimiter = ",", progress = None):
+    # One Time column followed by one column per signal, requires a shared timebase
+    file.write(delimiter.join([csv_field(name, delimiter) for name in ["Time"] + names]) + "\n")
+
+    N = datas[0].shape[1] if len(datas) > 0 else 0
+    for c in range(0, N, export_chunk_size):
+        n = min(export_chunk_size, N - c)
+
+        block = np.empty((n, len(datas) + 1))
+        block[:, 0] = datas[0][0, c:c+n]
+        for i in range(len(datas)):
+            block[:, i+1] = datas[i][1, c:c+n]
+
+        np.savetxt(file, block, fmt = float_fmt, delimiter = delimiter)
+        if (progress is not None):
+            progress((c + n) / N)
+
+
+def write_long_csv(file, names, datas, delimiter = ",", progress = None):
+    # One (Time, Signal, Value) row per sample, signals written one after the other
+    file.write(delimiter.join(["Time", "Signal", "Value"]) + "\n")
+
+    total = sum([data.shape[1] for data in datas])
+    done = 0
+
+    for name, data in zip(names, datas):
+        # The name is written as part of the delimiter between the time and value columns
+        name_delimiter = delimiter + csv_field(name, delimiter).replace("%", "%%") + delimiter
+
+        N = data.shape[1]
+        for c in range(0, N, export_chunk_size):
+            np.savetxt(file, data[:, c:c+export_chunk_size].T, fmt = [float_fmt, float_fmt], delimiter = name_delimiter)
+            done += min(export_chunk_size, N - c)
+            if (progress is not None):
+                progress(done / total)
+
+
+def write_columns_csv(file, names, datas, delimiter = ",", progress = None):
+    # A Time and a value column per signal, shorter signals leave their cells empty
+    header = []
+    for name in names:
+        header += ["Time " + name, name]
+    file.write(delimiter.join([csv_field(name, delimiter) for name in header]) + "\n")
+
+    lengths = [data.shape[1] for data in datas]
+    N = max(lengths, default = 0)
+    for c in range(0, N, export_chunk_size):
+        n = min(export_chunk_size, N - c)
+
+        # Rows in which the same signals have samples are formatted as one float block,
+        # the format leaves the cells of the signals that already ended empty
+        bounds = sorted(set([c, c + n] + [length for length in lengths if c < length < c + n]))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            present = [i for i in range(len(datas)) if lengths[i] >= b]
+            block = np.empty((b - a, 2 * len(present)))
+            for k in range(len(present)):
+                block[:, 2*k:2*k+2] = datas[present[k]][:, a:b].T
+
+            fmt = delimiter.join([float_fmt if lengths[i] >= b else "" for i in range(len(datas)) for _ in range(2)])
+            np.savetxt(file, block, fmt = fmt)
+        if (progress is not None):
+            progress((c + n) / N)
+
+
+csv_modes = {
+    "aligned": write_aligned_csv,
+    "long": write_long_csv,
+    "columns": write_columns_csv,
+}
+
+
+def export_csv(filename, names, datas, mode = "auto", delimiter = ",", progress = None):
+    # mode "auto" picks aligned columns when all signals share their timestamps, long format otherwise.
+    # progress(fraction) is called after every written chunk.
+    if (mode == "auto"):
+        mode = "aligned" if has_shared_timebase(datas) else "long"
+    if (mode == "aligned" and len(datas) > 0 and not has_shared_timebase(datas)):
+        raise ValueError("Aligned export requires all signals to share the same timestamps")
+    if (mode not in csv_modes):
+        raise ValueError("Unknown csv export mode: %s" % mode)
+
+    with open(filename, "w", newline = "") as file:
+        csv_modes[mode](file, list(names), datas, delimiter = delimiter, progress = progress)
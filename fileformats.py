@@ -0,0 +1,276 @@
+import os
+import json
+import importlib.util
+from datetime import datetime
+import numpy as np
+
+from .export import export_csv
+
+# h5py is optional and only imported when an .h5 file is written or read
+h5py_available = importlib.util.find_spec("h5py") is not None
+
+# # # # # # # # # #
+# Recording folder (.mrec)
+# # # # # # # # # #
+# A folder with a header.json and one append-only file per signal holding float64
+# (time, value) rows, so each signal can be memory mapped as is.
+header_filename = "header.json"
+file_version = 1
+
+
+class RecordingWriter():
+
+    def __init__(self, folder, names = (), metadatas = None):
+        self.folder = folder
+        self.names = []
+        self.metadatas = []
+        self._files = []
+        self._paths = []
+        self._segments = [] # files started per signal, see restart
+
+        os.makedirs(folder, exist_ok = True)
+        self._created = datetime.now().isoformat()
+
+        self._write_header()
+        for i in range(len(names)):
+            self.add_signal(names[i], None if metadatas is None else metadatas[i])
+
+    def _write_header(self):
+        signals = []
+        for name, metadata, path in zip(self.names, self.metadatas, self._paths):
+            signals.append({"name": name, "file": os.path.basename(path), "metadata": metadata})
+
+        header = {
+            "version": file_version,
+            "created": self._created,
+            "layout": "time_value",
+            "dtype": "<f8",
+            "signals": signals,
+        }
+        with open(os.path.join(self.folder, header_filename), "w") as file:
+            json.dump(header, file, indent = 1)
+
+    def add_signal(self, name, metadata = None):
+        index = len(self.names)
+        path = os.path.join(self.folder, "%03d.bin" % index)
+
+        self.names.append(name)
+        self.metadatas.append({} if metadata is None else dict(metadata))
+        self._paths.append(path)
+        self._segments.append(1)
+        self._files.append(open(path, "wb"))
+        self._write_header()
+
+        return index
+
+    def get_path(self, index):
+        return self._paths[index]
+
+    def append(self, index, data):
+        # data is (2, N), stored as N rows of (time, value)
+        self._files[index].write(np.ascontiguousarray(data.T, dtype = "<f8").tobytes())
+
+    def restart(self, index):
+        # Starts the signal over in a new file, views memory mapped from the previous one stay valid
+        self._files[index].close()
+        previous = self._paths[index]
+
+        path = os.path.join(self.folder, "%03d_%d.bin" % (index, self._segments[index]))
+        self._segments[index] += 1
+        self._paths[index] = path
+        self._files[index] = open(path, "wb")
+        self._write_header()
+
+        try:
+            os.remove(previous)
+        except OSError:
+            pass # Still mapped on Windows, left in the folder
+
+    def flush(self, index = None):
+        files = self._files if index is None else [self._files[index]]
+        for file in files:
+            if (not file.closed):
+                file.flush()
+
+    def close(self):
+        for file in self._files:
+            file.close()
+        self._write_header()
+
+
+def save_mrec(filename, names, datas, metadatas, progress = None, **kwargs):
+    writer = RecordingWriter(filename, names, metadatas)
+    for i in range(len(datas)):
+        writer.append(i, datas[i])
+        if (progress is not None):
+            progress((i + 1) / len(datas))
+    writer.close()
+
+
+def load_mrec(filename):
+    with open(os.path.join(filename, header_filename)) as file:
+        header = json.load(file)
+
+    signals = []
+    for entry in header["signals"]:
+        path = os.path.join(filename, entry["file"])
+        signals.append(RecordedSignal(entry["name"], entry.get("metadata", {}), lambda path = path: _map_signal_file(path)))
+
+    return Recording(filename, signals, {"created": header.get("created")})
+
+
+def _map_signal_file(path):
+    n = os.path.getsize(path) // 16
+    if (n == 0):
+        return np.empty((2, 0))
+    return np.memmap(path, dtype = "<f8", mode = "r", shape = (n, 2)).T
+
+
+# # # # # # # # # #
+# NumPy archive (.npz)
+# # # # # # # # # #
+def save_npz(filename, names, datas, metadatas, **kwargs):
+    header = {"version": file_version, "created": datetime.now().isoformat(), "names": list(names), "metadata": list(metadatas)}
+    arrays = {"data_%03d" % i: np.asarray(datas[i], dtype = np.double) for i in range(len(datas))}
+    np.savez(filename, header = np.array(json.dumps(header)), **arrays)
+
+
+def load_npz(filename):
+    archive = np.load(filename) # Members are only read when accessed
+    header = json.loads(str(archive["header"]))
+
+    signals = []
+    for i in range(len(header["names"])):
+        signals.append(RecordedSignal(header["names"][i], header["metadata"][i], lambda key = "data_%03d" % i: archive[key]))
+
+    return Recording(filename, signals, {"created": header.get("created")}, close_func = archive.close)
+
+
+# # # # # # # # # #
+# HDF5 (.h5), only if h5py is installed
+# # # # # # # # # #
+def save_h5(filename, names, datas, metadatas, progress = None, **kwargs):
+    import h5py
+
+    with h5py.File(filename, "w") as file:
+        file.attrs["version"] = file_version
+        file.attrs["created"] = datetime.now().isoformat()
+        for i in range(len(datas)):
+            dataset = file.create_dataset("signals/%03d" % i, data = np.asarray(datas[i], dtype = np.double), chunks = True)
+            dataset.attrs["name"] = names[i]
+            dataset.attrs["metadata"] = json.dumps(metadatas[i])
+            if (progress is not None):
+                progress((i + 1) / len(datas))
+
+
+def load_h5(filename):
+    import h5py
+
+    file = h5py.File(filename, "r")
+
+    signals = []
+    for key in sorted(file["signals"].keys()):
+        dataset = file["signals"][key]
+        signals.append(RecordedSignal(dataset.attrs["name"], json.loads(dataset.attrs["metadata"]), lambda dataset = dataset: dataset[()]))
+
+    return Recording(filename, signals, {"created": file.attrs.get("created")}, close_func = file.close)
+
+
+# # # # # # # # # #
+# CSV (export only)
+# # # # # # # # # #
+def save_csv(filename, names, datas, metadatas, mode = "auto", progress = None, **kwargs):
+    export_csv(filename, names, datas, mode = mode, progress = progress)
+
+
+# # # # # # # # # #
+# Loaded recordings
+# # # # # # # # # #
+class RecordedSignal():
+    # Signal of a loaded recording, the data is read (or mapped) on first access
+
+    def __init__(self, name, metadata, load_func):
+        self._name = name
+        self._metadata = metadata
+        self._load_func = load_func
+        self._data = None
+
+    def get_data(self):
+        if (self._data is None):
+            self._data = self._load_func()
+        return self._data
+
+    def get_name(self):
+        return self._name
+
+    def get_metadata(self):
+        return self._metadata
+
+
+class Recording():
+
+    def __init__(self, path, signals, metadata = None, close_func = None):
+        self.path = path
+        self.signals = signals
+        self.metadata = {} if metadata is None else metadata
+        self._close_func = close_func
+
+    def get_names(self):
+        return [signal.get_name() for signal in self.signals]
+
+    def __len__(self):
+        return len(self.signals)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.signals[self.get_names().index(key)]
+        return self.signals[key]
+
+    def close(self):
+        if (self._close_func is not None):
+            self._close_func()
+
+
+# # # # # # # # # #
+# Format registry
+# # # # # # # # # #
+# extension -> (description, save function, load function or None)
+formats = {}
+
+
+def register_format(extension, description, save_func, load_func = None):
+    formats[extension.lower()] = (description, save_func, load_func)
+
+
+register_format(".csv", "CSV", save_csv)
+register_format(".npz", "NumPy archive", save_npz, load_npz)
+register_format(".mrec", "Memory-mapped recording", save_mrec, load_mrec)
+if (h5py_available):
+    register_format(".h5", "HDF5", save_h5, load_h5)
+
+
+def file_filter():
+    # Filter string for QFileDialog listing every registered format
+    entries = ["%s (*%s)" % (description, extension) for extension, (description, _, _) in formats.items()]
+    return ";;".join(entries + ["TXT (*.txt)", "Any Files (*)"])
+
+
+def save_recording(filename, names, datas, metadatas = None, progress = None, **kwargs):
+    # Writer is picked from the extension, anything unknown is written as CSV.
+    # progress(fraction) is called while writing (as far as the format allows) and with 1.0 when done.
+    if (metadatas is None):
+        metadatas = [{} for _ in names]
+
+    extension = os.path.splitext(filename)[1].lower()
+    _, save_func, _ = formats.get(extension, formats[".csv"])
+    save_func(filename, list(names), datas, list(metadatas), progress = progress, **kwargs)
+    if (progress is not None):
+        progress(1.0)
+
+
+def load_recording(filename):
+    extension = os.path.splitext(filename.rstrip("/\\"))[1].lower()
+    if (extension not in formats or formats[extension][2] is None):
+        raise ValueError("No loader for recording format: %s" % extension)
+
+    return formats[extension][2](filename)
@@ -1,14 +1,28 @@
-from PyQt5 import QtWidgets as qtw
 import sys
+import os
 import time
+import threading
+import inspect
 import numpy as np
-from pyqtgraph.functions import mkPen
 
-from .MainView import MainView
-from .signals import SignalHandle
+# Qt (PyQt5/pyqtgraph) is only imported when a Monitor with a view is created
+from .signals import SignalHandle, SignalGroupHandle, Sampler
+from .recording import create_record_sampler
+from .acquisition import AcquisitionThread, PeriodicThread, AsyncPoller
+from .stats import registry
+from .trigger import TriggerRecorder
+from .streaming import StreamServer
 from .settings import *
 
 
+def import_view():
+    # MainView (and with it PyQt5/pyqtgraph) is imported on first use. Importing the submodule binds
+    # the package attribute to the module, rebind it to the class like the eager import used to.
+    from .MainView import MainView
+    setattr(sys.modules[__package__], "MainView", MainView)
+    return MainView
+
+
 class Panel():  
     def __init__(self, name, live_index, rec_index):
         self.live_index = live_index
@@ -19,50 +33,141 @@ class Variable():
 
     width_default = 1
 
+    # Pen specs as plain dicts, pyqtgraph accepts them wherever it takes a pen (no Qt import needed)
     colours = {
-        "white": mkPen({"color": "w", "width": width_default}),
-        "cyan": mkPen({"color": (20,174,242), "width": width_default}),
-        "cyan_dotted": mkPen({"color": (20,174,242), "width": 5, "style": 3}),
-        "grass": mkPen({"color": (23,187,119), "width": width_default}),
-        "moss": mkPen({"color": (54, 139, 133), "width": width_default}),
-        "pink": mkPen({"color": (245,108,142), "width": width_default}),
-        "pink_thick": mkPen({"color": (245,108,142), "width": width_default}),
-        "sun": mkPen({"color": (255, 228, 89), "width": width_default}),
+        "white": {"color": "w", "width": width_default},
+        "cyan": {"color": (20,174,242), "width": width_default},
+        "cyan_dotted": {"color": (20,174,242), "width": 5, "style": 3},
+        "grass": {"color": (23,187,119), "width": width_default},
+        "moss": {"color": (54, 139, 133), "width": width_default},
+        "pink": {"color": (245,108,142), "width": width_default},
+        "pink_thick": {"color": (245,108,142), "width": width_default},
+        "sun": {"color": (255, 228, 89), "width": width_default},
     }
 
-    def __init__(self,signal_handle, name, graph_panel : Panel, style):
+    def __init__(self,signal_handle, name, graph_panel : Panel, style, unit = ""):
 
         self.signal_handle : SignalHandle = signal_handle
         self.name = name
+        self.unit = unit
         self.graph_panel = graph_panel
         self.value = 0
         self.timestamp = time.time()
         self.style = style
+        self.group = None # SignalGroupHandle when the variable shares its timebase with others
 
         self.getter_func = None
 
-    def assign_getter_func(self, getter_func):
+        # Asynchronous polling (see Monitor.start_polling) and per variable sampling (see Monitor._read_variables)
+        self.rate = None # Hz, None polls at the poller's rate and samples on every tick
+        self.timeout = None # seconds, None allows one period
+        self.polled = False
+        self.stale = False # last poll timed out or failed, value is the last good one
+        self.error = None
+
+        self.compression = None # compression.Deadband, SwingingDoor or None to keep every sample
+        self.next_sample = time.time() # time.time() at which a variable with a rate is sampled next
+        self.metadata = {} # shared with the samplers
+        self.sampled_timestamp = None
+
+    def assign_getter_func(self, getter_func, rate = None, timeout = None, compression = None):
+        # getter_func returns (value, timestamp) or None to keep the last value. It may be a coroutine
+        # function when the getters are polled with Monitor.start_polling.
+        # An ungrouped variable with a rate is only sampled at that rate (and only when the getter has a new
+        # timestamp) instead of on every tick, compression decides which of its samples are kept. Variables
+        # of a group are sampled with their group on every tick.
+        if (compression is not None and self.group is not None):
+            raise ValueError("Compression is not supported for the variables of a group")
+
         self.getter_func = getter_func
+        self.rate = rate
+        self.timeout = timeout
+        self.compression = compression
 
-    def update_value_func(self):
-        if self.getter_func() != None:
-            self.value, self.timestamp = self.getter_func()
-            return self.value, self.timestamp
+        # Tells the panels (and readers of a recording) how the kept samples are drawn
+        if (compression is not None):
+            self.metadata["interpolation"] = compression.interpolation
         else:
+            self.metadata.pop("interpolation", None)
+
+    def is_sparse(self):
+        # Sampled irregularly, committed per variable
+        return self.group is None and (self.rate is not None or self.compression is not None)
+
+    def update_value_func(self):
+        if self.getter_func == None:
             print("No getter_func assigned")
+            return
+
+        result = self.getter_func()
+        if inspect.iscoroutine(result):
+            result.close()
+            raise TypeError("Coroutine getter of %s can only be polled with Monitor.start_polling" % self.name)
+
+        if result != None:
+            self.value, self.timestamp = result
+        return self.value, self.timestamp
+
 
 
+def _variable_options(count, styles, graph_panel, units):
+    # (style, panel, unit) of each of count variables, styles/graph_panel may be lists or single values
+    options = []
+    for i in range(count):
+        style = styles[i] if isinstance(styles, (list, tuple)) else styles
+        panel = graph_panel[i] if isinstance(graph_panel, (list, tuple)) else graph_panel
+        unit = "" if units is None else units[i]
+        options.append((style, panel, unit))
+    return options
+
 
 class Monitor():
-    def __init__(self,Ts_plot):
+    def __init__(self,Ts_plot, headless = False):
 
         self._buffer_size = buffer_size
 
         self.var_dict = {}
 
+        # Ungrouped variables are channels of one group so a tick (or a block of ticks) is committed
+        # at once, with a timestamp per variable. Variable groups share the timestamps of their first variable.
+        self.signal_group = SignalGroupHandle()
+        self._ungrouped_rows = []
+        self._groups = [] # (SignalGroupHandle, rows)
+        self._variables = []
+        self._block_index = 0
+        self._block_time = np.empty((0, self._buffer_size))
+        self._block_value = np.empty((0, self._buffer_size))
+        self.acquisition = None
+        self.poller = None
+        self.trigger = None
+        self.server = None
+        self._sources = []
+        self._draining = False
+        self._drain_thread = None
+        self._commit_lock = threading.Lock()
+
         self.time_start = time.time()
 
-        self.app = qtw.QApplication(sys.argv)
+        if (stats_file is not None):
+            registry.start_dump(stats_file, stats_interval)
+
+        # Headless: same signal/sampler pipeline, no Qt at all
+        self.headless = headless
+        self.additional_save_data = None
+        self.recording = False
+        if (headless):
+            self.app = None
+            self.view = None
+            self.live_sampler = Sampler((1 / Ts_plot) * live_max_time, continous = True, enabled = True)
+            self.record_sampler = create_record_sampler()
+            registry.add_sampler("live", self.live_sampler)
+            registry.add_sampler("record", self.record_sampler)
+            return
+
+        from PyQt5 import QtWidgets as qtw
+        MainView = import_view()
+
+        self.app = qtw.QApplication.instance() or qtw.QApplication(sys.argv)
         self.screen = self.app.primaryScreen()
         self.size = self.screen.size()
         self.width = self.size.width()
@@ -72,35 +177,94 @@ class Monitor():
         self.app_height = self.height - 200
         self.pos_x = self.width - self.app_width
         self.view.setGeometry(self.pos_x, 100, self.app_width, self.app_height)
+        self.view.record_start_hooks.append(self._reset_sampling)
+        self.view.record_stop_hooks.append(self._commit_all)
 
         #self.add_button_with_cb("start", "stop", monitor_button_cb, None)
 
     def add_button_with_cb(self, checked_str, unchecked_str, cb, *args):
+        if (self.headless):
+            print("no buttons in headless mode!")
+            return
         self.view.add_user_button(checked_str, unchecked_str, cb, *args)
 
     def add_user_save_file_on_save(self, io_file_handle):
+        if (self.headless):
+            self.additional_save_data = io_file_handle
+            return
         self.view.pass_additional_save_data_handle(io_file_handle)
 
     def start_recording(self):
+        if (self.headless):
+            if (self.recording):
+                print("recording already started!")
+                return
+            with self._commit_lock:
+                self.record_sampler.clear()
+                self._reset_sampling()
+                self.record_sampler.set_enabled(True)
+            self.recording = True
+            return
+
         if(self.view.record_start_button.isChecked()):
             print("recording already started!")
         else:
             self.view.record_start_button.click()
 
     def stop_recording(self):
+        if (self.headless):
+            if (not self.recording):
+                print("recording already stopped!")
+                return
+            self._commit_all()
+            with self._commit_lock:
+                self.record_sampler.set_enabled(False)
+            self.recording = False
+            return
+
         if(self.view.record_start_button.isChecked()):
             self.view.record_start_button.click()
         else:
             print("recording already started!")
+
+    def save(self, folder, filename, extension = ".csv", callback = None):
+        # With a view the file is written in the background, callback(filename, error) is called when done.
+        # Headless the file is written before returning.
+        if (not self.headless):
+            self.view.save_noprompt(folder, filename, extension, callback)
+            return
+
+        if (self.recording):
+            self.stop_recording()
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        file_out = os.path.join(folder, (filename + extension))
+        with self._commit_lock:
+            self.record_sampler.export(file_out)
+
+        if (self.additional_save_data is not None):
+            self.additional_save_data.seek(0)
+            with open(os.path.splitext(file_out)[0] + '_loaddata.txt', 'w') as file:
+                file.write(self.additional_save_data.getvalue())
+
+        if (callback is not None):
+            callback(file_out, None)
             
 
     def show(self):
         # self.view.live_sampler.clear() # If true (recording just started, clear any old data)
         # self.view.live_sampler.set_enabled(True)
+        if (self.headless):
+            return
         self.view.show()
         
 
     def create_graph_panel(self, name):
+        if (self.headless):
+            return Panel(name, None, None)
+
         index_live = self.view.live_panel.create_graph(name)
         index_record = self.view.record_panel.create_graph(name)
 
@@ -108,33 +272,476 @@ class Monitor():
         return panel
 
 
-    def add_variable(self, name, style, graph_panel: Panel) -> Variable:
+    def add_variable(self, name, style, graph_panel: Panel, unit = "") -> Variable:
 
         signal_handle = SignalHandle()
 
-        var = Variable(signal_handle, name, graph_panel, style)
+        var = Variable(signal_handle, name, graph_panel, style, unit = unit)
 
-        self.view.register_signal(self.view.live_sampler, var.signal_handle, var.graph_panel.live_index, var.name, var.style)
+        metadata = {"unit": var.unit, "panel": var.graph_panel.name}
+        var.metadata = metadata
+        if (self.headless):
+            self.live_sampler.add_signal(var.signal_handle, var.name, metadata)
+            self.record_sampler.add_signal(var.signal_handle, var.name, metadata)
+        else:
+            self.view.register_signal(self.view.live_sampler, var.signal_handle, var.graph_panel.live_index, var.name, var.style, metadata = metadata)
 
         self.var_dict[var.name] = var 
         #self.var_dict[name] = var
+
+        self.signal_group.add_channel(var.signal_handle)
+        self._ungrouped_rows.append(self._add_row(var))
+
         return var
 
-    def update_plot(self):
-        for key, var in self.var_dict.items():
-            if var.getter_func != None:
+    def add_variables(self, names, styles, graph_panel, units = None) -> list:
+        # add_variable for many variables at once (e.g. hundreds of channels), the panels and samplers
+        # are updated in one pass. styles/graph_panel may be lists or single values.
+        variables = []
+        for name, (style, panel, unit) in zip(names, _variable_options(len(names), styles, graph_panel, units)):
+            variables.append(Variable(SignalHandle(), name, panel, style, unit = unit))
+
+        metadatas = [{"unit": var.unit, "panel": var.graph_panel.name} for var in variables]
+        for var, metadata in zip(variables, metadatas):
+            var.metadata = metadata
+        if (self.headless):
+            for var, metadata in zip(variables, metadatas):
+                self.live_sampler.add_signal(var.signal_handle, var.name, metadata)
+                self.record_sampler.add_signal(var.signal_handle, var.name, metadata)
+        else:
+            self.view.register_signals([var.signal_handle for var in variables], [var.graph_panel.live_index for var in variables], list(names), [var.style for var in variables], metadatas = metadatas)
+
+        self.flush()
+        for var in variables:
+            self.var_dict[var.name] = var
+            self.signal_group.add_channel(var.signal_handle)
+            self._variables.append(var)
+            self._ungrouped_rows.append(len(self._variables) - 1)
+        self._block_time = np.empty((len(self._variables), self._buffer_size))
+        self._block_value = np.empty((len(self._variables), self._buffer_size))
+
+        return variables
+
+    def add_derived_variable(self, signal_handle, name, style, graph_panel: Panel, unit = "") -> Variable:
+        # Plot a derived signal (e.g. a dsp stage or DerivativeSignalHandle), it is not polled by update_plot
+        var = Variable(signal_handle, name, graph_panel, style, unit = unit)
+
+        metadata = {"unit": var.unit, "panel": var.graph_panel.name, "derived": True}
+        if (self.headless):
+            self.live_sampler.add_signal(var.signal_handle, var.name, metadata)
+            self.record_sampler.add_signal(var.signal_handle, var.name, metadata)
+        else:
+            self.view.register_signal(self.view.live_sampler, var.signal_handle, var.graph_panel.live_index, var.name, var.style, metadata = metadata)
+
+        self.var_dict[var.name] = var
+        return var
+
+    def set_trigger(self, variable, condition, pre = 1.0, post = 1.0, folder = None, extension = ".npz", callback = None):
+        # Capture events around a condition (see trigger.Threshold, Edge, Expression) on a variable, its name
+        # or any SignalHandle (e.g. a dsp stage). With a view the "Triggered recording" checkbox makes
+        # Start Recording arm it, headless call monitor.trigger.arm() / disarm().
+        if (pre + post > live_max_time):
+            raise ValueError("The pre + post trigger window must fit in the live buffer (live_max_time)")
+
+        if isinstance(variable, str):
+            variable = self.var_dict[variable]
+        signal_handle = variable.signal_handle if isinstance(variable, Variable) else variable
+
+        live_sampler = self.live_sampler if self.headless else self.view.live_sampler
+        self.trigger = TriggerRecorder(signal_handle, condition, live_sampler, pre = pre, post = post, folder = folder, extension = extension, callback = callback)
+        if (not self.headless):
+            self.view.set_trigger(self.trigger)
+
+        return self.trigger
+
+    def add_variable_group(self, names, styles, graph_panel, units = None, value_dtype = np.double):
+        # Variables sampled together share one timestamp row and one value matrix in the samplers,
+        # value_dtype = np.float32 halves the value memory. styles/graph_panel may be lists or single values.
+        group_handle = SignalGroupHandle()
+        for _ in names:
+            group_handle.add_channel()
+
+        variables = self._register_group(group_handle, names, styles, graph_panel, units, value_dtype)
+
+        rows = []
+        for var in variables:
+            rows.append(self._add_row(var))
+        self._groups.append((group_handle, rows))
+
+        return variables
+
+    def _register_group(self, group_handle, names, styles, graph_panel, units, value_dtype):
+        variables = []
+        for i, (style, panel, unit) in enumerate(_variable_options(len(names), styles, graph_panel, units)):
+            var = Variable(group_handle.channel_handles[i], names[i], panel, style, unit = unit)
+            var.group = group_handle
+            variables.append(var)
+            self.var_dict[var.name] = var
+
+        metadatas = [{"unit": var.unit, "panel": var.graph_panel.name} for var in variables]
+        if (self.headless):
+            self.live_sampler.add_signal_group(group_handle, list(names), metadatas, value_dtype)
+            self.record_sampler.add_signal_group(group_handle, list(names), metadatas, value_dtype)
+        else:
+            self.view.register_signal_group(group_handle, [var.graph_panel.live_index for var in variables], list(names), [var.style for var in variables], metadatas = metadatas, value_dtype = value_dtype)
+
+        return variables
+
+    def add_source(self, source, styles, graph_panel, units = None, value_dtype = np.double, start = True):
+        # A source (e.g. SerialSource, RecordingReplay) produces blocks for its own signal_group on a
+        # background thread, one variable per source channel is created. The variables are not polled
+        # by update_plot. Sources without a shared timebase are stored per channel.
+        if (hasattr(source, "live_signaldatas")):
+            variables = self._register_shared(source, styles, graph_panel, units)
+        elif (getattr(source, "shared_timebase", True)):
+            variables = self._register_group(source.signal_group, source.channels, styles, graph_panel, units, value_dtype)
+        else:
+            variables = []
+            for i, (style, panel, unit) in enumerate(_variable_options(len(source.channels), styles, graph_panel, units)):
+                variables.append(self.add_derived_variable(source.signal_group.channel_handles[i], source.channels[i], style, panel, unit = unit))
+
+        self._sources.append(source)
+        if (hasattr(source, "stats")):
+            registry.add_source(self._source_name(source), source.stats)
+        self._start_draining()
+        if (start):
+            source.start()
+
+        return variables
+
+    def _register_shared(self, source, styles, graph_panel, units):
+        # Sources in another process (sharedmem.ProcessSource): the live panel reads their shared memory
+        # rings in place, the record sampler is fed through the channel handles by commit_pending
+        source.time_start = self.time_start
+        live_sampler = self.live_sampler if self.headless else self.view.live_sampler
+
+        variables = []
+        for i, (style, panel, unit) in enumerate(_variable_options(len(source.channels), styles, graph_panel, units)):
+            var = Variable(source.signal_group.channel_handles[i], source.channels[i], panel, style, unit = unit)
+
+            metadata = {"unit": var.unit, "panel": panel.name, "process": True}
+            signaldata = source.live_signaldatas[i]
+            live_sampler.signaldatas.append(signaldata)
+            if (self.headless):
+                self.record_sampler.add_signal(var.signal_handle, var.name, metadata)
+            else:
+                self.view.live_panel.add_signal(panel.live_index, signaldata, style)
+                self.view.record_panel.add_signal(panel.record_index, self.view.record_sampler.add_signal(var.signal_handle, var.name, metadata), style)
+
+            self.var_dict[var.name] = var
+            variables.append(var)
+
+        return variables
+
+    def remove_source(self, source):
+        # Shared memory sources are taken out of the live panel, their rings can be closed afterwards
+        source.stop()
+        self.drain_acquisition()
+        self._sources.remove(source)
+        if (hasattr(source, "live_signaldatas")):
+            with self._commit_lock:
+                if (self.headless):
+                    self.live_sampler.remove_signals(source.live_signaldatas)
+                else:
+                    self.view.live_sampler.remove_signals(source.live_signaldatas)
+                    self.view.live_panel.remove_signals(source.live_signaldatas)
+        registry.remove_source(self._source_name(source))
+        self._stop_draining()
+
+    def _source_name(self, source):
+        return "%s@%x" % (type(source).__name__, id(source))
+
+    def _add_row(self, var):
+        # Commit what is staged for the old channel set before growing the block
+        self.flush()
+        self._variables.append(var)
+        self._block_time = np.empty((len(self._variables), self._buffer_size))
+        self._block_value = np.empty((len(self._variables), self._buffer_size))
+
+        return len(self._variables) - 1
+
+    def _read_variables(self, times, values):
+        # Sample the first len(times) variables into the given columns. Ungrouped variables with a rate
+        # are skipped until they are due and when their getter has no new sample, their time is NaN then.
+        now = time.time()
+        for i in range(len(times)):
+            var = self._variables[i]
+            rated = var.rate is not None and var.group is None
+            if (rated):
+                if (now < var.next_sample):
+                    times[i] = np.nan
+                    continue
+                var.next_sample += 1 / var.rate
+                if (var.next_sample <= now):
+                    # Overdue by more than a period (e.g. just added or a stalled getter), no catching up
+                    var.next_sample = now + 1 / var.rate
+
+            if var.getter_func != None and not var.polled:
                 var.update_value_func()
 
-            var.signal_handle.commit_data(np.vstack((var.timestamp - self.time_start, var.value)))
-        
-        
-        # for i in range(N):
-        #     if self.var_list[i].getter_func != None:
-        #         self.var_list[i].update_value_func()
+            if (rated and var.timestamp == var.sampled_timestamp):
+                times[i] = np.nan
+                continue
+            var.sampled_timestamp = var.timestamp
+
+            times[i] = var.timestamp
+            values[i] = var.value
 
-        #     if self.var_list[i].get_timestamp_func != None:
-        #         self.var_list[i].update_timestamp_func()
+    def update_plot(self):
+        # Sample every variable into the staging block, commit once buffer_size ticks are collected
+        c = self._block_index
+        self._read_variables(self._block_time[:, c], self._block_value[:, c])
+
+        self._block_index += 1
+        if (self._block_index >= self._buffer_size):
+            self.flush()
+
+    def flush(self):
+        n = self._block_index
+        if (n == 0):
+            return
+
+        self._block_index = 0
+        self._commit(self._block_time[:, :n], self._block_value[:, :n])
+
+    def _commit(self, times, values):
+        # times/values are (M, N) in variable order, M is smaller if variables were added since sampling
+        M = times.shape[0]
+        if (M == 0):
+            return
+
+        t0 = time.perf_counter()
+        latest = times[:, -1][np.isfinite(times[:, -1])]
+        if (len(latest) > 0):
+            registry.observe_age("commit_latency", latest.max())
+
+        rows = [row for row in self._ungrouped_rows if row < M]
+        regular = [row for row in rows if not self._variables[row].is_sparse()]
+        if (len(regular) > 0):
+            channel_handles = self.signal_group.channel_handles
+            signal_group = self.signal_group if len(regular) == len(channel_handles) else SignalGroupHandle([self._variables[row].signal_handle for row in regular])
+            signal_group.commit_block(times[regular] - self.time_start, values[regular])
+        if (len(regular) < len(rows)):
+            for row in rows:
+                if (self._variables[row].is_sparse()):
+                    self._commit_sparse(self._variables[row], times[row], values[row])
+
+        for group_handle, group_rows in self._groups:
+            if (group_rows[-1] < M):
+                group_handle.commit_block(times[group_rows[0]] - self.time_start, values[group_rows])
+
+        if (self.trigger is not None):
+            self.trigger.drain()
+
+        registry.observe("commit_duration", time.perf_counter() - t0)
+
+    def _commit_sparse(self, var, t, y):
+        # The samples of one variable that were taken (finite time) and kept by its compression
+        taken = np.isfinite(t)
+        t = t[taken]
+        y = y[taken]
+        if (var.compression is not None):
+            t, y = var.compression.apply(t, y)
+        if (len(t) > 0):
+            var.signal_handle.commit_data(np.vstack((t - self.time_start, y)))
+
+    def _reset_sampling(self):
+        # A recording starts with a sample of every variable: compressions keep their next sample and
+        # variables with a rate are sampled on the next tick
+        now = time.time()
+        for var in self._variables:
+            if (var.compression is not None):
+                var.compression.reset()
+            var.next_sample = now
+
+    def _flush_compression(self):
+        # Commit the newest sample each compression held back, so a recording ends at the last sample
+        with self._commit_lock:
+            for var in self._variables:
+                if (var.compression is not None):
+                    t, y = var.compression.flush()
+                    if (len(t) > 0):
+                        var.signal_handle.commit_data(np.vstack((t - self.time_start, y)))
+
+    def start_acquisition(self, rate = sampling_frequency_data, block_size = None):
+        # Run the getters on a dedicated thread instead of calling update_plot from the GUI thread
+        if (self.acquisition is not None):
+            print("acquisition already started!")
+            return
+
+        self.acquisition = AcquisitionThread(self._read_variables, lambda: len(self._variables), rate = rate, block_size = block_size)
+        registry.add_source("acquisition", self.acquisition.stats)
+        self._start_draining()
+        self.acquisition.start()
+
+    def stop_acquisition(self):
+        if (self.acquisition is None):
+            return
+
+        self.acquisition.stop()
+        self.drain_acquisition()
+        registry.remove_source("acquisition")
+        self.acquisition = None
+        self._stop_draining()
+
+    def start_polling(self, rate = sampling_frequency_data, timeout = None, workers = None):
+        # Poll the getters concurrently (AsyncPoller) instead of one after another in every tick, sampling
+        # (update_plot or the acquisition thread) then takes the latest values. Rate and timeout are the
+        # defaults for variables that have none of their own. Variables added later are not polled.
+        if (self.poller is not None):
+            print("polling already started!")
+            return
+
+        variables = [var for var in self._variables if var.getter_func is not None]
+        for var in variables:
+            var.polled = True
+
+        self.poller = AsyncPoller(variables, rate = rate, timeout = timeout, workers = workers)
+        registry.add_source("poller", self.poller.stats)
+        self.poller.start()
+
+    def stop_polling(self):
+        if (self.poller is None):
+            return
+
+        self.poller.stop()
+        for var in self.poller.variables:
+            var.polled = False
+        registry.remove_source("poller")
+        self.poller = None
+
+    def start_streaming(self, address = ("127.0.0.1", 0), max_queue = 256):
+        # Publishes every variable added so far to clients (streaming.StreamClient) on a local TCP port
+        # or Unix socket path. Returns the server, server.address has the port that was picked.
+        if (self.server is not None):
+            print("streaming already started!")
+            return self.server
+
+        self.server = StreamServer(address, max_queue = max_queue, time_start = self.time_start)
+        for var in self.var_dict.values():
+            self.server.publish(var.name, var.signal_handle, {"unit": var.unit})
+        registry.add_source("streaming", self.server.stats)
+        self.server.start()
+
+        return self.server
+
+    def stop_streaming(self):
+        if (self.server is None):
+            return
+
+        self.server.stop()
+        registry.remove_source("streaming")
+        self.server = None
+
+    def _start_draining(self):
+        if (self._draining):
+            return
+
+        self._draining = True
+        if (self.headless):
+            # No GUI timer, a single consumer thread commits the blocks
+            self._drain_thread = PeriodicThread(self.drain_acquisition, 1 / framerate)
+            self._drain_thread.start()
+        else:
+            self.view.render_scheduler.add_hook(self.drain_acquisition)
+
+    def _stop_draining(self):
+        if (not self._draining or self.acquisition is not None or len(self._sources) > 0):
+            return
 
-        #     self.var_list[i].signal_handle.commit_data(np.vstack((self.var_list[i].timestamp - self.time_start, self.var_list[i].value)))
-        #     #self._signal_handles[i].commit_data( np.vstack((time_vector, self._analog_converters[i](data))) )
+        self._draining = False
+        if (self.headless):
+            self._drain_thread.stop()
+            self._drain_thread = None
+        else:
+            self.view.render_scheduler.remove_hook(self.drain_acquisition)
+
+    def drain_acquisition(self):
+        # Commits everything the acquisition thread and the sources handed over
+        with self._commit_lock:
+            if (self.acquisition is not None):
+                for times, values in self.acquisition.drain():
+                    self._commit(times, values)
+
+            for source in self._sources:
+                with registry.timer("commit_duration"):
+                    source.commit_pending(self.time_start)
+
+    def _commit_all(self):
+        # Everything sampled so far: staged update_plot ticks, the partial acquisition block and pending source blocks
+        self.flush()
+        if (self.acquisition is not None):
+            self.acquisition.flush()
+        self.drain_acquisition()
+        self._flush_compression()
+
+    def acquisition_stats(self):
+        if (self.acquisition is None):
+            return None
+        return self.acquisition.stats()
+
+    def runtime_stats(self):
+        # Counters, histograms, buffer levels and source statistics (see stats.Stats)
+        return registry.snapshot()
+
+    def signal_statistics(self, name = None):
+        # Running count, mean, std, rms, min and max per variable: "live" over the live window and
+        # since the start, "record" over the current recording (see SignalData.get_statistics).
+        # Read under the commit lock, the acquisition and source blocks are committed on another thread.
+        live_sampler = self.live_sampler if self.headless else self.view.live_sampler
+        record_sampler = self.record_sampler if self.headless else self.view.record_sampler
+        with self._commit_lock:
+            statistics = {"live": live_sampler.get_statistics(), "record": record_sampler.get_statistics()}
+        if name is not None:
+            return {key: samplers.get(name) for key, samplers in statistics.items()}
+        return statistics
+
+    def show_statistics(self, enabled = True, key = "window"):
+        # Statistics in the legends of the live and record panels (see GraphPanel.show_statistics)
+        if (self.headless):
+            return
+        self.view.live_panel.show_statistics(enabled, key)
+        self.view.record_panel.show_statistics(enabled, key)
+
+    def commit_block(self, time, values, variables = None):
+        # Batched ingestion: time is (N,) absolute timestamps (same clock as the getters),
+        # values is (M, N) with one row per variable (all variables if None, in the order they were added)
+        time = np.asarray(time, dtype = np.double)
+        if (time.shape[0] == 0):
+            return
+
+        if (variables is None):
+            variables = self._variables
+        else:
+            variables = [self.var_dict[var] if isinstance(var, str) else var for var in variables]
+
+        values = np.asarray(values, dtype = np.double).reshape(len(variables), -1)
+        registry.observe_age("commit_latency", time[-1])
+
+        # A variable group is stored as one block, so its variables can only be committed together
+        group_commits = []
+        for group_handle, group_rows in self._groups:
+            members = [i for i in range(len(variables)) if variables[i].group is group_handle]
+            if (len(members) == 0):
+                continue
+            if (len(members) != len(group_rows)):
+                raise ValueError("All variables of a group must be committed together")
+
+            order = [variables.index(self._variables[row]) for row in group_rows]
+            group_commits.append((group_handle, order))
+
+        ungrouped = [i for i in range(len(variables)) if variables[i].group is None and variables[i].compression is None]
+        compressed = [i for i in range(len(variables)) if variables[i].compression is not None]
+        with registry.timer("commit_duration"):
+            if (len(ungrouped) > 0):
+                SignalGroupHandle([variables[i].signal_handle for i in ungrouped]).commit_block(time - self.time_start, values[ungrouped])
+            for i in compressed:
+                self._commit_sparse(variables[i], time, values[i])
+            for group_handle, order in group_commits:
+                group_handle.commit_block(time - self.time_start, values[order])
+
+        # Keep the variables reflecting the latest sample
+        for i in range(len(variables)):
+            variables[i].value = values[i, -1]
+            variables[i].timestamp = time[-1]
 
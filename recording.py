@@ -0,0 +1,231 @@
+import os
+import threading
+from datetime import datetime
+import numpy as np
+
+from .signals import Sampler
+from .settings import *
+from .fileformats import RecordingWriter, save_recording
+from .decimation import MinMaxPyramid
+from .stats import registry
+from .runningstats import CumulativeStatistics
+
+
+class DiskSignalData():
+    # Same interface as SignalData, but committed samples are streamed to the sampler's
+    # current recording and get_data returns a memory mapped view of the file
+
+    def __init__(self, sampler, signal_handle, name = "", enabled = True, metadata = None, pyramid = True):
+        self._name = name
+        self._metadata = {} if metadata is None else metadata
+        self._pyramid = MinMaxPyramid() if pyramid else None
+        self._version = 0
+        self._sampler = sampler
+        self._enabled = enabled
+
+        self._writer = None
+        self._index = None
+        self._count = 0
+        self._received = 0
+        self._map = None
+        self._statistics = CumulativeStatistics()
+        self._folded = 0 # samples of the recording in _statistics
+
+        # Register callback to signal handle
+        signal_handle.add_listener(self._data_callback, self._clear)
+
+    def _attach(self, writer):
+        self._writer = writer
+        self._index = writer.add_signal(self._name, self._metadata)
+        self._count = 0
+        self._map = None
+        self._statistics.reset()
+        self._folded = 0
+
+    def _data_callback(self, data):
+        if (self._enabled):
+            if (self._writer is None):
+                self._sampler.get_writer() # Starts a recording and attaches all signals
+
+            self._writer.append(self._index, data)
+            self._count += data.shape[1]
+            self._received += data.shape[1]
+            if (self._pyramid is not None):
+                self._pyramid.extend(data[0, :])
+            self._version += 1
+
+    def set_enabled(self, enabled):
+        self._enabled = enabled
+
+    def get_data(self):
+        n = self._count
+        if (n == 0):
+            return np.empty((2, 0))
+
+        if (self._map is None or self._map.shape[0] < n):
+            self._writer.flush(self._index)
+            self._map = np.memmap(self._writer.get_path(self._index), dtype = "<f8", mode = "r", shape = (n, 2))
+
+        return self._map[:n].T
+
+    def get_xy(self):
+        data = self.get_data()
+        return data[0, :], data[1, :]
+
+    def get_slice(self, i0, i1):
+        return self.get_data()[:, i0:i1]
+
+    def get_views(self):
+        return (self.get_data(),)
+
+    def get_last(self, k):
+        return self.get_data()[:, max(self._count - k, 0):]
+
+    def get_pyramid(self):
+        return self._pyramid
+
+    def get_version(self):
+        return self._version
+
+    def get_stats(self):
+        # Only limited by the disk, nothing is ever dropped or overwritten
+        return {"received": self._received, "dropped": 0, "overwritten": 0, "samples": self._count, "capacity": None, "fill": None}
+
+    def get_statistics(self):
+        # The whole recording is the window, samples recorded since the last call are read back once
+        if (self._folded < self._count):
+            self._statistics.update(self.get_data()[1:, self._folded:])
+            self._folded = self._count
+        statistics = self._statistics.get()
+        return {"window": statistics, "total": statistics}
+
+    def clear(self):
+        if (self._writer is not None):
+            if (self._writer is self._sampler.writer):
+                self._writer.restart(self._index)
+            else:
+                self._writer = None
+        self._count = 0
+        self._map = None
+        self._statistics.reset()
+        self._folded = 0
+        if (self._pyramid is not None):
+            self._pyramid.clear()
+        self._version += 1
+
+    def _clear(self):
+        if (self._enabled):
+            self.clear()
+
+    def get_name(self):
+        return self._name
+
+    def get_metadata(self):
+        return self._metadata
+
+
+class DiskSampler(Sampler):
+    # Record sampler without a size limit, every clear() starts a new recording folder in root_folder
+
+    def __init__(self, root_folder, enabled = False, pyramid = True):
+        super().__init__(None, continous = False, enabled = enabled, pyramid = pyramid)
+        self.root_folder = root_folder
+        self.writer = None
+
+    def get_writer(self):
+        if (self.writer is None):
+            folder = os.path.join(self.root_folder, "recording" + datetime.now().strftime("_%Y%m%d_%H%M%S_%f") + ".mrec")
+            self.writer = RecordingWriter(folder)
+
+            for signaldata in self.signaldatas:
+                signaldata._attach(self.writer)
+
+        return self.writer
+
+    def get_folder(self):
+        return None if self.writer is None else self.writer.folder
+
+    def clear(self):
+        if (self.writer is not None):
+            self.writer.close()
+            self.writer = None
+
+        for signaldata in self.signaldatas:
+            signaldata.clear()
+
+    def set_enabled(self, enabled):
+        super().set_enabled(enabled)
+
+        # Stopping only needs to push out the buffered tail
+        if (not enabled and self.writer is not None):
+            self.writer.flush()
+
+    def snapshot(self):
+        # Recording files are only appended to (clear starts a new recording, clearing a single signal
+        # a new file), so the memory mapped views already are a consistent snapshot, nothing is copied
+        if (self.writer is not None):
+            self.writer.flush()
+
+        names = [signaldata.get_name() for signaldata in self.signaldatas]
+        datas = [signaldata.get_data() for signaldata in self.signaldatas]
+        metadatas = [dict(signaldata.get_metadata()) for signaldata in self.signaldatas]
+        return names, datas, metadatas
+
+    def add_signal(self, signal_handle, name, metadata = None):
+        signaldata = DiskSignalData(self, signal_handle, name = name, enabled = self.enabled, metadata = metadata, pyramid = self.pyramid)
+        self.signaldatas.append(signaldata)
+
+        if (self.writer is not None):
+            signaldata._attach(self.writer)
+
+        return signaldata
+
+    def add_signal_group(self, group_handle, names, metadatas = None, value_dtype = np.double):
+        # Recording files are per signal, so the channels are streamed through their own handles
+        return [self.add_signal(group_handle.channel_handles[i], names[i], None if metadatas is None else metadatas[i]) for i in range(len(names))]
+
+    def close(self):
+        if (self.writer is not None):
+            self.writer.close()
+
+
+class SaveThread(threading.Thread):
+    # Writes a sampler snapshot (see Sampler.snapshot) without blocking the caller. progress and done
+    # can be polled (MainView does so from its render scheduler), callback(filename, error) is called
+    # on this thread when finished. Not a daemon, so an exiting interpreter waits for the file.
+
+    def __init__(self, snapshot, filename, callback = None, **kwargs):
+        super().__init__()
+
+        self.snapshot = snapshot
+        self.filename = filename
+        self.callback = callback
+        self.kwargs = kwargs
+
+        self.progress = 0.0
+        self.done = False
+        self.error = None
+
+    def _progress(self, fraction):
+        self.progress = fraction
+
+    def run(self):
+        names, datas, metadatas = self.snapshot
+        try:
+            with registry.timer("export_duration"):
+                save_recording(self.filename, names, datas, metadatas, progress = self._progress, **self.kwargs)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.snapshot = None
+            self.done = True
+
+        if (self.callback is not None):
+            self.callback(self.filename, self.error)
+
+
+def create_record_sampler():
+    # In memory ring of record_max_size, or streamed to disk when record_folder is set
+    if (record_folder is None):
+        return Sampler(record_max_size, pyramid = True)
+    return DiskSampler(record_folder)
@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+
+from .signals import SignalGroupHandle
+from .fileformats import Recording, load_recording
+from .settings import *
+
+
+class RecordingReplay():
+    # Plays a recording back into signal handles (one channel of signal_group per recorded signal).
+    # Seeking is a binary search in every signal's time column, so it is O(log n) and only touches the
+    # pages it needs of memory mapped recordings. Recorded timestamps are committed as they are.
+    #
+    # speed = 1.0 plays in real time, 10.0 ten times faster, None as fast as possible.
+    # run() replays on the calling thread and commits directly (offline processing, benchmarks),
+    # start() replays on a thread and hands blocks over like the other sources (see Monitor.add_source).
+    # seek can be called while replaying, the downstream signals are cleared before the next commit.
+
+    shared_timebase = False # Signals are committed one by one with their own timestamps
+    max_pending_blocks = 64 # As fast as possible on a thread waits for the consumer beyond this
+
+    def __init__(self, recording, speed = 1.0, block_duration = None):
+        if not isinstance(recording, Recording):
+            recording = load_recording(recording)
+        self.recording = recording
+        self.speed = speed
+        self.block_duration = 1 / framerate if block_duration is None else block_duration
+
+        self.channels = recording.get_names()
+        self.signal_group = SignalGroupHandle()
+        for _ in self.channels:
+            self.signal_group.add_channel()
+
+        # Time index of the recording
+        self._datas = [signal.get_data() for signal in recording.signals]
+        self._times = [data[0, :] for data in self._datas]
+        firsts = [times[0] for times in self._times if len(times) > 0]
+        lasts = [times[-1] for times in self._times if len(times) > 0]
+        self.start_time = min(firsts) if len(firsts) > 0 else 0.0
+        self.end_time = max(lasts) if len(lasts) > 0 else 0.0
+
+        self._blocks = deque()
+        self._lock = threading.Lock() # position, pending blocks and timing anchors
+        self._running = False
+        self._thread = None
+        self.error = None
+        self.seek(self.start_time)
+        self._clear_pending = False
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.samples = 0
+        self.blocks = 0
+        self._wall_time = 0.0
+        self._replayed_time = 0.0
+
+    def seek(self, t):
+        # Pending blocks are dropped and real time replay continues from t without catching up
+        with self._lock:
+            self.time = t
+            self._positions = [int(np.searchsorted(times, t, side = "left")) for times in self._times]
+            self._blocks.clear()
+            self._clear_pending = True
+            self._set_anchor()
+
+    def _set_anchor(self):
+        # Replay time _anchor_time is played at wall clock _anchor_wall
+        self._anchor_wall = time.perf_counter()
+        self._anchor_time = self.time
+
+    def is_finished(self):
+        return self.time > self.end_time
+
+    def _next_blocks(self, duration):
+        # Samples in [time, time + duration) of every signal, advances the position
+        end = self.time + duration
+        blocks = []
+        for i in range(len(self._times)):
+            i0 = self._positions[i]
+            i1 = i0 + int(np.searchsorted(self._times[i][i0:], end, side = "left"))
+            if (i1 > i0):
+                blocks.append((i, np.asarray(self._datas[i][:, i0:i1])))
+                self.samples += i1 - i0
+            self._positions[i] = i1
+
+        self._replayed_time += min(end, self.end_time) - self.time
+        self.time = end
+        self.blocks += 1
+        return blocks
+
+    def _commit(self, blocks):
+        # Called with the lock held, a seek clears what was committed before it
+        if (self._clear_pending):
+            self._clear_pending = False
+            self.signal_group.clear_data()
+        for i, data in blocks:
+            self.signal_group.channel_handles[i].commit_data(data)
+
+    def step(self, duration = None):
+        # Commit the next duration seconds of recording directly
+        with self._lock:
+            self._commit(self._next_blocks(self.block_duration if duration is None else duration))
+
+    def run(self, until = None):
+        # Replay from the current position on this thread at self.speed, returns stats()
+        self._reset_stats()
+        until = self.end_time if until is None else until
+        speed = self.speed
+
+        wall_start = time.perf_counter()
+        with self._lock:
+            self._set_anchor()
+        while self.time <= until:
+            if (speed is not None):
+                delay = self._anchor_wall + (self.time - self._anchor_time) / speed - time.perf_counter()
+                if (delay > 0):
+                    time.sleep(delay)
+            self.step()
+        self._wall_time = time.perf_counter() - wall_start
+
+        return self.stats()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target = self._run_thread, daemon = True)
+        self._thread.start()
+
+    def stop(self, timeout = 1.0):
+        self._running = False
+        if (self._thread is not None and self._thread.is_alive()):
+            self._thread.join(timeout)
+
+    def _run_thread(self):
+        self._reset_stats()
+        wall_start = time.perf_counter()
+        with self._lock:
+            self._set_anchor()
+
+        while self._running and not self.is_finished():
+            wait = 0.0
+            with self._lock:
+                if (self.speed is None):
+                    if (len(self._blocks) > self.max_pending_blocks):
+                        wait = 0.001
+                    duration = self.block_duration
+                else:
+                    # Catch up with the wall clock, also after a stall
+                    target = self._anchor_time + (time.perf_counter() - self._anchor_wall) * self.speed
+                    duration = target - self.time
+                    if (duration < self.block_duration * self.speed):
+                        wait = self.block_duration - duration / self.speed
+
+                if (wait == 0.0):
+                    self._blocks.append(self._next_blocks(duration))
+                    self._wall_time = time.perf_counter() - wall_start
+
+            if (wait > 0.0):
+                time.sleep(wait)
+
+        self._running = False
+
+    def commit_pending(self, time_start = 0.0):
+        # Called from the consumer thread, recorded timestamps are kept (time_start is not applied)
+        with self._lock:
+            if (self._clear_pending and not self._blocks):
+                self._commit([])
+            while self._blocks:
+                self._commit(self._blocks.popleft())
+
+    def stats(self):
+        wall_time = max(self._wall_time, 1e-9)
+        return {
+            "samples": self.samples,
+            "blocks": self.blocks,
+            "wall_time": self._wall_time,
+            "samples_per_s": self.samples / wall_time,
+            "realtime_factor": float(self._replayed_time / wall_time),
+            "position": float(self.time),
+            "pending_blocks": len(self._blocks),
+        }
@@ -0,0 +1,190 @@
+import math
+import numpy as np
+
+
+def _moments(values):
+    # count, mean, m2 (sum of squared deviations), min and max of every row of (rows, n) values,
+    # non finite values are skipped
+    values = np.asarray(values, dtype = np.double)
+    finite = np.isfinite(values)
+    count = finite.sum(axis = 1)
+
+    total = np.where(finite, values, 0.0).sum(axis = 1)
+    mean = np.divide(total, count, out = np.zeros(len(count)), where = count > 0)
+    m2 = np.where(finite, (values - mean[:, None])**2, 0.0).sum(axis = 1)
+
+    minimum = np.min(values, axis = 1, initial = np.inf, where = finite)
+    maximum = np.max(values, axis = 1, initial = -np.inf, where = finite)
+    return count, mean, m2, minimum, maximum
+
+
+def _combine(count, mean, m2, minimum, maximum, axis):
+    # Merges partial moments along axis (Chan et al.), stable for signals with a large offset
+    n = count.sum(axis = axis)
+    weighted = (count * mean).sum(axis = axis)
+    total_mean = np.divide(weighted, n, out = np.zeros(np.shape(n)), where = n > 0)
+    spread = count * (mean - np.expand_dims(total_mean, axis))**2
+    total_m2 = m2.sum(axis = axis) + spread.sum(axis = axis)
+    return n, total_mean, total_m2, minimum.min(axis = axis), maximum.max(axis = axis)
+
+
+def _summary(count, mean, m2, minimum, maximum):
+    count = int(count)
+    if (count == 0):
+        return {"count": 0, "mean": None, "std": None, "rms": None, "min": None, "max": None}
+
+    variance = max(float(m2) / count, 0.0)
+    return {
+        "count": count,
+        "mean": float(mean),
+        "std": math.sqrt(variance),
+        "rms": math.sqrt(float(mean)**2 + variance),
+        "min": float(minimum),
+        "max": float(maximum),
+    }
+
+
+def summarize(views):
+    # Statistics of a row of values given as one or more (1, n) views, computed directly
+    moments = [np.concatenate(parts) for parts in zip(*[_moments(view) for view in views])]
+    return _summary(*_combine(*moments, axis = 0))
+
+
+class CumulativeStatistics():
+    # Count, mean, std, rms, min and max of every row since the last reset, each block is merged
+    # into the totals so the cost only depends on the block size
+
+    def __init__(self, rows = 1):
+        self.rows = rows
+        self.reset()
+
+    def reset(self):
+        self._count = np.zeros(self.rows)
+        self._mean = np.zeros(self.rows)
+        self._m2 = np.zeros(self.rows)
+        self._min = np.full(self.rows, np.inf)
+        self._max = np.full(self.rows, -np.inf)
+
+    def update(self, values):
+        # values is (rows, n)
+        if (values.shape[1] == 0):
+            return
+        block = _moments(values)
+        parts = [np.stack((total, part), axis = 1) for total, part in zip((self._count, self._mean, self._m2, self._min, self._max), block)]
+        self._count, self._mean, self._m2, self._min, self._max = _combine(*parts, axis = 1)
+
+    def get(self, row = 0):
+        return _summary(self._count[row], self._mean[row], self._m2[row], self._min[row], self._max[row])
+
+
+class WindowStatistics():
+    # The same statistics over the content of a RingBuffer. The ring's storage is divided into chunks
+    # that keep their partial moments: commits only mark the chunks they wrote (evicted samples are
+    # simply replaced), a query recomputes the marked chunks and merges the per chunk moments. The chunk
+    # size defaults to about the square root of the capacity, so a query costs the samples committed
+    # since the previous one plus a few chunks, independent of the buffer length.
+
+    def __init__(self, ring, rows = None, chunk_size = None):
+        self.ring = ring
+        self.rows = slice(None) if rows is None else rows
+        n_rows = len(range(*self.rows.indices(ring.storage.shape[0])))
+
+        if chunk_size is None:
+            chunk_size = max(64, int(math.sqrt(ring.maxlen)))
+        self.chunk_size = chunk_size
+        n_chunks = max(-(-ring.maxlen // chunk_size), 1)
+
+        self._dirty = np.zeros(n_chunks, dtype = bool)
+        self._count = np.zeros((n_rows, n_chunks))
+        self._mean = np.zeros((n_rows, n_chunks))
+        self._m2 = np.zeros((n_rows, n_chunks))
+        self._min = np.full((n_rows, n_chunks), np.inf)
+        self._max = np.full((n_rows, n_chunks), -np.inf)
+
+    def reset(self):
+        self._dirty[:] = False
+        self._count[:] = 0
+        self._mean[:] = 0
+        self._m2[:] = 0
+        self._min[:] = np.inf
+        self._max[:] = -np.inf
+
+    def update(self, position, n):
+        # n samples were written at storage position onwards (wrapping around)
+        capacity = self.ring.maxlen
+        if (n >= capacity):
+            self._dirty[:] = True
+            return
+        if (n == 0):
+            return
+
+        self._dirty[position // self.chunk_size:(min(position + n, capacity) - 1) // self.chunk_size + 1] = True
+        if (position + n > capacity):
+            self._dirty[:(position + n - capacity - 1) // self.chunk_size + 1] = True
+
+    def _refresh(self):
+        # The ring only starts at a position other than 0 once it is full, so until then the valid
+        # storage is [0, len(ring))
+        valid = self.ring.maxlen if self.ring.is_full else len(self.ring)
+        for chunk in np.flatnonzero(self._dirty):
+            a = chunk * self.chunk_size
+            b = min(a + self.chunk_size, valid)
+            if (b > a):
+                moments = _moments(self.ring.storage[self.rows, a:b])
+                self._count[:, chunk], self._mean[:, chunk], self._m2[:, chunk], self._min[:, chunk], self._max[:, chunk] = moments
+        self._dirty[:] = False
+
+    def get(self, row = 0):
+        self._refresh()
+        return _summary(*_combine(self._count[row], self._mean[row], self._m2[row], self._min[row], self._max[row], axis = 0))
+
+
+class RingStatistics():
+    # Window and cumulative statistics of a RingBuffer, committed blocks are only counted: they are
+    # marked in the window and folded into the totals in batches when queried (or folded before they
+    # would be evicted unseen). Call before_extend(n) and after_extend(data) around every ring.extend(data).
+
+    def __init__(self, ring, rows = None):
+        self.ring = ring
+        self.rows = slice(None) if rows is None else rows
+        self.window = WindowStatistics(ring, self.rows)
+        self.total = CumulativeStatistics(self.window._count.shape[0])
+        self._pending = 0 # newest samples of the ring not yet in total
+        self._unmarked = 0 # newest samples of the ring not yet marked in window
+
+    def reset(self):
+        self.window.reset()
+        self.total.reset()
+        self._pending = 0
+        self._unmarked = 0
+
+    def before_extend(self, n):
+        if (self._pending + n > self.ring.maxlen):
+            self._fold()
+
+    def after_extend(self, data):
+        # The oldest samples of a block larger than the ring never made it into the ring
+        n = data.shape[1]
+        if (n > self.ring.maxlen):
+            self.total.update(data[self.rows, :n - self.ring.maxlen])
+            n = self.ring.maxlen
+        self._pending += n
+        self._unmarked += n
+
+    def _mark(self):
+        # The unmarked samples are the newest ones, written up to the ring's write position
+        if (self._unmarked > 0):
+            capacity = self.ring.maxlen
+            n = min(self._unmarked, capacity)
+            self.window.update((self.ring.write_position - n) % capacity, n)
+            self._unmarked = 0
+
+    def _fold(self):
+        if (self._pending > 0):
+            self.total.update(self.ring.get_last(self._pending)[self.rows, :])
+            self._pending = 0
+
+    def get(self, row = 0):
+        self._fold()
+        self._mark()
+        return {"window": self.window.get(row), "total": self.total.get(row)}
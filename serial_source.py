@@ -0,0 +1,241 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+
+from .signals import SignalGroupHandle
+
+# # # # # # # # # #
+# Checksums, vectorised over frames (one row per frame)
+# # # # # # # # # #
+def _sum8(payload):
+    return payload.sum(axis = 1, dtype = np.uint32) & 0xFF
+
+def _xor8(payload):
+    return np.bitwise_xor.reduce(payload, axis = 1)
+
+def _make_crc16_table():
+    table = np.zeros(256, dtype = np.uint16)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if (crc & 0x8000) else (crc << 1)
+        table[i] = crc & 0xFFFF
+    return table
+
+_crc16_table = _make_crc16_table()
+
+def _crc16(payload):
+    # CRC-16/CCITT-FALSE, loops over the byte columns only
+    crc = np.full(payload.shape[0], 0xFFFF, dtype = np.uint16)
+    for j in range(payload.shape[1]):
+        crc = (crc << 8) ^ _crc16_table[((crc >> 8) ^ payload[:, j]) & 0xFF]
+    return crc
+
+checksums = {
+    "sum8": (_sum8, "u1"),
+    "xor8": (_xor8, "u1"),
+    "crc16": (_crc16, "u2"),
+}
+
+
+class FrameLayout():
+    # Fixed-size binary frame: sync bytes, the declared fields (name, struct format character)
+    # and an optional checksum over the fields. Decoding works on whole chunks with NumPy.
+
+    def __init__(self, fields, sync = b"\xaa\x55", checksum = None, byteorder = "<"):
+        if (checksum is not None and checksum not in checksums):
+            raise ValueError("Unknown checksum: %s" % checksum)
+
+        self.fields = list(fields)
+        self.sync = np.frombuffer(bytes(sync), dtype = np.uint8)
+        self.checksum = checksum
+
+        dtype = [("sync", "u1", (len(self.sync),))] if len(self.sync) > 0 else []
+        dtype += [(name, byteorder + fmt) for name, fmt in self.fields]
+        if (checksum is not None):
+            dtype += [("checksum", byteorder + checksums[checksum][1])]
+
+        self.dtype = np.dtype(dtype)
+        self.size = self.dtype.itemsize
+        self.names = [name for name, _ in self.fields]
+
+    def _sync_ok(self, frames):
+        if (len(self.sync) == 0):
+            return np.ones(frames.shape[0], dtype = bool)
+        return (frames[:, :len(self.sync)] == self.sync).all(axis = 1)
+
+    def _find_sync(self, buffer, start):
+        # Next position >= start where the sync word begins, -1 if there is none
+        if (len(self.sync) == 0):
+            return start if start < len(buffer) else -1
+
+        candidates = np.flatnonzero(buffer[start:len(buffer) - len(self.sync) + 1] == self.sync[0]) + start
+        for k in range(1, len(self.sync)):
+            candidates = candidates[buffer[candidates + k] == self.sync[k]]
+        return candidates[0] if len(candidates) > 0 else -1
+
+    def decode(self, buffer):
+        # Returns (records, consumed, resyncs, checksum_errors). records is a structured array,
+        # buffer[consumed:] is an incomplete frame (or unsynced bytes) to keep for the next chunk.
+        buffer = np.frombuffer(bytes(buffer), dtype = np.uint8)
+
+        records = []
+        resyncs = 0
+        checksum_errors = 0
+        position = 0
+
+        while len(buffer) - position >= self.size:
+            n = (len(buffer) - position) // self.size
+            frames = buffer[position:position + n * self.size].reshape(n, self.size)
+
+            # Frames stay aligned up to the first broken sync word
+            sync_ok = self._sync_ok(frames)
+            aligned = n if sync_ok.all() else int(np.argmin(sync_ok))
+            frames = frames[:aligned]
+
+            if (self.checksum is not None and aligned > 0):
+                checksum_size = self.dtype["checksum"].itemsize
+                payload = frames[:, len(self.sync):self.size - checksum_size]
+                received = frames[:, self.size - checksum_size:].copy().view(self.dtype["checksum"]).ravel()
+                valid = checksums[self.checksum][0](payload) == received
+                checksum_errors += int(aligned - valid.sum())
+                frames = frames[valid]
+
+            if (len(frames) > 0):
+                records.append(np.ascontiguousarray(frames).view(self.dtype).ravel())
+            position += aligned * self.size
+
+            if (aligned < n):
+                # Lost alignment, skip ahead to the next sync word
+                resyncs += 1
+                next_sync = self._find_sync(buffer, position + 1)
+                if (next_sync < 0):
+                    position = max(position, len(buffer) - len(self.sync) + 1)
+                    break
+                position = next_sync
+
+        if (len(records) == 0):
+            records = np.empty(0, dtype = self.dtype)
+        else:
+            records = np.concatenate(records)
+        return records, position, resyncs, checksum_errors
+
+
+class SerialSource():
+    # Reads large chunks from a stream (serial.Serial opened with a short timeout, a pty opened in
+    # binary mode, io.BytesIO, ...) on a background thread, decodes whole chunks of frames and hands
+    # (time, values) blocks over through a deque. commit_pending() (called from the consumer thread) commits them to signal_group.
+    # time_field/time_scale map a device timestamp to seconds, otherwise frames of a chunk are spread
+    # evenly over the time since the previous chunk.
+
+    def __init__(self, stream, layout, channels = None, time_field = None, time_scale = 1.0, chunk_size = 4096):
+        self.stream = stream
+        self.layout = layout
+        self.time_field = time_field
+        self.time_scale = time_scale
+        self.chunk_size = chunk_size
+
+        if channels is None:
+            channels = [name for name in layout.names if name != time_field]
+        self.channels = list(channels)
+        self.signal_group = SignalGroupHandle()
+        for _ in self.channels:
+            self.signal_group.add_channel()
+
+        self._blocks = deque()
+        self._pending = b""
+        self._running = False
+        self._thread = None
+        self._time_offset = None
+        self._last_time = None
+        self.error = None
+
+        # Statistics, written by the reader thread only
+        self.bytes = 0
+        self.frames = 0
+        self.resyncs = 0
+        self.checksum_errors = 0
+        self._start_time = None
+
+    def start(self):
+        self._running = True
+        self._start_time = time.time()
+        self._last_time = self._start_time
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def stop(self, timeout = 1.0):
+        self._running = False
+        if (self._thread is not None and self._thread.is_alive()):
+            self._thread.join(timeout)
+
+    def _run(self):
+        while self._running:
+            try:
+                chunk = self.stream.read(self.chunk_size)
+            except Exception as e:
+                self.error = e
+                break
+
+            if not chunk:
+                time.sleep(0.001)
+                continue
+
+            self.feed(chunk)
+
+    def _decode(self, buffer, now):
+        records, consumed, resyncs, checksum_errors = self.layout.decode(buffer)
+        self.resyncs += resyncs
+        self.checksum_errors += checksum_errors
+
+        n = len(records)
+        if (n > 0):
+            self.frames += n
+            values = np.empty((len(self.channels), n))
+            for i in range(len(self.channels)):
+                values[i, :] = records[self.channels[i]]
+
+            if (self.time_field is not None):
+                device_time = records[self.time_field].astype(np.double) * self.time_scale
+                if (self._time_offset is None):
+                    self._time_offset = now - device_time[-1]
+                times = device_time + self._time_offset
+            else:
+                times = self._last_time + (now - self._last_time) * np.arange(1, n + 1) / n
+            self._last_time = now
+
+            self._blocks.append((times, values))
+
+        return buffer[consumed:]
+
+    def feed(self, chunk):
+        # Decode received bytes, also usable without the thread (e.g. to push bytes from a test)
+        if (self._start_time is None):
+            self._start_time = time.time()
+            self._last_time = self._start_time
+
+        self.bytes += len(chunk)
+        self._pending = self._decode(self._pending + bytes(chunk), time.time())
+
+    def drain(self):
+        blocks = []
+        while self._blocks:
+            blocks.append(self._blocks.popleft())
+        return blocks
+
+    def commit_pending(self, time_start = 0.0):
+        for times, values in self.drain():
+            self.signal_group.commit_block(times - time_start, values)
+
+    def stats(self):
+        elapsed = max(time.time() - self._start_time, 1e-9) if self._start_time is not None else None
+        return {
+            "bytes": self.bytes,
+            "frames": self.frames,
+            "resyncs": self.resyncs,
+            "checksum_errors": self.checksum_errors,
+            "bytes_per_s": None if elapsed is None else self.bytes / elapsed,
+            "frames_per_s": None if elapsed is None else self.frames / elapsed,
+            "pending_blocks": len(self._blocks),
+        }
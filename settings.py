@@ -1,9 +1,10 @@
 
 # UI Configuratiosn
 framerate = 20 # Hz
+plot_decimation = True # Send at most a min and a max point per pixel column to each curve
 
 # Sampling Configurations
-buffer_size = 1
+buffer_size = 1 # ticks staged by Monitor.update_plot before they are committed as one block
 sampling_frequency_data = 500
 
 # Live Configurations
@@ -12,6 +13,11 @@ live_max_time = 20 # seconds
 # Recording Configurations
 record_max_time = 5*60
 record_max_size = sampling_frequency_data * record_max_time
+record_folder = None # Stream recordings to files in this folder instead of keeping them in memory (no size limit)
+
+# Statistics Configurations
+stats_file = None # Append a JSON line with the runtime statistics to this file every stats_interval
+stats_interval = 5 # seconds
 
 # # # # # # # # # #
 # Data Channels and Sensors...
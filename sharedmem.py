@@ -0,0 +1,368 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+from .signals import SignalGroupHandle
+from .runningstats import CumulativeStatistics, summarize
+from .settings import *
+
+# Segment layout: 8 int64 (magic, n, size, capacity, json length, writer pid, restarts, -),
+# 4 float64 (time_start, heartbeat, -, -), JSON with names and metadata (padded to 8 bytes),
+# n int64 sample counters, n int64 clear positions and the (n, 2, capacity) float64 rings
+_magic = 0x6d6f6e72696e6701
+_header_ints = 8
+_header_floats = 4
+
+
+class SharedRing():
+    # Rings of (time, value) samples in one multiprocessing.shared_memory segment, written by one process
+    # and read by others without locks. counts[i] only ever grows: the writer stores the samples first and
+    # then bumps the counter, so readers see complete samples (the stores are ordered on x86; other
+    # architectures may need a barrier). Readers expose at most size samples while the ring holds
+    # capacity = size + margin, so a view handed out stays intact for margin more samples.
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.name = shm.name
+        self.owner = owner
+
+        buf = shm.buf
+        self._ints = np.ndarray((_header_ints,), dtype = np.int64, buffer = buf)
+        self._floats = np.ndarray((_header_floats,), dtype = np.float64, buffer = buf, offset = 8 * _header_ints)
+        if (self._ints[0] != _magic):
+            raise ValueError("Shared memory %s is not a SharedRing" % shm.name)
+
+        n, self.size, self.capacity, json_length = [int(v) for v in self._ints[1:5]]
+        offset = 8 * (_header_ints + _header_floats)
+        header = json.loads(bytes(buf[offset:offset + json_length]).decode())
+        self.names = header["names"]
+        self.metadatas = header["metadatas"]
+
+        offset += -(-json_length // 8) * 8
+        self.counts = np.ndarray((n,), dtype = np.int64, buffer = buf, offset = offset)
+        self.starts = np.ndarray((n,), dtype = np.int64, buffer = buf, offset = offset + 8 * n)
+        self.data = np.ndarray((n, 2, self.capacity), dtype = np.float64, buffer = buf, offset = offset + 16 * n)
+
+    @classmethod
+    def create(cls, names, size, metadatas = None, margin = None):
+        names = list(names)
+        if metadatas is None:
+            metadatas = [{} for _ in names]
+        if margin is None:
+            margin = max(int(size) // 4, 1)
+
+        n = len(names)
+        size = int(size)
+        capacity = size + int(margin)
+        header = json.dumps({"names": names, "metadatas": list(metadatas)}).encode()
+        json_padded = -(-len(header) // 8) * 8
+        nbytes = 8 * (_header_ints + _header_floats) + json_padded + 16 * n + 8 * n * 2 * capacity
+
+        shm = shared_memory.SharedMemory(create = True, size = nbytes)
+        ints = np.ndarray((_header_ints,), dtype = np.int64, buffer = shm.buf)
+        ints[:] = [_magic, n, size, capacity, len(header), 0, 0, 0]
+        offset = 8 * (_header_ints + _header_floats)
+        shm.buf[offset:offset + len(header)] = header
+        np.ndarray((2 * n,), dtype = np.int64, buffer = shm.buf, offset = offset + json_padded)[:] = 0
+        del ints
+
+        ring = cls(shm, owner = True)
+        ring._floats[:] = [time.time(), time.time(), 0.0, 0.0]
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        # Child processes share the resource tracker of the parent (POSIX), which only unlinks
+        # the segment if the owner did not, so attaching needs no special care
+        return cls(shared_memory.SharedMemory(name = name), owner = False)
+
+    # # # # # # # # # #
+    # Writer side
+    # # # # # # # # # #
+    @property
+    def time_start(self):
+        return float(self._floats[0])
+
+    @time_start.setter
+    def time_start(self, value):
+        self._floats[0] = value
+
+    def time(self):
+        # Time relative to the monitor's time_start, what samples should be stamped with
+        return time.time() - self._floats[0]
+
+    def heartbeat(self):
+        self._floats[1] = time.time()
+
+    def get_heartbeat(self):
+        return float(self._floats[1])
+
+    def write(self, i, data):
+        # data is (2, N) with relative times
+        n = data.shape[1]
+        if (n == 0):
+            return
+        if (n > self.capacity):
+            data = data[:, n - self.capacity:]
+            self.counts[i] += n - self.capacity
+            n = self.capacity
+
+        count = int(self.counts[i])
+        start = count % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[i, :, start:start + first] = data[:, :first]
+        self.data[i, :, :n - first] = data[:, first:]
+
+        self.counts[i] = count + n
+        self._floats[1] = time.time()
+
+    def clear(self, i):
+        self.starts[i] = self.counts[i]
+
+    def listen(self, channel, signal_handle):
+        # Writes every block committed to signal_handle to the ring of channel (index or name)
+        i = channel if isinstance(channel, int) else self.names.index(channel)
+        signal_handle.add_listener(lambda data: self.write(i, data), lambda: self.clear(i))
+
+    # # # # # # # # # #
+    # Reader side
+    # # # # # # # # # #
+    def get_range(self, i):
+        # Absolute sample numbers [a, b) that may be read, at most size samples
+        b = int(self.counts[i])
+        a = max(int(self.starts[i]), b - self.size)
+        return a, b
+
+    def get_views(self, i, a, b):
+        # Samples a..b of ring i as one or two views into shared memory
+        a0 = a % self.capacity
+        n = b - a
+        if (a0 + n <= self.capacity):
+            return (self.data[i, :, a0:a0 + n],)
+        return (self.data[i, :, a0:], self.data[i, :, :a0 + n - self.capacity])
+
+    def is_intact(self, i, a):
+        # False if sample a has been overwritten since it was read
+        return int(self.counts[i]) - a <= self.capacity
+
+    def close(self):
+        # Views into the segment must be released before it can be closed
+        self._ints = self._floats = self.counts = self.starts = self.data = None
+        self.shm.close()
+        if (self.owner):
+            self.shm.unlink()
+
+
+class SharedSignalData():
+    # SignalData interface on one ring of a SharedRing, data is read in place (views into shared memory).
+    # clear only affects this reader.
+
+    def __init__(self, ring, index):
+        self.ring = ring
+        self.index = index
+        self._start = 0
+        self._cleared = 0
+        self._statistics = CumulativeStatistics()
+        self._folded = 0 # absolute sample number up to which _statistics is updated
+
+    def _range(self, i0 = 0, i1 = None):
+        a, b = self.ring.get_range(self.index)
+        a = max(a, self._start)
+        n = b - a
+        if (i1 is None or i1 > n):
+            i1 = n
+        i0 = min(max(i0, 0), i1)
+        return a + i0, a + i1
+
+    def set_enabled(self, enabled):
+        pass
+
+    def get_views(self):
+        return self.ring.get_views(self.index, *self._range())
+
+    def get_slice(self, i0, i1):
+        views = self.ring.get_views(self.index, *self._range(i0, i1))
+        if (len(views) == 1):
+            return views[0]
+        return np.concatenate(views, axis = 1)
+
+    def get_data(self):
+        return self.get_slice(0, None)
+
+    def get_xy(self):
+        data = self.get_data()
+        return data[0, :], data[1, :]
+
+    def get_last(self, k):
+        a, b = self._range()
+        return self.get_slice(b - a - min(k, b - a), None)
+
+    def get_pyramid(self):
+        return None
+
+    def get_version(self):
+        return int(self.ring.counts[self.index]) + self._cleared
+
+    def get_stats(self):
+        # Overwritten counts the samples pushed out of the window since the last clear
+        a, b = self._range()
+        start = max(int(self.ring.starts[self.index]), self._start)
+        return {"received": b, "dropped": 0, "overwritten": a - start, "samples": b - a, "capacity": self.ring.size, "fill": (b - a) / self.ring.size}
+
+    def get_statistics(self):
+        # The producer does not maintain statistics, so the window is computed from the views (cost grows
+        # with the window) and the totals from the samples written since the last call, as far as they
+        # have not been overwritten
+        a, b = self._range()
+        if (self._folded < b):
+            views = self.ring.get_views(self.index, max(self._folded, a), b)
+            self._statistics.update(np.concatenate([view[1:, :] for view in views], axis = 1))
+            self._folded = b
+        return {"window": summarize([view[1:, :] for view in self.get_views()]), "total": self._statistics.get()}
+
+    def clear(self):
+        self._start = int(self.ring.counts[self.index])
+        self._cleared += 1
+        self._statistics.reset()
+        self._folded = self._start
+
+    def get_name(self):
+        return self.ring.names[self.index]
+
+    def get_metadata(self):
+        return self.ring.metadatas[self.index]
+
+
+def _run_producer(name, target, args):
+    # Entry point of the producer process
+    ring = SharedRing.attach(name)
+    ring._ints[5] = os.getpid()
+
+    # Exit with the parent instead of writing into a segment nobody reads
+    def watch_parent():
+        parent = multiprocessing.parent_process()
+        while True:
+            time.sleep(0.5)
+            if (parent is None or not parent.is_alive()):
+                os._exit(0)
+    threading.Thread(target = watch_parent, daemon = True).start()
+
+    target(ring, *args)
+
+
+class ProcessSource():
+    # Runs target(ring, *args) in a separate process, where it acquires and computes derived signals and
+    # writes them with ring.listen(name, signal_handle) or ring.write(i, data), stamped with ring.time().
+    # target must be importable (a module level function) when processes are spawned.
+    #
+    # In the monitor process the live panel reads live_signaldatas directly from shared memory, while
+    # commit_pending copies the new samples to signal_group (record sampler, triggers). A producer that
+    # crashes or writes nothing for stall_timeout seconds is restarted (if restart), one that returns
+    # normally has finished and is left stopped. The monitor is never blocked by it. Channels have their
+    # own timestamps.
+
+    shared_timebase = False
+
+    def __init__(self, target, channels, size = None, args = (), metadatas = None, margin = None, stall_timeout = 2.0, restart = True):
+        if size is None:
+            size = sampling_frequency_data * live_max_time
+
+        self.target = target
+        self.args = args
+        self.channels = list(channels)
+        self.stall_timeout = stall_timeout
+        self.restart = restart
+
+        self.ring = SharedRing.create(self.channels, size, metadatas, margin)
+        self.live_signaldatas = [SharedSignalData(self.ring, i) for i in range(len(self.channels))]
+        self.signal_group = SignalGroupHandle()
+        for _ in self.channels:
+            self.signal_group.add_channel()
+
+        self.process = None
+        self.restarts = 0
+        self.missed = 0
+        self._read = np.zeros(len(self.channels), dtype = np.int64)
+        self._running = False
+
+    @property
+    def time_start(self):
+        return self.ring.time_start
+
+    @time_start.setter
+    def time_start(self, value):
+        self.ring.time_start = value
+
+    def start(self):
+        self._running = True
+        self._read[:] = self.ring.counts
+        self._spawn()
+
+    def _spawn(self):
+        self.ring.heartbeat()
+        self.process = multiprocessing.Process(target = _run_producer, args = (self.ring.name, self.target, self.args), daemon = True)
+        self.process.start()
+
+    def stop(self, timeout = 1.0):
+        self._running = False
+        if (self.process is not None and self.process.is_alive()):
+            self.process.terminate()
+            self.process.join(timeout)
+
+    def close(self):
+        self.stop()
+        self.live_signaldatas = []
+        self.ring.close()
+
+    def status(self):
+        if (self.process is None or not self._running):
+            return "stopped"
+        if (not self.process.is_alive()):
+            return "exited" if self.process.exitcode == 0 else "crashed"
+        if (time.time() - self.ring.get_heartbeat() > self.stall_timeout):
+            return "stalled"
+        return "running"
+
+    def check(self):
+        # Restarts a crashed or stalled producer, returns the status it had
+        status = self.status()
+        if (self.restart and status in ("crashed", "stalled")):
+            if (self.process.is_alive()):
+                self.process.terminate()
+                self.process.join(1.0)
+                if (self.process.is_alive()):
+                    self.process.kill()
+            self.restarts += 1
+            self._spawn()
+        return status
+
+    def commit_pending(self, time_start = 0.0):
+        # Called from the consumer thread, samples are stamped relative to time_start by the producer
+        self.check()
+
+        for i in range(len(self.channels)):
+            a, b = self.ring.get_range(i)
+            if (self._read[i] < a):
+                self.missed += a - int(self._read[i])
+                self._read[i] = a
+            if (self._read[i] >= b):
+                continue
+
+            views = self.ring.get_views(i, int(self._read[i]), b)
+            data = np.concatenate(views, axis = 1) if len(views) > 1 else np.array(views[0])
+            self._read[i] = b
+            self.signal_group.channel_handles[i].commit_data(data)
+
+    def stats(self):
+        return {
+            "status": self.status(),
+            "pid": None if self.process is None else self.process.pid,
+            "restarts": self.restarts,
+            "missed": self.missed,
+            "heartbeat_age": time.time() - self.ring.get_heartbeat(),
+            "samples": [int(count) for count in self.ring.counts],
+        }
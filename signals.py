@@ -1,17 +1,108 @@
 import numpy as np
-from numpy_ringbuffer import RingBuffer
 
-class SlightlyBetterRingBuffer(RingBuffer):
+from .export import export_csv
+from .fileformats import save_recording
+from .decimation import MinMaxPyramid
+from .stats import registry
+from .runningstats import RingStatistics
+
+class RingBuffer():
+    # Samples are stored as columns of a (rows, capacity) array, so the content is
+    # at most two contiguous views (one while it has not wrapped around)
+
+    def __init__(self, capacity, rows = 2, dtype = np.double, allow_overwrite = True):
+        self._data = np.empty((rows, capacity), dtype = dtype)
+        self._capacity = capacity
+        self._allow_overwrite = allow_overwrite
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def maxlen(self):
+        return self._capacity
+
+    @property
+    def is_full(self):
+        return self._size == self._capacity
+
+    @property
+    def free(self):
+        return self._capacity - self._size
+
+    @property
+    def allow_overwrite(self):
+        return self._allow_overwrite
+
+    @property
+    def write_position(self):
+        # Storage column the next sample goes to
+        return (self._start + self._size) % self._capacity
+
+    @property
+    def storage(self):
+        # The whole (rows, capacity) array in storage order, see write_position
+        return self._data
 
     def clear(self):
-        for _ in range(len(self)):
-            self.pop()
-    
+        self._start = 0
+        self._size = 0
+
     def extend(self, data):
-        super().extend(data.T)
-    
+        # data is (rows, n)
+        n = data.shape[1]
+        if (self._size + n > self._capacity and not self._allow_overwrite):
+            raise IndexError("extend a RingBuffer such that it would overflow, with overwrite disabled")
+
+        # Only the newest capacity samples survive
+        if (n >= self._capacity):
+            self._data[:, :] = data[:, n - self._capacity:]
+            self._start = 0
+            self._size = self._capacity
+            return
+
+        end = (self._start + self._size) % self._capacity
+        if (end + n <= self._capacity):
+            self._data[:, end:end+n] = data
+        else:
+            first = self._capacity - end
+            self._data[:, end:] = data[:, :first]
+            self._data[:, :n-first] = data[:, first:]
+
+        if (self._size + n > self._capacity):
+            self._start = (self._start + self._size + n - self._capacity) % self._capacity
+            self._size = self._capacity
+        else:
+            self._size += n
+
+    def get_views(self, i0 = 0, i1 = None):
+        # Samples i0..i1 (oldest is 0) as one or two views, no copy
+        if (i1 is None or i1 > self._size):
+            i1 = self._size
+        i0 = min(max(i0, 0), i1)
+
+        a = self._start + i0
+        b = self._start + i1
+        if (b <= self._capacity):
+            return (self._data[:, a:b],)
+        if (a >= self._capacity):
+            return (self._data[:, a-self._capacity:b-self._capacity],)
+        return (self._data[:, a:], self._data[:, :b-self._capacity])
+
+    def get_slice(self, i0 = 0, i1 = None):
+        # Contiguous samples i0..i1, only copied if they wrap around
+        views = self.get_views(i0, i1)
+        if (len(views) == 1):
+            return views[0]
+        return np.concatenate(views, axis = 1)
+
+    def get_last(self, k):
+        return self.get_slice(self._size - min(k, self._size))
+
     def get_data(self):
-        return np.array(self).T
+        return self.get_slice()
 
 class SignalHandle():
     def __init__(self):
@@ -30,6 +121,55 @@ class SignalHandle():
         for clear_method in self.clear_methods:
             if (clear_method is not None): clear_method()
 
+class SignalGroupHandle(SignalHandle):
+    # Fans out blocks of samples for several channels in one call. Listeners of the
+    # group itself receive the whole (M+1, N) block (time row + one row per channel),
+    # listeners of the channel handles receive their usual (2, N) slice.
+    def __init__(self, signal_handles = None):
+        super().__init__()
+        self.channel_handles = []
+
+        if (signal_handles is not None):
+            for signal_handle in signal_handles:
+                self.add_channel(signal_handle)
+
+    def add_channel(self, signal_handle = None):
+        if (signal_handle is None):
+            signal_handle = SignalHandle()
+
+        self.channel_handles.append(signal_handle)
+        return signal_handle
+
+    def commit_block(self, time, values):
+        # time is either (N,) shared by all channels or (M, N) with one timestamp row per channel
+        time = np.asarray(time, dtype = np.double)
+        values = np.asarray(values, dtype = np.double).reshape(len(self.channel_handles), -1)
+
+        if (time.ndim == 1):
+            data = np.empty((values.shape[0] + 1, values.shape[1]))
+            data[0, :] = time
+            data[1:, :] = values
+            self.commit_data(data)
+        else:
+            # The (2, N) blocks of all channels are built at once, each channel gets its own view
+            data = np.empty((values.shape[0], 2, values.shape[1]))
+            data[:, 0, :] = time
+            data[:, 1, :] = values
+            for i in range(len(self.channel_handles)):
+                self.channel_handles[i].commit_data(data[i])
+
+    def commit_data(self, data):
+        super().commit_data(data)
+
+        for i in range(len(self.channel_handles)):
+            self.channel_handles[i].commit_data(data[(0, i+1), :])
+
+    def clear_data(self):
+        super().clear_data()
+
+        for signal_handle in self.channel_handles:
+            signal_handle.clear_data()
+
 class DerivativeSignalHandle(SignalHandle):
     def __init__(self, signal_handle):
         super().__init__()
@@ -42,39 +182,119 @@ class DerivativeSignalHandle(SignalHandle):
         if (self._previous_value is None):
             self._previous_value = np.full((data.shape[0], 1), np.nan)
 
-        derivative_data = np.diff(data[1:, :], prepend = self._previous_value[1:, :]) / np.diff(data[0, :], prepend = self._previous_value[0, :])
-        super().commit_data(np.vstack( (data[0, :], derivative_data) ))
+        # A new array per block, listeners may keep the blocks they receive
+        rows, n = data.shape
+        out = np.empty((rows, n))
+
+        dt = np.empty(n)
+        dt[0] = data[0, 0] - self._previous_value[0, 0]
+        np.subtract(data[0, 1:], data[0, :-1], out = dt[1:])
+
+        out[0, :] = data[0, :]
+        out[1:, 0] = data[1:, 0] - self._previous_value[1:, 0]
+        np.subtract(data[1:, 1:], data[1:, :-1], out = out[1:, 1:])
+        out[1:, :] /= dt
+
+        super().commit_data(out)
             
-        self._previous_value = np.array([ data[:, -1] ]).T
+        self._previous_value = data[:, -1:].copy()
     
     def clear_data(self):
         super().clear_data()
         self._previous_value = None
 
+def _fit_block(ring, data, counts):
+    # Counts what a commit of data does to ring. Without overwrite, the samples that do not fit are
+    # dropped (and counted) instead of failing the whole commit for every listener.
+    n = data.shape[1]
+    counts["received"] += n
+    if (ring.allow_overwrite):
+        counts["overwritten"] += max(n - ring.free, 0)
+        return data
+
+    if (n > ring.free):
+        counts["dropped"] += n - ring.free
+        return data[:, :ring.free]
+    return data
+
+def _ring_stats(ring, counts):
+    return dict(counts, samples = len(ring), capacity = ring.maxlen, fill = len(ring) / ring.maxlen if ring.maxlen > 0 else 1.0)
+
 class SignalData():
     
-    def __init__(self, size, signal_handle, name = "", allow_overwrite = False, enabled = True):
+    def __init__(self, size, signal_handle, name = "", allow_overwrite = False, enabled = True, metadata = None, pyramid = False):
         self._name = name
+        self._metadata = {} if metadata is None else metadata
+
+        # Level of detail pyramid for plotting, only for buffers that are never overwritten. It is
+        # brought up to date with the buffer when requested, commits do not touch it.
+        self._pyramid = MinMaxPyramid() if (pyramid and not allow_overwrite) else None
+
+        # Bumped on every clear, get_version adds the received count so consumers can skip unchanged signals
+        self._version = 0
 
         # Create ringbuffer for storing the signal data
         self._enabled = enabled
-        self._data = SlightlyBetterRingBuffer(round(size), dtype = (np.double, 2), allow_overwrite = allow_overwrite)
+        self._data = RingBuffer(round(size), rows = 2, allow_overwrite = allow_overwrite)
+        self._counts = {"received": 0, "dropped": 0, "overwritten": 0}
+
+        # Statistics of the values in the buffer and of all values since the last clear
+        self._statistics = RingStatistics(self._data, rows = slice(1, 2))
         
         # Register callback to signal handle
         signal_handle.add_listener(self._data_callback, self._clear)
 
     def _data_callback(self, data):
         if (self._enabled):
+            data = _fit_block(self._data, data, self._counts)
+            if (data.shape[1] == 0):
+                return
+            self._statistics.before_extend(data.shape[1])
             self._data.extend(data)
+            self._statistics.after_extend(data)
 
     def set_enabled(self, enabled):
         self._enabled = enabled
     
     def get_data(self):
         return self._data.get_data()
+
+    def get_xy(self):
+        data = self._data.get_data()
+        return data[0, :], data[1, :]
+
+    def get_slice(self, i0, i1):
+        return self._data.get_slice(i0, i1)
+
+    def get_views(self):
+        return self._data.get_views()
+
+    def get_last(self, k):
+        return self._data.get_last(k)
+
+    def get_pyramid(self):
+        if (self._pyramid is not None and self._pyramid.count < len(self._data)):
+            self._pyramid.extend(self._data.get_slice(self._pyramid.count)[0, :])
+        return self._pyramid
+
+    def get_version(self):
+        return self._version + self._counts["received"]
+
+    def get_stats(self):
+        # Cumulative sample counts (not reset by clear) and the current fill level
+        return _ring_stats(self._data, self._counts)
+
+    def get_statistics(self):
+        # Count, mean, std, rms, min and max of the buffered values ("window") and of all values
+        # since the last clear ("total"), maintained as blocks are committed
+        return self._statistics.get()
     
     def clear(self):
         self._data.clear()
+        self._statistics.reset()
+        if (self._pyramid is not None):
+            self._pyramid.clear()
+        self._version += 1
 
     def _clear(self):
         if (self._enabled):
@@ -83,11 +303,139 @@ class SignalData():
     def get_name(self):
         return self._name
 
+    def get_metadata(self):
+        return self._metadata
+
+class SignalGroupData():
+    # Storage for channels committed together through a SignalGroupHandle: one shared time row
+    # and one (M, size) value matrix (optionally float32) instead of a (time, value) pair per signal.
+    # The channels are exposed as GroupChannelData so they can be registered like a SignalData.
+
+    def __init__(self, size, group_handle, names, allow_overwrite = False, enabled = True, metadatas = None, value_dtype = np.double, pyramid = False):
+        self._enabled = enabled
+        self._version = 0
+
+        self._time = RingBuffer(round(size), rows = 1, allow_overwrite = allow_overwrite)
+        self._values = RingBuffer(round(size), rows = len(names), dtype = value_dtype, allow_overwrite = allow_overwrite)
+        self._counts = {"received": 0, "dropped": 0, "overwritten": 0}
+        self._statistics = RingStatistics(self._values)
+
+        self.channels = []
+        for i in range(len(names)):
+            metadata = None if metadatas is None else metadatas[i]
+            self.channels.append(GroupChannelData(self, i, names[i], metadata, pyramid = (pyramid and not allow_overwrite)))
+
+        # Register callback to the group, receives (M+1, N) blocks
+        group_handle.add_listener(self._data_callback, self._clear)
+
+    def _data_callback(self, data):
+        if (self._enabled):
+            data = _fit_block(self._time, data, self._counts)
+            if (data.shape[1] == 0):
+                return
+            self._statistics.before_extend(data.shape[1])
+            self._time.extend(data[:1, :])
+            self._values.extend(data[1:, :])
+            self._statistics.after_extend(data[1:, :])
+
+            for channel in self.channels:
+                if (channel._pyramid is not None):
+                    channel._pyramid.extend(data[0, :])
+            self._version += 1
+
+    def set_enabled(self, enabled):
+        self._enabled = enabled
+
+    def get_time(self, i0 = 0, i1 = None):
+        return self._time.get_slice(i0, i1)[0, :]
+
+    def get_values(self, i0 = 0, i1 = None):
+        return self._values.get_slice(i0, i1)
+
+    def get_row(self, row, i0 = 0, i1 = None):
+        views = self._values.get_views(i0, i1)
+        if (len(views) == 1):
+            return views[0][row, :]
+        return np.concatenate([view[row, :] for view in views])
+
+    def __len__(self):
+        return len(self._time)
+
+    def get_stats(self):
+        return _ring_stats(self._time, self._counts)
+
+    def get_statistics(self, row):
+        return self._statistics.get(row)
+
+    def clear(self):
+        self._time.clear()
+        self._values.clear()
+        self._statistics.reset()
+        for channel in self.channels:
+            if (channel._pyramid is not None):
+                channel._pyramid.clear()
+        self._version += 1
+
+    def _clear(self):
+        if (self._enabled):
+            self.clear()
+
+class GroupChannelData():
+    # One channel of a SignalGroupData with the SignalData interface
+
+    def __init__(self, group, row, name, metadata = None, pyramid = False):
+        self.group = group
+        self.row = row
+        self._name = name
+        self._metadata = {} if metadata is None else metadata
+        self._pyramid = MinMaxPyramid() if pyramid else None
+
+    def set_enabled(self, enabled):
+        self.group.set_enabled(enabled)
+
+    def get_xy(self):
+        return self.group.get_time(), self.group.get_row(self.row)
+
+    def get_data(self):
+        return np.vstack(self.get_xy())
+
+    def get_slice(self, i0, i1):
+        return np.vstack((self.group.get_time(i0, i1), self.group.get_row(self.row, i0, i1)))
+
+    def get_views(self):
+        return (self.get_data(),)
+
+    def get_last(self, k):
+        n = len(self.group)
+        return self.get_slice(n - min(k, n), n)
+
+    def get_pyramid(self):
+        return self._pyramid
+
+    def get_version(self):
+        return self.group._version
+
+    def get_stats(self):
+        return self.group.get_stats()
+
+    def get_statistics(self):
+        return self.group.get_statistics(self.row)
+
+    def clear(self):
+        self.group.clear()
+
+    def get_name(self):
+        return self._name
+
+    def get_metadata(self):
+        return self._metadata
+
 class Sampler():
 
-    def __init__(self, size, continous = False, enabled = False):
+    def __init__(self, size, continous = False, enabled = False, pyramid = False):
         self.size = size
         self.continous = continous
+        self.pyramid = pyramid
         self.signaldatas = []
 
         self.enabled = enabled
@@ -102,49 +450,44 @@ class Sampler():
         for signaldata in self.signaldatas:
             signaldata.set_enabled(enabled)
 
-    def add_signal(self, signal_handle, name):
-        signaldata = SignalData(self.size, signal_handle, name = name, allow_overwrite = self.continous, enabled = self.enabled)
+    def add_signal(self, signal_handle, name, metadata = None):
+        signaldata = SignalData(self.size, signal_handle, name = name, allow_overwrite = self.continous, enabled = self.enabled, metadata = metadata, pyramid = self.pyramid)
         self.signaldatas.append(signaldata)
 
         return signaldata
 
-    def _combine_data(self):
-        N = len(self.signaldatas)
-        nr_var_total = N
-        nr_samp_total = 0
-
-        for i in range(N):
-            temp = self.signaldatas[i].get_data()
-            nr_samp_total += temp.shape[1]
-            #nr_samp_total += self.signaldatas[i].get_data()
-        
-        #print("Variables: ", nr_var_total, "\t Samples: ", nr_samp_total)
-        datamatrix = np.full((nr_var_total+1,nr_samp_total), np.nan) # +1 is time
-
-        r = 1
-        c = 0
-        for i in range(N):
-            vec = self.signaldatas[i].get_data()
-            nr_samples = vec.shape[1]
-            nr_variables = 1
+    def add_signal_group(self, group_handle, names, metadatas = None, value_dtype = np.double):
+        # Channels of the group share one timestamp row, returns one GroupChannelData per name
+        group = SignalGroupData(self.size, group_handle, names, allow_overwrite = self.continous, enabled = self.enabled, metadatas = metadatas, value_dtype = value_dtype, pyramid = self.pyramid)
+        self.signaldatas += group.channels
 
-            time = vec[0, :]
-            data = vec[1, :]
+        return group.channels
 
-            datamatrix[0, c:(c+nr_samples)] = time
-            datamatrix[r:(r+nr_variables), c:(c+nr_samples)] = data
+    def remove_signals(self, signaldatas):
+        # The list is replaced rather than changed in place, other threads may be iterating over it
+        self.signaldatas = [signaldata for signaldata in self.signaldatas if not any(signaldata is removed for removed in signaldatas)]
 
-            c += nr_samples
-            r += nr_variables
+    def get_statistics(self):
+        # Running statistics of every signal by name, see SignalData.get_statistics
+        return {signaldata.get_name(): signaldata.get_statistics() for signaldata in self.signaldatas}
 
-        # TODO change orientation of matrix from start....
-        datamatrix = datamatrix[:,:].transpose()
-        return datamatrix
+    def export_to_csv(self, filename, mode = "auto"):
+        names = [signaldata.get_name() for signaldata in self.signaldatas]
+        datas = [signaldata.get_data() for signaldata in self.signaldatas]
+        export_csv(filename, names, datas, mode = mode)
 
-    def export_to_csv(self, filename):
-        matrix = self._combine_data()
+    def snapshot(self):
+        # (names, datas, metadatas) with copies of the data, unaffected by later commits or a clear
+        # so it can be written on another thread while recording continues
+        names = [signaldata.get_name() for signaldata in self.signaldatas]
+        datas = [np.array(signaldata.get_data()) for signaldata in self.signaldatas]
+        metadatas = [dict(signaldata.get_metadata()) for signaldata in self.signaldatas]
+        return names, datas, metadatas
 
-        # Save to csv file
-        delimiter = ","
-        header = ["Time"] + [signaldata.get_name() for signaldata in self.signaldatas]
-        np.savetxt(filename, matrix, delimiter=delimiter, header=delimiter.join(header), comments="")
\ No newline at end of file
+    def export(self, filename, **kwargs):
+        # Format is picked from the extension (see fileformats.formats), unknown extensions are written as CSV
+        names = [signaldata.get_name() for signaldata in self.signaldatas]
+        datas = [signaldata.get_data() for signaldata in self.signaldatas]
+        metadatas = [signaldata.get_metadata() for signaldata in self.signaldatas]
+        with registry.timer("export_duration"):
+            save_recording(filename, names, datas, metadatas, **kwargs)
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+class SpectrumAnalyzer():
+    # Amplitude spectra of the last samples of several signals in one batched rfft. With averages > 1
+    # the spectrum is a Welch average over 50 % overlapping segments of n samples. Window and frequency
+    # arrays are reused between frames, compute() returns None while too few new samples have arrived.
+
+    def __init__(self, n = 1024, averages = 1, hop = None, window = np.hanning):
+        self.n = n
+        self.averages = averages
+        self.step = n // 2
+        self.hop = n // 4 if hop is None else hop # New samples needed before recomputing
+        self._window = window(n)
+        self._scale = 2 / self._window.sum()
+        self._base_freqs = np.fft.rfftfreq(n)
+
+        self._last_time = None
+        self.result = None
+
+    @property
+    def length(self):
+        # Samples needed per signal
+        return self.n + self.step * (self.averages - 1)
+
+    def is_due(self, newest_time, sample_period):
+        if (self._last_time is None or newest_time < self._last_time):
+            return True
+        return (newest_time - self._last_time) >= self.hop * sample_period
+
+    def compute(self, datas, force = False):
+        # datas are (2, k) arrays (time, value), only the last length samples are used.
+        # Returns (freqs, amplitudes) with amplitudes (M, n//2+1), signals without enough samples are NaN.
+        datas = [data for data in datas]
+        if (len(datas) == 0):
+            return None
+
+        reference = max(datas, key = lambda data: data.shape[1])
+        if (reference.shape[1] < 2):
+            return None
+
+        sample_period = np.median(np.diff(reference[0, -min(reference.shape[1], 64):]))
+        if (not sample_period > 0):
+            return None
+        if (not force and not self.is_due(reference[0, -1], sample_period)):
+            return None
+        self._last_time = reference[0, -1]
+
+        amplitudes = np.full((len(datas), len(self._base_freqs)), np.nan)
+        ready = [i for i in range(len(datas)) if datas[i].shape[1] >= self.length]
+        if (len(ready) > 0):
+            block = np.stack([datas[i][1, -self.length:] for i in ready])
+
+            # (M, averages, n) segments without copying, then one rfft for everything
+            segments = np.lib.stride_tricks.sliding_window_view(block, self.n, axis = 1)[:, ::self.step, :]
+            segments = segments - segments.mean(axis = 2, keepdims = True)
+            spectra = np.fft.rfft(segments * self._window, axis = 2)
+
+            power = (spectra.real**2 + spectra.imag**2).mean(axis = 1)
+            amplitudes[ready, :] = np.sqrt(power) * self._scale
+
+        self.result = (self._base_freqs / sample_period, amplitudes)
+        return self.result
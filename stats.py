@@ -0,0 +1,184 @@
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from .acquisition import PeriodicThread
+
+
+class Histogram():
+    # Logarithmic bins (powers of two above lowest), constant time and memory per observation.
+    # Percentiles are reported as the upper edge of their bin, so within a factor of two.
+
+    def __init__(self, lowest = 1e-6, bins = 40):
+        self.lowest = lowest
+        self.bins = [0] * bins
+        self.reset()
+
+    def reset(self):
+        self.bins = [0] * len(self.bins)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value):
+        if (value > self.lowest):
+            index = min(int(math.log2(value / self.lowest)) + 1, len(self.bins) - 1)
+        else:
+            index = 0
+        self.bins[index] += 1
+
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count > 0 else None
+
+    def percentile(self, q):
+        if (self.count == 0):
+            return None
+
+        rank = q / 100 * self.count
+        cumulative = 0
+        for i in range(len(self.bins)):
+            cumulative += self.bins[i]
+            if (cumulative >= rank):
+                return min(self.lowest * 2**i, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min if self.count > 0 else None,
+            "max": self.max if self.count > 0 else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class Stats():
+    # Runtime counters and histograms of the monitor pipeline. Hot paths only bump counters
+    # (count/observe); buffer levels are pulled from the registered samplers when a snapshot is taken
+    # and per signal ingest rates are computed from the received counts between snapshots. Every
+    # consumer (the UI stats box, a dump thread) passes its own name, so each gets the rates since
+    # its own previous snapshot.
+    #
+    # Names used by the package:
+    #   counters:   frames, frames_over_budget
+    #   histograms: frame_time, commit_duration, commit_latency, export_duration (all seconds)
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.samplers = {}
+        self.sources = {}
+
+        self._lock = threading.Lock()
+        self._received = {} # consumer -> {(sampler, signal): (time, received)} at its previous snapshot
+        self._dump_thread = None
+        self.created = time.time()
+
+    def count(self, name, n = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def observe_age(self, name, timestamp):
+        # Age of a time.time() timestamp, e.g. how old the newest sample of a block is when committed
+        self.observe(name, time.time() - timestamp)
+
+    @contextmanager
+    def timer(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def add_sampler(self, name, sampler):
+        self.samplers[name] = sampler
+
+    def add_source(self, name, stats_func):
+        # stats_func returns a dict, e.g. AcquisitionThread.stats or SerialSource.stats
+        self.sources[name] = stats_func
+
+    def remove_source(self, name):
+        self.sources.pop(name, None)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self._received = {}
+
+    def _buffer_stats(self, now, consumer):
+        # Called with the lock held, signals no longer registered are dropped from the consumer's window
+        previous_received = self._received.get(consumer, {})
+        received = {}
+        buffers = {}
+        for sampler_name, sampler in list(self.samplers.items()):
+            signals = {}
+            for signaldata in sampler.signaldatas:
+                name = signaldata.get_name()
+                entry = signaldata.get_stats()
+
+                key = (sampler_name, name)
+                previous = previous_received.get(key)
+                if (previous is not None and now > previous[0]):
+                    entry["rate"] = (entry["received"] - previous[1]) / (now - previous[0])
+                else:
+                    entry["rate"] = None
+                received[key] = (now, entry["received"])
+
+                signals[name] = entry
+            buffers[sampler_name] = signals
+
+        self._received[consumer] = received
+        return buffers
+
+    def snapshot(self, consumer = None):
+        now = time.time()
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {name: histogram.summary() for name, histogram in self.histograms.items()}
+            buffers = self._buffer_stats(now, consumer)
+
+        return {
+            "time": now,
+            "uptime": now - self.created,
+            "counters": counters,
+            "histograms": histograms,
+            "buffers": buffers,
+            "sources": {name: stats_func() for name, stats_func in list(self.sources.items())},
+        }
+
+    def dump(self, filename):
+        # Appends one JSON line per snapshot, rates are since the previous dump to the same file
+        with open(filename, "a") as file:
+            file.write(json.dumps(self.snapshot(consumer = filename)) + "\n")
+
+    def start_dump(self, filename, interval = 5.0):
+        self.stop_dump()
+        self._dump_thread = PeriodicThread(lambda: self.dump(filename), interval)
+        self._dump_thread.start()
+
+    def stop_dump(self):
+        if (self._dump_thread is not None):
+            self._dump_thread.stop()
+            self._dump_thread = None
+
+
+# Shared by all parts of the package
+registry = Stats()
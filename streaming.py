@@ -0,0 +1,319 @@
+import json
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque
+import numpy as np
+
+from .signals import SignalGroupHandle
+
+# Every frame is a header (type, channel, payload length) followed by the payload:
+#   CHANNELS  server -> client  JSON {"channels": [{"name", "metadata"}], "time_start"}
+#   DATA      server -> client  n float64 times followed by n float64 values of one channel
+#   SUBSCRIBE client -> server  JSON list of channel names, empty for all
+frame_header = struct.Struct("<BHI")
+CHANNELS = 1
+DATA = 2
+SUBSCRIBE = 3
+
+
+def encode_frame(frame_type, channel, payload):
+    return frame_header.pack(frame_type, channel, len(payload)) + payload
+
+
+def encode_block(channel, data, step = 1):
+    # (2, N) block, every step-th sample
+    return encode_frame(DATA, channel, np.ascontiguousarray(data[:, ::step], dtype = "<f8").tobytes())
+
+
+def _recv_exact(sock, n):
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(n)
+        if (not chunk):
+            raise ConnectionError("connection closed")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(sock):
+    frame_type, channel, length = frame_header.unpack(_recv_exact(sock, frame_header.size))
+    return frame_type, channel, _recv_exact(sock, length)
+
+
+def _create_socket(address):
+    # A (host, port) tuple is TCP, a string is the path of a Unix socket
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+class StreamSubscriber(threading.Thread):
+    # One connected client: frames are queued by the publishing thread (never blocking it) and sent
+    # from this thread. Past half of max_queue the blocks are decimated (every 2nd, past three quarters
+    # every 4th sample), a full queue drops its oldest frames.
+
+    def __init__(self, server, sock, address):
+        super().__init__(daemon = True)
+        self.server = server
+        self.sock = sock
+        self.address = address
+
+        self.subscriptions = set(range(len(server.names)))
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._running = True
+
+        self.frames = 0
+        self.bytes = 0
+        self.samples = 0
+        self.dropped = 0
+        self.decimated = 0
+        self.connected = time.time()
+
+    def decimation(self):
+        fill = len(self._queue) / self.server.max_queue
+        if (fill >= 0.75):
+            return 4
+        if (fill >= 0.5):
+            return 2
+        return 1
+
+    def put(self, channel, frame, samples, step):
+        if (len(self._queue) >= self.server.max_queue):
+            self._queue.popleft()
+            self.dropped += 1
+        if (step > 1):
+            self.decimated += 1
+        self._queue.append((time.time(), frame, samples))
+        self._wakeup.set()
+
+    def run(self):
+        try:
+            self.sock.sendall(self.server.channels_frame())
+            while self._running:
+                self._receive()
+                self._wakeup.wait(0.1)
+                self._wakeup.clear()
+                while self._queue:
+                    _, frame, samples = self._queue.popleft()
+                    self.sock.sendall(frame)
+                    self.frames += 1
+                    self.bytes += len(frame)
+                    self.samples += samples
+        except OSError:
+            pass
+        finally:
+            self._running = False
+            self.sock.close()
+            self.server._remove(self)
+
+    def _receive(self):
+        # Subscription changes, without blocking the sending
+        while select.select([self.sock], [], [], 0)[0]:
+            frame_type, _, payload = read_frame(self.sock)
+            if (frame_type == SUBSCRIBE):
+                names = json.loads(payload.decode())
+                if (len(names) == 0):
+                    self.subscriptions = set(range(len(self.server.names)))
+                else:
+                    self.subscriptions = {self.server.names.index(name) for name in names if name in self.server.names}
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+
+    def stats(self):
+        elapsed = max(time.time() - self.connected, 1e-9)
+        oldest = self._queue[0][0] if self._queue else None
+        return {
+            "address": str(self.address),
+            "subscriptions": [self.server.names[i] for i in sorted(self.subscriptions)],
+            "frames": self.frames,
+            "bytes_per_s": self.bytes / elapsed,
+            "samples_per_s": self.samples / elapsed,
+            "queued": len(self._queue),
+            "lag": 0.0 if oldest is None else time.time() - oldest,
+            "dropped": self.dropped,
+            "decimated": self.decimated,
+        }
+
+
+class StreamServer(threading.Thread):
+    # Publishes committed blocks of signal handles to clients on a local TCP or Unix socket (see
+    # StreamClient). Blocks are encoded once per decimation step, the committing thread only appends
+    # them to the bounded queues of the subscribed clients. Channels are published before start.
+
+    def __init__(self, address = ("127.0.0.1", 0), max_queue = 256, time_start = None):
+        super().__init__(daemon = True)
+
+        self.names = []
+        self.metadatas = []
+        self.max_queue = max_queue
+        self.time_start = time.time() if time_start is None else time_start
+        self.subscribers = []
+        self._lock = threading.Lock()
+
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+        self._sock = _create_socket(address)
+        if (not isinstance(address, str)):
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(address)
+        self._sock.listen()
+        self.address = self._sock.getsockname()
+        self._running = True
+
+    def publish(self, name, signal_handle, metadata = None):
+        channel = len(self.names)
+        self.names.append(name)
+        self.metadatas.append({} if metadata is None else metadata)
+        signal_handle.add_listener(lambda data: self._data_callback(channel, data))
+
+    def channels_frame(self):
+        header = {"channels": [{"name": name, "metadata": metadata} for name, metadata in zip(self.names, self.metadatas)], "time_start": self.time_start}
+        return encode_frame(CHANNELS, 0, json.dumps(header).encode())
+
+    def _data_callback(self, channel, data):
+        frames = {}
+        for subscriber in list(self.subscribers):
+            if (channel not in subscriber.subscriptions):
+                continue
+
+            step = subscriber.decimation()
+            if (step not in frames):
+                frames[step] = encode_block(channel, data, step)
+            subscriber.put(channel, frames[step], -(-data.shape[1] // step), step)
+
+    def run(self):
+        while self._running:
+            try:
+                sock, address = self._sock.accept()
+            except OSError:
+                break
+
+            subscriber = StreamSubscriber(self, sock, address)
+            with self._lock:
+                self.subscribers = self.subscribers + [subscriber]
+            subscriber.start()
+
+    def _remove(self, subscriber):
+        with self._lock:
+            self.subscribers = [s for s in self.subscribers if s is not subscriber]
+
+    def stop(self):
+        self._running = False
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        for subscriber in list(self.subscribers):
+            subscriber.stop()
+        if (isinstance(self.address, str) and os.path.exists(self.address)):
+            os.remove(self.address)
+
+    def stats(self):
+        return {"clients": [subscriber.stats() for subscriber in list(self.subscribers)]}
+
+
+class StreamClient():
+    # Receives the channels of a StreamServer on a background thread, a source for Monitor.add_source
+    # (or read the blocks with drain). channels can subscribe to a subset by name. Timestamps are converted
+    # from the server's time_start to the time_start passed to commit_pending.
+
+    shared_timebase = False
+
+    def __init__(self, address, channels = None):
+        self.address = address
+        self._sock = _create_socket(address)
+        self._sock.connect(address)
+
+        frame_type, _, payload = read_frame(self._sock)
+        if (frame_type != CHANNELS):
+            raise ConnectionError("Expected the channel list from the server")
+        header = json.loads(payload.decode())
+        self.server_channels = [entry["name"] for entry in header["channels"]]
+        self.server_time_start = header["time_start"]
+
+        self.channels = list(self.server_channels if channels is None else channels)
+        self.metadatas = [header["channels"][self.server_channels.index(name)]["metadata"] for name in self.channels]
+        self._index = {self.server_channels.index(name): i for i, name in enumerate(self.channels)}
+        self._sock.sendall(encode_frame(SUBSCRIBE, 0, json.dumps([] if channels is None else self.channels).encode()))
+
+        self.signal_group = SignalGroupHandle()
+        for _ in self.channels:
+            self.signal_group.add_channel()
+
+        self._blocks = deque()
+        self._thread = None
+        self._running = False
+        self.error = None
+
+        self.samples = 0
+        self.bytes = 0
+        self.last_time = None
+        self._connected = time.time()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target = self._run_thread, daemon = True)
+        self._thread.start()
+
+    def stop(self, timeout = 1.0):
+        self._running = False
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        if (self._thread is not None and self._thread.is_alive()):
+            self._thread.join(timeout)
+
+    def _run_thread(self):
+        try:
+            while self._running:
+                frame_type, channel, payload = read_frame(self._sock)
+                if (frame_type != DATA or channel not in self._index):
+                    continue
+
+                data = np.frombuffer(payload, dtype = "<f8").reshape(2, -1)
+                self._blocks.append((self._index[channel], data))
+                self.samples += data.shape[1]
+                self.bytes += len(payload) + frame_header.size
+                if (data.shape[1] > 0):
+                    self.last_time = data[0, -1]
+        except (OSError, ConnectionError) as e:
+            if (self._running):
+                self.error = e
+        self._running = False
+
+    def drain(self):
+        blocks = []
+        while self._blocks:
+            blocks.append(self._blocks.popleft())
+        return blocks
+
+    def commit_pending(self, time_start = None):
+        # Called from the consumer thread
+        offset = 0.0 if time_start is None else self.server_time_start - time_start
+        for i, data in self.drain():
+            if (offset != 0.0):
+                data = np.vstack((data[0, :] + offset, data[1, :]))
+            self.signal_group.channel_handles[i].commit_data(data)
+
+    def stats(self):
+        elapsed = max(time.time() - self._connected, 1e-9)
+        return {
+            "connected": self._running,
+            "samples_per_s": self.samples / elapsed,
+            "bytes_per_s": self.bytes / elapsed,
+            "lag": None if self.last_time is None else time.time() - (self.server_time_start + self.last_time),
+            "pending_blocks": len(self._blocks),
+        }
@@ -0,0 +1,8 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture(params = [0, 1, 2])
+def rng(request):
+    # Checks on random blocks run for a few fixed seeds
+    return np.random.default_rng(request.param)
@@ -0,0 +1,76 @@
+import numpy as np
+
+from ..compression import Deadband, SwingingDoor
+
+
+def _compress(compression, t, y, rng):
+    # Applies compression to random blocks of (t, y) and flushes, checks the result does not depend on the blocks
+    bounds = np.unique(np.concatenate(([0, len(t)], rng.integers(0, len(t), 20))))
+    parts = [compression.apply(t[a:b], y[a:b]) for a, b in zip(bounds[:-1], bounds[1:])] + [compression.flush()]
+    t_kept = np.concatenate([part[0] for part in parts])
+    y_kept = np.concatenate([part[1] for part in parts])
+
+    compression.reset()
+    whole = [compression.apply(t, y), compression.flush()]
+    assert np.array_equal(t_kept, np.concatenate([part[0] for part in whole])), "result depends on the block boundaries"
+
+    assert np.all(np.diff(t_kept) > 0), "kept samples out of order"
+    assert np.all(np.isin(t_kept, t)), "kept sample that was not received"
+    assert t_kept[0] == t[0] and t_kept[-1] == t[-1], "first or last sample not kept"
+    return t_kept, y_kept
+
+
+def test_compression(rng):
+    n = 5000
+    t = np.arange(n) * 0.01
+    walk = np.cumsum(rng.normal(scale = 0.01, size = n))
+
+    # Swinging door: the interpolation stays within twice the deviation of every sample
+    for deviation in (0.001, 0.01, 0.1):
+        t_kept, y_kept = _compress(SwingingDoor(deviation), t, walk, rng)
+        error = np.abs(np.interp(t, t_kept, y_kept) - walk).max()
+        assert error <= 2 * deviation + 1e-12, "swinging door error %g for deviation %g" % (error, deviation)
+        assert len(t_kept) < n
+
+    # A straight line only needs its end points
+    t_kept, _ = _compress(SwingingDoor(1e-6), t, 3.0 * t + 1.0, rng)
+    assert len(t_kept) == 2, "%d samples kept of a line" % len(t_kept)
+
+    # Deadband: holding the last kept value stays within the threshold
+    for threshold in (0.01, 0.1):
+        t_kept, y_kept = _compress(Deadband(threshold), t, walk, rng)
+        held = y_kept[np.searchsorted(t_kept, t, side = "right") - 1]
+        error = np.abs(held - walk).max()
+        assert error <= threshold, "deadband error %g for threshold %g" % (error, threshold)
+
+    # max_interval forces a sample at least that often
+    for compression in (SwingingDoor(1.0, max_interval = 0.5), Deadband(1.0, max_interval = 0.5)):
+        t_kept, _ = _compress(compression, t, np.zeros(n), rng)
+        assert np.diff(t_kept).max() <= 0.5 + 1e-9, "max_interval exceeded by %s" % type(compression).__name__
+
+    # A gap (NaN) is kept where it starts and ends, interpolation also needs the last sample before it
+    gap = walk.copy()
+    gap[2000:2500] = np.nan
+    for compression, required in ((SwingingDoor(0.01), (1999, 2000, 2500)), (Deadband(0.01), (2000, 2500))):
+        t_kept, y_kept = _compress(compression, t, gap, rng)
+        for i in required:
+            assert t[i] in t_kept, "%s did not keep sample %d around the gap" % (type(compression).__name__, i)
+        assert np.all(np.isnan(y_kept[(t_kept >= t[2000]) & (t_kept < t[2500])]))
+
+
+def test_skip_matches_plain_loop(rng):
+    # Runs skipped with numpy keep the same samples as deciding every sample with _add
+    n = 5000
+    t = np.cumsum(rng.choice([0.01, 0.0], size = n, p = [0.95, 0.05]))
+    y = np.cumsum(rng.normal(scale = 0.01, size = n))
+    y[1000:1100] = np.nan
+    for make in (lambda: Deadband(0.1, max_interval = 3.0), lambda: SwingingDoor(0.1, max_interval = 3.0)):
+        plain = make()
+        plain.skip_after = n
+        results = []
+        for compression in (make(), plain):
+            parts = [compression.apply(t[a:a+700], y[a:a+700]) for a in range(0, n, 700)] + [compression.flush()]
+            results.append([np.concatenate([part[i] for part in parts]) for i in range(2)])
+        assert len(results[0][0]) < n / 10
+        assert np.array_equal(results[0][0], results[1][0])
+        assert np.array_equal(results[0][1], results[1][1], equal_nan = True)
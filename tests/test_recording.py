@@ -0,0 +1,27 @@
+import numpy as np
+
+from ..signals import SignalHandle
+from ..recording import DiskSampler
+from ..fileformats import load_recording
+
+
+def test_clear_keeps_snapshot(tmp_path):
+    sampler = DiskSampler(str(tmp_path), enabled = True)
+    signal_handle = SignalHandle()
+    sampler.add_signal(signal_handle, "s")
+
+    data = np.vstack((np.arange(1000.0), np.ones(1000)))
+    signal_handle.commit_data(data)
+    names, datas, metadatas = sampler.snapshot()
+
+    # Clearing the signal alone (clear_data path) starts a new file instead of truncating the mapped one
+    signal_handle.clear_data()
+    signal_handle.commit_data(2 * data[:, :10])
+    np.testing.assert_array_equal(datas[0], data)
+
+    sampler.writer.flush()
+    folder = sampler.get_folder()
+    sampler.close()
+    recording = load_recording(folder)
+    np.testing.assert_array_equal(recording["s"].get_data(), 2 * data[:, :10])
+    recording.close()
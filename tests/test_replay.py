@@ -0,0 +1,50 @@
+import os
+import time
+import numpy as np
+
+from ..signals import SignalGroupHandle, Sampler
+from ..replay import RecordingReplay
+
+
+def _replay(tmp_path, speed):
+    # One signal sampled at 1 kHz for 10 s
+    sampler = Sampler(10000, enabled = True)
+    group = SignalGroupHandle()
+    sampler.add_signal(group.add_channel(), "s")
+    group.commit_block(np.arange(10000) * 1e-3, np.zeros((1, 10000)))
+    filename = os.path.join(str(tmp_path), "replay.mrec")
+    sampler.export(filename)
+
+    replay = RecordingReplay(filename, speed = speed, block_duration = 0.01)
+    live = Sampler(10000, continous = True, enabled = True)
+    signaldata = live.add_signal(replay.signal_group.channel_handles[0], "s")
+    return replay, signaldata
+
+
+def test_seek_clears_downstream(tmp_path):
+    replay, signaldata = _replay(tmp_path, None)
+    replay.step(5.0)
+    assert signaldata.get_data().shape[1] == 5000
+
+    replay.seek(1.0)
+    replay.step(0.5)
+    data = signaldata.get_data()
+    np.testing.assert_array_equal(data[0], np.arange(1000, 1500) * 1e-3)
+
+
+def test_seek_while_replaying(tmp_path):
+    replay, signaldata = _replay(tmp_path, 1.0)
+    replay.start()
+    time.sleep(0.1)
+    replay.commit_pending()
+
+    # A seek ahead is not played as fast as possible to catch up with the time the replay started at
+    replay.seek(8.0)
+    time.sleep(0.1)
+    replay.stop()
+    replay.commit_pending()
+
+    t = signaldata.get_data()[0]
+    assert t[0] >= 8.0
+    assert np.all(np.diff(t) > 0)
+    assert t[-1] < 8.5
@@ -0,0 +1,83 @@
+import numpy as np
+
+from ..serial_source import FrameLayout, checksums
+
+
+def _encode_frames(layout, values):
+    # values is (n, fields), returns the bytes of n valid frames
+    frames = np.zeros(values.shape[0], dtype = layout.dtype)
+    if (len(layout.sync) > 0):
+        frames["sync"] = layout.sync
+    for j in range(len(layout.names)):
+        frames[layout.names[j]] = values[:, j]
+    if (layout.checksum is not None):
+        raw = frames.view(np.uint8).reshape(-1, layout.size)
+        checksum_size = layout.dtype["checksum"].itemsize
+        frames["checksum"] = checksums[layout.checksum][0](raw[:, len(layout.sync):layout.size - checksum_size])
+    return frames.tobytes()
+
+
+def _decode_chunks(layout, stream, chunk_sizes):
+    # Decodes stream in chunks like SerialSource, the unconsumed bytes are kept for the next chunk
+    records = []
+    resyncs = 0
+    errors = 0
+    pending = b""
+    position = 0
+    for size in chunk_sizes:
+        pending += stream[position:position + size]
+        position += size
+        chunk, consumed, chunk_resyncs, chunk_errors = layout.decode(pending)
+        pending = pending[consumed:]
+        records.append(chunk)
+        resyncs += chunk_resyncs
+        errors += chunk_errors
+    return np.concatenate(records), resyncs, errors
+
+
+def test_frame_decode(rng):
+    fields = [("t", "I"), ("a", "f"), ("b", "h")]
+    for checksum in [None] + list(checksums):
+        layout = FrameLayout(fields, checksum = checksum)
+        n = 200
+        values = np.stack((np.arange(n), rng.normal(size = n).astype(np.float32), rng.integers(-1000, 1000, n)), axis = 1)
+        frames = [_encode_frames(layout, values[i:i+1]) for i in range(n)]
+
+        # Clean stream, decoded whole and in random chunks
+        stream = b"".join(frames)
+        records, consumed, resyncs, errors = layout.decode(stream)
+        assert consumed == len(stream) and resyncs == 0 and errors == 0
+        assert np.array_equal(records["t"], values[:, 0])
+        assert np.array_equal(records["a"], values[:, 1].astype(np.float32))
+        assert np.array_equal(records["b"], values[:, 2])
+
+        chunked, _, _ = _decode_chunks(layout, stream, rng.integers(1, 3 * layout.size, size = len(stream)))
+        assert np.array_equal(chunked, records), "chunked decode differs (%s)" % checksum
+
+        # Garbage between frames (without sync bytes) costs a resync each, no frames are lost. In chunks
+        # a run of garbage split over several chunks is resynced in each of them.
+        garbage = {i for i in rng.choice(n, 10, replace = False)}
+        noise = lambda: bytes(rng.choice(np.arange(0x00, 0xaa, dtype = np.uint8), int(rng.integers(1, 2 * layout.size))))
+        stream = b"".join([noise() + frames[i] if i in garbage else frames[i] for i in range(n)])
+        records, consumed, resyncs, errors = layout.decode(stream)
+        assert np.array_equal(records["t"], values[:, 0]), "frames lost around garbage (%s)" % checksum
+        assert resyncs == len(garbage) and errors == 0, "%d resyncs for %d garbage runs" % (resyncs, len(garbage))
+
+        records, resyncs, errors = _decode_chunks(layout, stream, rng.integers(1, 4 * layout.size, size = len(stream)))
+        assert np.array_equal(records["t"], values[:, 0]), "frames lost around garbage in chunks (%s)" % checksum
+        assert resyncs >= len(garbage) and errors == 0
+
+        if (checksum is None):
+            continue
+
+        # A flipped payload bit drops exactly that frame
+        corrupted = {i for i in rng.choice(n, 10, replace = False)}
+        broken = []
+        for i in range(n):
+            frame = bytearray(frames[i])
+            if (i in corrupted):
+                frame[len(layout.sync) + int(rng.integers(0, 4))] ^= 1 << int(rng.integers(0, 8))
+            broken.append(bytes(frame))
+        records, consumed, resyncs, errors = layout.decode(b"".join(broken))
+        assert errors == len(corrupted), "%d checksum errors for %d corrupted frames (%s)" % (errors, len(corrupted), checksum)
+        assert np.array_equal(records["t"], np.delete(values[:, 0], sorted(corrupted))), "wrong frames dropped (%s)" % checksum
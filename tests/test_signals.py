@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from ..signals import RingBuffer, SignalData, SignalHandle, _fit_block
+
+
+def test_ringbuffer(rng):
+    # Random block sizes, including empty blocks and blocks larger than the ring, against the newest
+    # capacity samples of everything appended
+    for capacity in (1, 2, 7, 64):
+        ring = RingBuffer(capacity)
+        reference = np.empty((2, 0))
+        for _ in range(300):
+            block = rng.normal(size = (2, int(rng.integers(0, 2 * capacity + 2))))
+            ring.extend(block)
+            reference = np.concatenate((reference, block), axis = 1)[:, -capacity:]
+
+            size = reference.shape[1]
+            assert len(ring) == size, "size %d != %d" % (len(ring), size)
+            assert ring.is_full == (size == capacity)
+            assert ring.free == capacity - size
+            assert ring.write_position == (ring._start + size) % capacity
+            assert np.array_equal(ring.get_data(), reference), "content differs at capacity %d" % capacity
+
+            k = int(rng.integers(0, capacity + 2))
+            assert np.array_equal(ring.get_last(k), reference[:, size - min(k, size):]), "get_last(%d) differs" % k
+
+            # Views are at most two, never copies, and join to the requested range
+            i1 = int(rng.integers(0, capacity + 2))
+            i0 = int(rng.integers(-1, capacity + 2))
+            views = ring.get_views(i0, i1)
+            assert 1 <= len(views) <= 2
+            assert all(np.shares_memory(view, ring.storage) for view in views if view.size > 0)
+            expected = reference[:, max(i0, 0):min(i1, size)]
+            assert np.array_equal(np.concatenate(views, axis = 1), expected), "get_views(%d, %d) differs" % (i0, i1)
+
+    # get_last across the seam of a wrapped ring
+    ring = RingBuffer(8)
+    ring.extend(np.vstack((np.arange(6.0), np.arange(6.0))))
+    ring.extend(np.vstack((np.arange(6.0, 11.0), np.arange(6.0, 11.0))))
+    assert len(ring.get_views()) == 2
+    assert np.array_equal(ring.get_last(5)[0], [6.0, 7.0, 8.0, 9.0, 10.0])
+    assert np.array_equal(ring.get_data()[0], np.arange(3.0, 11.0))
+
+    ring.clear()
+    assert len(ring) == 0 and ring.get_data().shape == (2, 0)
+
+
+def test_fit_block(rng):
+    # Without overwrite a commit keeps the samples that fit and counts the rest as dropped,
+    # a direct extend that would overflow raises
+    capacity = 10
+    ring = RingBuffer(capacity, allow_overwrite = False)
+    counts = {"received": 0, "dropped": 0, "overwritten": 0}
+    stored = 0
+    dropped = 0
+    for n in (0, 4, 5, 3, 7, 1):
+        block = rng.normal(size = (2, n))
+        fitted = _fit_block(ring, block, counts)
+        assert np.array_equal(fitted, block[:, :capacity - stored]), "fitted block of %d differs" % n
+        dropped += n - fitted.shape[1]
+        ring.extend(fitted)
+        stored += fitted.shape[1]
+        assert len(ring) == stored
+    assert counts == {"received": 20, "dropped": dropped, "overwritten": 0}, counts
+
+    with pytest.raises(IndexError):
+        ring.extend(np.zeros((2, 1)))
+
+    # With overwrite everything is kept and the evicted samples are counted
+    ring = RingBuffer(capacity)
+    counts = {"received": 0, "dropped": 0, "overwritten": 0}
+    for n in (6, 6, 25):
+        block = rng.normal(size = (2, n))
+        assert _fit_block(ring, block, counts) is block
+        ring.extend(block)
+    assert counts == {"received": 37, "dropped": 0, "overwritten": 27}, counts
+
+
+def test_signaldata_bookkeeping(rng):
+    # Statistics, pyramid and version are only brought up to date when read
+    for overwrite in (True, False):
+        signal_handle = SignalHandle()
+        signaldata = SignalData(500, signal_handle, allow_overwrite = overwrite, pyramid = True)
+        version = signaldata.get_version()
+        committed = []
+        t = 0
+        for k in range(200):
+            n = 700 if k == 100 else int(rng.integers(1, 40))
+            y = rng.normal(size = n)
+            committed.append(y)
+            signal_handle.commit_data(np.vstack((t + np.arange(n), y)))
+            t += n
+            if (rng.random() > 0.2):
+                continue
+
+            data = signaldata.get_data()
+            statistics = signaldata.get_statistics()
+            assert statistics["window"]["count"] == data.shape[1]
+            assert np.isclose(statistics["window"]["mean"], data[1].mean())
+            assert statistics["window"]["max"] == data[1].max()
+            if (overwrite):
+                values = np.concatenate(committed)
+                assert statistics["total"]["count"] == len(values)
+                assert np.isclose(statistics["total"]["mean"], values.mean())
+            else:
+                pyramid = signaldata.get_pyramid()
+                assert pyramid.count == data.shape[1]
+                assert pyramid.x_last == data[0, -1]
+
+            assert signaldata.get_version() != version
+            version = signaldata.get_version()
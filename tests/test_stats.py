@@ -0,0 +1,26 @@
+import time
+import numpy as np
+
+from ..signals import SignalHandle, Sampler
+from ..stats import Stats
+
+
+def test_rates_per_consumer():
+    stats = Stats()
+    sampler = Sampler(1000, enabled = True)
+    signal_handle = SignalHandle()
+    sampler.add_signal(signal_handle, "s")
+    stats.add_sampler("live", sampler)
+
+    stats.snapshot(consumer = "a")
+    stats.snapshot(consumer = "b")
+    signal_handle.commit_data(np.zeros((2, 100)))
+    time.sleep(0.01)
+
+    # A snapshot taken by one consumer does not restart the rate window of the other
+    assert stats.snapshot(consumer = "a")["buffers"]["live"]["s"]["rate"] > 0
+    assert stats.snapshot(consumer = "b")["buffers"]["live"]["s"]["rate"] > 0
+
+    sampler.remove_signals(sampler.signaldatas)
+    stats.snapshot(consumer = "a")
+    assert stats._received["a"] == {}
@@ -0,0 +1,51 @@
+import numpy as np
+
+from ..signals import SignalGroupHandle, Sampler
+from ..trigger import Threshold, TriggerRecorder
+
+
+def _recorder(events):
+    # Two ungrouped signals committed together, y is stored after the listeners of x have run
+    group_handle = SignalGroupHandle()
+    x_handle = group_handle.add_channel()
+    y_handle = group_handle.add_channel()
+
+    live_sampler = Sampler(10000, enabled = True)
+    live_sampler.add_signal(x_handle, "x")
+    live_sampler.add_signal(y_handle, "y")
+
+    trigger = TriggerRecorder(x_handle, Threshold(0.5), live_sampler, pre = 0.1, post = 0.2, callback = events.append)
+    trigger.arm()
+    return group_handle, trigger
+
+
+def test_trigger_window_in_one_block():
+    # One block of 1000 samples at 1 kHz holds the trigger (t = 0.3) and the whole post window
+    events = []
+    group_handle, trigger = _recorder(events)
+
+    t = np.arange(1000) * 1e-3
+    x = (t >= 0.3).astype(np.double)
+    group_handle.commit_block(t, np.vstack((x, 2 * t)))
+    assert len(events) == 0
+
+    trigger.drain()
+    assert len(events) == 1
+    assert events[0]["time"] == t[300]
+
+    names, datas, metadatas = events[0]["snapshot"]
+    assert names == ["x", "y"]
+    for data in datas:
+        np.testing.assert_array_equal(data[0], t[200:500])
+    np.testing.assert_array_equal(datas[1][1], 2 * t[200:500])
+
+
+def test_trigger_captured_by_next_block():
+    events = []
+    group_handle, trigger = _recorder(events)
+
+    t = np.arange(1000) * 1e-3
+    group_handle.commit_block(t, np.vstack(((t >= 0.3).astype(np.double), t)))
+    group_handle.commit_block(t + 1.0, np.zeros((2, 1000)))
+    assert len(events) == 1
+    assert all(data.shape == (2, 300) for data in events[0]["snapshot"][1])
@@ -0,0 +1,180 @@
+import os
+import time
+from collections import deque
+from datetime import datetime
+import numpy as np
+
+from .recording import SaveThread
+from .stats import registry
+
+
+# # # # # # # # # #
+# Conditions
+# # # # # # # # # #
+class Condition():
+    # Evaluated on every (2, N) block of the trigger signal, find returns the index of the
+    # first sample that fires (or None). State carried between blocks is dropped by reset.
+
+    def find(self, t, y):
+        raise NotImplementedError
+
+    def reset(self):
+        pass
+
+    def _first(self, mask):
+        index = np.argmax(mask)
+        return int(index) if mask[index] else None
+
+
+class Threshold(Condition):
+    # Fires on the first sample above (or below) level
+
+    def __init__(self, level, above = True):
+        self.level = level
+        self.above = above
+
+    def find(self, t, y):
+        return self._first(y > self.level if self.above else y < self.level)
+
+
+class Edge(Condition):
+    # Fires where the signal crosses level (rising, falling or both), also across block boundaries
+
+    def __init__(self, level, rising = True, falling = False):
+        self.level = level
+        self.rising = rising
+        self.falling = falling
+        self.reset()
+
+    def reset(self):
+        self._previous = np.nan
+
+    def find(self, t, y):
+        above = np.concatenate(([self._previous], y)) > self.level
+        valid = ~np.isnan(np.concatenate(([self._previous], y)))
+        self._previous = y[-1]
+
+        mask = np.zeros(len(y), dtype = bool)
+        if (self.rising):
+            mask |= above[1:] & ~above[:-1]
+        if (self.falling):
+            mask |= ~above[1:] & above[:-1]
+        return self._first(mask & valid[1:] & valid[:-1])
+
+
+class Expression(Condition):
+    # func(t, y) returns a boolean array, e.g. lambda t, y: np.abs(y) > 3 * np.std(y).
+    # Conditions on several signals are expressed by triggering on a dsp stage combining them.
+
+    def __init__(self, func):
+        self.func = func
+
+    def find(self, t, y):
+        return self._first(np.asarray(self.func(t, y), dtype = bool))
+
+
+# # # # # # # # # #
+# Triggered recording
+# # # # # # # # # #
+class TriggerRecorder():
+    # Captures events instead of whole recordings: while armed, condition is evaluated on every block
+    # committed to trigger_handle. When it fires at time t, the window t - pre .. t + post of every signal
+    # of the live sampler is copied once the commit completing the post trigger part has reached every
+    # signal (drain, or the next block of the trigger signal), so pre + post must fit in the live buffer.
+    # Events are kept in memory (the last keep_events), written to folder when given (one file per event,
+    # on a SaveThread) and passed to callback(event).
+
+    def __init__(self, trigger_handle, condition, live_sampler, pre = 1.0, post = 1.0, folder = None, extension = ".npz", callback = None, keep_events = 10):
+        self.condition = condition
+        self.live_sampler = live_sampler
+        self.pre = pre
+        self.post = post
+        self.folder = folder
+        self.extension = extension
+        self.callback = callback
+
+        self.events = deque(maxlen = keep_events)
+        self.event_count = 0
+        self.armed = False
+        self._trigger_time = None # set while waiting for the post trigger window
+        self._window_complete = False
+
+        trigger_handle.add_listener(self._data_callback, self._clear)
+
+    def arm(self):
+        self.condition.reset()
+        self.armed = True
+
+    def disarm(self):
+        # A pending event is captured with what is available
+        if (self._trigger_time is not None):
+            self._capture()
+        self.armed = False
+
+    def _data_callback(self, data):
+        if (not self.armed or data.shape[1] == 0):
+            return
+
+        if (self._trigger_time is not None):
+            # A block starting after the window comes from a later commit, the blocks of the other
+            # signals committed with the window end have been stored by then
+            if (data[0, 0] > self._trigger_time + self.post):
+                self._capture()
+                return
+        else:
+            index = self.condition.find(data[0, :], data[1, :])
+            if (index is None):
+                return
+            self._trigger_time = data[0, index]
+
+        # Never captured from the block completing the window, the other signals of the same commit
+        # (e.g. the other channels of a group) are only stored after it: drain or the next block captures
+        if (data[0, -1] > self._trigger_time + self.post):
+            self._window_complete = True
+
+    def drain(self):
+        # Called once a commit has reached every signal, captures a pending event whose window is complete
+        if (self._trigger_time is not None and self._window_complete):
+            self._capture()
+
+    def _capture(self):
+        t0 = self._trigger_time - self.pre
+        t1 = self._trigger_time + self.post
+
+        names = []
+        datas = []
+        metadatas = []
+        for signaldata in self.live_sampler.signaldatas:
+            data = signaldata.get_data()
+            i0, i1 = np.searchsorted(data[0, :], (t0, t1), side = "left")
+            names.append(signaldata.get_name())
+            datas.append(np.array(data[:, i0:i1]))
+            metadatas.append(dict(signaldata.get_metadata()))
+
+        event = {
+            "time": self._trigger_time,
+            "wallclock": time.time(),
+            "snapshot": (names, datas, metadatas),
+            "filename": None,
+        }
+        self._trigger_time = None
+        self._window_complete = False
+        self.condition.reset()
+
+        self.event_count += 1
+        registry.count("trigger_events")
+        self.events.append(event)
+
+        if (self.folder is not None):
+            if not os.path.exists(self.folder):
+                os.makedirs(self.folder)
+            event["filename"] = os.path.join(self.folder, "event" + datetime.now().strftime("_%Y%m%d_%H%M%S_%f") + self.extension)
+            SaveThread(event["snapshot"], event["filename"]).start()
+
+        if (self.callback is not None):
+            self.callback(event)
+
+    def _clear(self):
+        self._trigger_time = None
+        self._window_complete = False
+        self.condition.reset()